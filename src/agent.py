@@ -1,23 +1,107 @@
+import copy
 import json
 import sys
 import os
-from typing import Dict, Any, List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Tuple
 
 # Add src to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from knowledge_base import KnowledgeBase
-from matcher import PainPointMatcher
+from matcher import PainPointMatcher, PROFILED_STAGES as MATCHER_STAGES
+from cache import LRUCache
+from profiling import StageProfiler, instrument, uninstrument
+
+# Các field của business_context ảnh hưởng tới kết quả matching
+_CACHE_CONTEXT_FIELDS = ('industry', 'company_size', 'budget_constraints', 'urgency_level')
+
+# Stage -> method của agent được đo khi bật profiling; process_input là ranh giới một request
+AGENT_STAGES = {
+    'process_input': 'process_input',
+    'alternative_approaches': '_generate_alternative_approaches',
+    'next_steps': '_generate_next_steps'
+}
+
+# Agent riêng của mỗi worker process trong process_batch
+_worker_agent = None
+
+def _init_worker(features_file: str, agent_options: Dict[str, Any],
+                 feature_changes: Iterable[Dict[str, Any]] = ()) -> None:
+    """Khởi tạo agent một lần cho mỗi worker process; feature_changes là các lần
+    KnowledgeBase.apply_changes đã áp dụng ở process chính, được chạy lại theo thứ tự"""
+    global _worker_agent
+    # Worker chỉ matching nên không build index của search_features
+    _worker_agent = PainPointToSolutionAgent(knowledge_base=KnowledgeBase(features_file, search_index=False),
+                                             **agent_options)
+    for changes in feature_changes:
+        _worker_agent.knowledge_base.apply_changes(**changes)
+
+def _process_chunk(chunk: List[Tuple[int, Any]]) -> List[Tuple[int, Dict[str, Any]]]:
+    """Xử lý một chunk (index, input) trong worker process"""
+    return [(index, _worker_agent._process_isolated(input_data)) for index, input_data in chunk]
+
+def _process_item(input_data: Any) -> Dict[str, Any]:
+    """Xử lý một input trong worker process"""
+    return _worker_agent._process_isolated(input_data)
+
+def _error_result(message: str) -> Dict[str, Any]:
+    """Output lỗi cho một item, cùng format với process_input"""
+    return {
+        'error': message,
+        'suggested_solutions': [],
+        'confidence_score': 0.0
+    }
+
+class _InputError:
+    """Item đã lỗi trước khi tới agent (vd: dòng JSON sai), đi qua process_batch như một input
+    để kết quả lỗi giữ đúng vị trí mà không phải buffer riêng"""
+    __slots__ = ('message',)
+    
+    def __init__(self, message: str):
+        self.message = message
 
 class PainPointToSolutionAgent:
     """Main Agent class cho Pain Point to Solution matching"""
     
-    def __init__(self, features_file: str = "data/filum_features.json"):
-        self.knowledge_base = KnowledgeBase(features_file)
-        self.matcher = PainPointMatcher(self.knowledge_base)
+    def __init__(self, features_file: str = "data/filum_features.json", result_cache_size: int = 0,
+                 result_cache_ttl: Optional[float] = None, catalog_poll_interval: Optional[float] = None,
+                 knowledge_base: Optional[KnowledgeBase] = None, **matcher_options):
+        # knowledge_base: dùng KnowledgeBase đã load sẵn thay vì đọc features_file
+        if knowledge_base is not None:
+            features_file = knowledge_base.features_file
+        self.features_file = features_file
+        self.matcher_options = matcher_options
+        # Toàn bộ options để dựng lại agent tương đương (vd: trong worker process)
+        self.agent_options = dict(matcher_options, result_cache_size=result_cache_size,
+                                  result_cache_ttl=result_cache_ttl, catalog_poll_interval=catalog_poll_interval)
+        self.knowledge_base = knowledge_base if knowledge_base is not None else KnowledgeBase(features_file)
+        # Hot reload: poll features file mỗi catalog_poll_interval giây
+        if catalog_poll_interval:
+            self.knowledge_base.start_watching(catalog_poll_interval)
+        # matcher_options được chuyển thẳng cho PainPointMatcher (vd: scoring_mode='bm25')
+        self.matcher = PainPointMatcher(self.knowledge_base, **matcher_options)
+        
+        # Cache kết quả process_input theo input đã chuẩn hoá (size 0 = tắt)
+        self.result_cache = LRUCache(result_cache_size, ttl=result_cache_ttl) if result_cache_size > 0 else None
+        self._result_cache_version = self.knowledge_base.version
+        
+        # Profiling theo stage, tắt mặc định (xem enable_profiling)
+        self.profiler: Optional[StageProfiler] = None
+        self.profiling_enabled = False
+    
+    def _worker_initargs(self) -> Tuple[str, Dict[str, Any], Tuple[Dict[str, Any], ...]]:
+        """initargs của _init_worker để worker process có cùng options và catalog (kể cả các
+        thay đổi apply_changes chỉ nằm trong bộ nhớ của process này)"""
+        return self.features_file, self.agent_options, self.knowledge_base.applied_changes
     
     def process_input(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Xử lý input và trả về output"""
+        if not isinstance(input_data, dict):
+            return _error_result('Input must be a JSON object')
+        
         pain_point = input_data.get('pain_point', '')
         business_context = input_data.get('business_context', {})
         
@@ -28,6 +112,31 @@ class PainPointToSolutionAgent:
                 'confidence_score': 0.0
             }
         
+        if self.result_cache is None:
+            return self._match(pain_point, business_context)
+        
+        # Catalog đã thay đổi thì toàn bộ kết quả cũ không còn đúng
+        if self._result_cache_version != self.knowledge_base.version:
+            self.result_cache.clear()
+            self._result_cache_version = self.knowledge_base.version
+        
+        key = self._result_cache_key(pain_point, business_context)
+        result = self.result_cache.get(key)
+        if result is None:
+            result = self._match(pain_point, business_context)
+            self.result_cache.put(key, result)
+        # Trả bản copy để caller sửa output không làm hỏng cache
+        return copy.deepcopy(result)
+    
+    def _result_cache_key(self, pain_point: str, business_context: Dict[str, Any]) -> Tuple:
+        """Key của result cache: keywords của pain point (đã bỏ case, punctuation, stop words)
+        cùng các field business context mà matcher dùng"""
+        business_context = business_context or {}
+        context_values = tuple(str(business_context.get(field, '')).lower() for field in _CACHE_CONTEXT_FIELDS)
+        return (self.knowledge_base.version, ' '.join(self.matcher.extract_keywords(pain_point))) + context_values
+    
+    def _match(self, pain_point: str, business_context: Dict[str, Any]) -> Dict[str, Any]:
+        """Chạy matching đầy đủ cho một pain point"""
         # Tìm solutions
         solutions = self.matcher.find_solutions(pain_point, business_context)
         
@@ -47,6 +156,66 @@ class PainPointToSolutionAgent:
             'next_steps': next_steps
         }
     
+    def _process_isolated(self, input_data: Any) -> Dict[str, Any]:
+        """process_input nhưng bắt exception để lỗi của một item không làm hỏng cả batch"""
+        if isinstance(input_data, _InputError):
+            return _error_result(input_data.message)
+        try:
+            return self.process_input(input_data)
+        except Exception as e:
+            return _error_result(f"{type(e).__name__}: {e}")
+    
+    def process_batch(self, inputs: Iterable[Dict[str, Any]], max_workers: Optional[int] = None,
+                      chunksize: int = 16, ordered: bool = True) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Xử lý nhiều inputs song song bằng process pool, yield (index, result).
+        
+        ordered=True trả kết quả theo thứ tự input, ordered=False trả theo thứ tự hoàn thành.
+        Inputs được đọc lazy, mỗi lúc chỉ giữ tối đa 2 * max_workers chunks đang xử lý.
+        Lỗi của từng item được trả về dạng {'error': ...} thay vì raise.
+        max_workers=1 chạy tuần tự trong process hiện tại."""
+        if chunksize < 1:
+            raise ValueError("chunksize must be >= 1")
+        max_workers = max_workers or os.cpu_count() or 1
+        indexed_inputs = enumerate(inputs)
+        
+        if max_workers == 1:
+            for index, input_data in indexed_inputs:
+                yield index, self._process_isolated(input_data)
+            return
+        
+        def next_chunk() -> List[Tuple[int, Any]]:
+            return list(islice(indexed_inputs, chunksize))
+        
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=self._worker_initargs()) as executor:
+            pending = deque()
+            
+            def submit_until_full() -> None:
+                while len(pending) < 2 * max_workers:
+                    chunk = next_chunk()
+                    if not chunk:
+                        return
+                    pending.append((executor.submit(_process_chunk, chunk), chunk))
+            
+            def chunk_results(future, chunk) -> List[Tuple[int, Dict[str, Any]]]:
+                try:
+                    return future.result()
+                except Exception as e:
+                    # Worker chết (vd: BrokenProcessPool) thì chỉ các items của chunk đó bị lỗi
+                    return [(index, _error_result(f"{type(e).__name__}: {e}")) for index, _ in chunk]
+            
+            submit_until_full()
+            while pending:
+                if ordered:
+                    future, chunk = pending.popleft()
+                    yield from chunk_results(future, chunk)
+                else:
+                    done, _ = wait([future for future, _ in pending], return_when=FIRST_COMPLETED)
+                    for item in [item for item in pending if item[0] in done]:
+                        pending.remove(item)
+                        yield from chunk_results(*item)
+                submit_until_full()
+    
     def _generate_alternative_approaches(self, pain_point: str) -> List[str]:
         """Tạo alternative approaches"""
         alternatives = [
@@ -83,6 +252,47 @@ class PainPointToSolutionAgent:
         """Lấy thống kê về features"""
         return self.knowledge_base.get_feature_statistics()
     
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Thống kê result cache và similarity caches của matcher"""
+        stats = {'result': self.result_cache.stats() if self.result_cache is not None else None}
+        stats.update(self.matcher.get_cache_stats())
+        return stats
+    
+    def clear_result_cache(self) -> None:
+        """Xoá result cache"""
+        if self.result_cache is not None:
+            self.result_cache.clear()
+    
+    def enable_profiling(self) -> None:
+        """Bật đo thời gian theo stage (keyword/semantic/context/feasibility, dựng response...)"""
+        if self.profiling_enabled:
+            return
+        if self.profiler is None:
+            self.profiler = StageProfiler()
+        instrument(self.matcher, MATCHER_STAGES, self.profiler)
+        instrument(self, AGENT_STAGES, self.profiler, request_stage='process_input')
+        self.profiling_enabled = True
+    
+    def disable_profiling(self) -> None:
+        """Tắt profiling; số liệu đã thu thập vẫn được giữ"""
+        if not self.profiling_enabled:
+            return
+        uninstrument(self.matcher, MATCHER_STAGES)
+        uninstrument(self, AGENT_STAGES)
+        self.profiling_enabled = False
+    
+    def get_profile(self) -> Dict[str, Any]:
+        """Thời gian và số lần gọi theo stage: cộng dồn mọi request và của request gần nhất"""
+        report = self.profiler.report() if self.profiler is not None else \
+            {'requests': 0, 'stages': {}, 'last_request': {}}
+        report['enabled'] = self.profiling_enabled
+        return report
+    
+    def reset_profile(self) -> None:
+        """Xoá số liệu profiling"""
+        if self.profiler is not None:
+            self.profiler.reset()
+    
     def demo_matching(self, pain_point: str, business_context: Dict[str, Any] = None) -> None:
         """Demo matching process"""
         print(f"\n{'='*60}")
@@ -0,0 +1,343 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # resource chỉ có trên Unix
+    resource = None
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent import PainPointToSolutionAgent
+from compiled_catalog import write_compiled_catalog
+from knowledge_base import KnowledgeBase
+from lsh import DEFAULT_LSH_BANDS, DEFAULT_LSH_ROWS
+from matcher import SCORING_MODES, SEMANTIC_MODES, CANDIDATE_MODES
+from similarity import DEFAULT_SIMILARITY_BACKEND, SIMILARITY_BACKENDS
+
+BENCHMARK_FORMAT_VERSION = 1
+
+# Giá trị business context mà matcher hiểu (xem PainPointMatcher._context_score/_feasibility_score)
+INDUSTRIES = ('e-commerce', 'retail', 'saas', 'healthcare', 'banking', 'telecom',
+              'education', 'travel', 'insurance', 'logistics')
+COMPANY_SIZES = ('small', 'medium', 'large')
+BUDGETS = ('low', 'moderate', 'high', 'flexible')
+URGENCY_LEVELS = ('low', 'medium', 'high')
+
+# Vốn từ cố định để catalog sinh ra không phụ thuộc data/filum_features.json
+CATEGORIES = {
+    'AI Customer Service': ('AI Inbox', 'Tickets', 'Chatbot', 'Knowledge Base'),
+    'Voice of Customer': ('Surveys', 'Conversations', 'Reviews', 'Conversations/Surveys'),
+    'Insights': ('Experience', 'Journeys', 'Analytics', 'Reporting'),
+    'Customer 360': ('Customers', 'Segments', 'Profiles'),
+}
+COMPLEXITIES = ('low', 'medium', 'high')
+TIME_TO_VALUE = ('1-2 weeks', '2-4 weeks', '3-4 weeks', '4-6 weeks', '6-8 weeks', '2-3 months')
+_SUBJECTS = ('customers', 'support agents', 'our team', 'managers', 'analysts', 'new users',
+             'store staff', 'account managers', 'product owners', 'call center agents')
+_PROBLEMS = ('wait too long for', 'cannot keep up with', 'struggle to analyze', 'have no visibility into',
+             'manually process', 'complain about', 'lose track of', 'cannot prioritize',
+             'spend hours on', 'get frustrated by')
+_OBJECTS = ('support tickets', 'survey responses', 'response times', 'customer feedback', 'repetitive questions',
+            'chat conversations', 'customer journeys', 'churn signals', 'product reviews', 'email inquiries',
+            'satisfaction scores', 'escalations', 'customer data', 'service requests', 'touchpoints')
+_CAPABILITIES = ('automated routing', 'sentiment analysis', 'topic extraction', 'real-time dashboards',
+                 'multi-channel deployment', 'SLA tracking', 'journey mapping', 'AI suggested replies',
+                 'single customer view', 'trend alerts')
+_INTEGRATIONS = ('Existing support system', 'CRM integration', 'Customer database', 'Feedback data sources',
+                 'Website widget', 'Data warehouse')
+_METRICS = ('Reduced ticket volume by {n}%', 'Improved customer satisfaction by {n}%',
+            'Reduced analysis time by {n}%', 'Increased response rates by {n}%',
+            'Reduced resolution time by {n}%')
+_FILLERS = ('We notice that', 'Right now', 'Every week', 'Lately', 'As we grow,')
+_SYLLABLES = ('ka', 'lo', 'mi', 'ren', 'tor', 'vex', 'sul', 'dai', 'qua', 'nor', 'pel', 'zin', 'fa', 'gro')
+
+
+def _synthetic_word(rng: random.Random) -> str:
+    return ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def generate_catalog(num_features: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Sinh catalog tổng hợp theo schema của filum_features.json (deterministic theo seed).
+    Vốn từ riêng (jargon) tăng theo căn bậc hai số features để index có độ thưa thực tế"""
+    rng = random.Random(seed)
+    jargon = list(dict.fromkeys(_synthetic_word(rng) for _ in range(max(50, int(20 * math.sqrt(num_features))))))
+
+    features = []
+    for index in range(num_features):
+        category = rng.choice(list(CATEGORIES))
+        objects = rng.sample(_OBJECTS, 3)
+        terms = rng.sample(jargon, 3)
+        pain_points = [f"{rng.choice(_SUBJECTS).capitalize()} {rng.choice(_PROBLEMS)} {rng.choice(objects)}"
+                       + (f" in {rng.choice(terms)}" if rng.random() < 0.5 else '')
+                       for _ in range(rng.randint(3, 6))]
+        features.append({
+            'feature_id': f"synthetic_{index:06d}",
+            'feature_name': f"{terms[0].capitalize()} {objects[0].title()} {rng.choice(('Assistant', 'Hub', 'Analyzer', 'Manager'))}",
+            'category': category,
+            'subcategory': rng.choice(CATEGORIES[category]),
+            'description': f"Helps teams handle {objects[0]} and {objects[1]} with {rng.choice(_CAPABILITIES)}",
+            'key_capabilities': rng.sample(_CAPABILITIES, rng.randint(3, 5)),
+            'pain_points_addressed': pain_points,
+            'keywords': list(dict.fromkeys(objects + terms + [rng.choice(_OBJECTS).split()[-1]])),
+            'use_cases': [f"{industry.capitalize()} customer support" for industry in rng.sample(INDUSTRIES, 2)],
+            'implementation_complexity': rng.choice(COMPLEXITIES),
+            'time_to_value': rng.choice(TIME_TO_VALUE),
+            'integration_requirements': rng.sample(_INTEGRATIONS, 2),
+            'success_metrics': [metric.format(n=rng.randint(10, 80)) for metric in rng.sample(_METRICS, 2)]
+        })
+    return features
+
+
+def generate_queries(catalog: Sequence[Dict[str, Any]], num_queries: int,
+                     seed: int = 0) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Sinh inputs cho process_input từ pain points của catalog (có nhiễu) kèm feature_id đích"""
+    rng = random.Random(seed)
+    inputs, targets = [], []
+    for _ in range(num_queries):
+        feature = rng.choice(catalog)
+        words = rng.choice(feature['pain_points_addressed']).split()
+        # Bỏ ngẫu nhiên một số từ và thêm câu dẫn để query không trùng khớp tuyệt đối
+        words = [word for word in words if rng.random() > 0.2] or words
+        pain_point = ' '.join(words)
+        if rng.random() < 0.5:
+            pain_point = f"{rng.choice(_FILLERS)} {pain_point[0].lower()}{pain_point[1:]}"
+        inputs.append({
+            'pain_point': pain_point,
+            'business_context': {
+                'industry': rng.choice(INDUSTRIES),
+                'company_size': rng.choice(COMPANY_SIZES),
+                'budget_constraints': rng.choice(BUDGETS),
+                'urgency_level': rng.choice(URGENCY_LEVELS)
+            }
+        })
+        targets.append(feature['feature_id'])
+    return inputs, targets
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Percentile (0..100) với nội suy tuyến tính, sorted_values đã sắp xếp"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, float]:
+    """Thống kê latency (giây) -> milliseconds"""
+    values = sorted(sample * 1000.0 for sample in samples)
+    return {
+        'mean': sum(values) / len(values) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else 0.0
+    }
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss tính bằng KB trên Linux, bytes trên macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def benchmark_catalog(num_features: int, num_queries: int = 200, seed: int = 0, compiled: bool = False,
+                      measure_memory: bool = True, profile_stages: bool = False, **agent_options) -> Dict[str, Any]:
+    """Benchmark một kích thước catalog: startup, latency find_solutions/process_input,
+    throughput, peak memory và tỉ lệ feature đích nằm trong top 3.
+    profile_stages=True chạy thêm một pass có profiling để lấy thời gian theo stage"""
+    catalog = generate_catalog(num_features, seed)
+    inputs, targets = generate_queries(catalog, num_queries, seed + 1)
+    target_names = {feature['feature_id']: feature['feature_name'] for feature in catalog}
+
+    with tempfile.TemporaryDirectory() as directory:
+        features_file = os.path.join(directory, 'features.json')
+        with open(features_file, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f)
+        if compiled:
+            compiled_file = os.path.join(directory, 'features.snap')
+            write_compiled_catalog(KnowledgeBase(features_file).snapshot, compiled_file)
+            features_file = compiled_file
+
+        start = time.perf_counter()
+        agent = PainPointToSolutionAgent(features_file, **agent_options)
+        startup = time.perf_counter() - start
+
+        # Mỗi pass bắt đầu với cache rỗng để số đo không phụ thuộc thứ tự chạy
+        find_times = []
+        agent.matcher.clear_caches()
+        for input_data in inputs:
+            start = time.perf_counter()
+            agent.matcher.find_solutions(input_data['pain_point'], input_data['business_context'])
+            find_times.append(time.perf_counter() - start)
+
+        process_times = []
+        hits = 0
+        agent.matcher.clear_caches()
+        agent.clear_result_cache()
+        for input_data, target in zip(inputs, targets):
+            start = time.perf_counter()
+            result = agent.process_input(input_data)
+            process_times.append(time.perf_counter() - start)
+            hits += any(solution['feature_name'] == target_names[target]
+                        for solution in result['suggested_solutions'])
+
+        stages = None
+        if profile_stages:
+            agent.matcher.clear_caches()
+            agent.clear_result_cache()
+            agent.enable_profiling()
+            for input_data in inputs:
+                agent.process_input(input_data)
+            agent.disable_profiling()
+            stages = agent.get_profile()['stages']
+
+        peak_memory = None
+        if measure_memory:
+            # Chạy riêng vì tracemalloc làm chậm đáng kể các phép đo thời gian
+            tracemalloc.start()
+            try:
+                memory_agent = PainPointToSolutionAgent(features_file, **agent_options)
+                for input_data in inputs[:50]:
+                    memory_agent.process_input(input_data)
+                peak_memory = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            finally:
+                tracemalloc.stop()
+
+    total_time = sum(process_times)
+    result = {
+        'num_features': num_features,
+        'num_queries': num_queries,
+        'startup_seconds': startup,
+        'find_solutions_ms': latency_summary(find_times),
+        'process_input_ms': latency_summary(process_times),
+        'throughput_qps': num_queries / total_time if total_time else 0.0,
+        'peak_memory_mb': peak_memory,
+        'recall_at_3': hits / num_queries if num_queries else 0.0
+    }
+    if stages is not None:
+        result['stages'] = stages
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=5,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def run_benchmark(sizes: Sequence[int], num_queries: int = 200, seed: int = 0, compiled: bool = False,
+                  measure_memory: bool = True, profile_stages: bool = False, progress=None,
+                  **agent_options) -> Dict[str, Any]:
+    """Chạy benchmark cho nhiều kích thước catalog, trả về kết quả dạng JSON-serializable"""
+    results = []
+    for num_features in sizes:
+        result = benchmark_catalog(num_features, num_queries, seed, compiled, measure_memory, profile_stages,
+                                   **agent_options)
+        results.append(result)
+        if progress is not None:
+            progress(result)
+
+    return {
+        'format_version': BENCHMARK_FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': dict(agent_options, num_queries=num_queries, seed=seed, compiled=compiled),
+        'max_rss_mb': _max_rss_mb(),
+        'results': results
+    }
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """So sánh với kết quả benchmark trước theo từng kích thước catalog (ratio = current / baseline)"""
+    baseline_by_size = {result['num_features']: result for result in baseline.get('results', [])}
+    metrics = (('startup_seconds',), ('process_input_ms', 'p50'), ('process_input_ms', 'p95'),
+               ('throughput_qps',), ('peak_memory_mb',))
+    rows = []
+    for result in current['results']:
+        previous = baseline_by_size.get(result['num_features'])
+        if previous is None:
+            continue
+        for path in metrics:
+            old, new = previous, result
+            for key in path:
+                old, new = old.get(key) if old else None, new.get(key) if new else None
+            if old and new is not None:
+                rows.append({'num_features': result['num_features'], 'metric': '.'.join(path),
+                             'baseline': old, 'current': new, 'ratio': new / old})
+    return rows
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    latency = result['process_input_ms']
+    memory = f"{result['peak_memory_mb']:.1f}MB" if result['peak_memory_mb'] is not None else 'n/a'
+    print(f"{result['num_features']:>7} features: startup {result['startup_seconds']:.3f}s, "
+          f"p50 {latency['p50']:.2f}ms, p95 {latency['p95']:.2f}ms, {result['throughput_qps']:.1f} q/s, "
+          f"peak {memory}, recall@3 {result['recall_at_3']:.2f}", file=sys.stderr)
+
+
+def main(argv=None):
+    """Benchmark matcher trên catalog tổng hợp, ghi kết quả JSON"""
+    parser = argparse.ArgumentParser(description="Pain Point to Solution Agent - benchmark")
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help='Danh sách số features, cách nhau bởi dấu phẩy (vd: 10,1000,100000)')
+    parser.add_argument('--queries', type=int, default=200, help='Số queries mỗi kích thước')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scoring-mode', default='fuzzy', choices=SCORING_MODES)
+    parser.add_argument('--similarity-backend', default=DEFAULT_SIMILARITY_BACKEND, choices=list(SIMILARITY_BACKENDS))
+    parser.add_argument('--semantic-mode', default='fuzzy', choices=SEMANTIC_MODES)
+    parser.add_argument('--candidate-mode', default='all', choices=CANDIDATE_MODES)
+    parser.add_argument('--lsh-bands', type=int, default=DEFAULT_LSH_BANDS)
+    parser.add_argument('--lsh-rows', type=int, default=DEFAULT_LSH_ROWS)
+    parser.add_argument('--compiled', action='store_true', help='Load catalog từ snapshot đã compile')
+    parser.add_argument('--no-memory', action='store_true', help='Bỏ qua đo peak memory (tracemalloc)')
+    parser.add_argument('--profile-stages', action='store_true', help='Thêm thời gian theo stage của pipeline')
+    parser.add_argument('--output', '-o', default='-', help="File JSON kết quả, '-' = stdout")
+    parser.add_argument('--compare', default=None, metavar='BASELINE', help='So sánh với file kết quả trước')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    report = run_benchmark(sizes, args.queries, args.seed, args.compiled, not args.no_memory, args.profile_stages,
+                           progress=_print_result, scoring_mode=args.scoring_mode,
+                           similarity_backend=args.similarity_backend, semantic_mode=args.semantic_mode,
+                           candidate_mode=args.candidate_mode, lsh_bands=args.lsh_bands, lsh_rows=args.lsh_rows)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report['comparison'] = compare_results(json.load(f), report)
+        for row in report['comparison']:
+            print(f"{row['num_features']:>7} {row['metric']:<20} {row['baseline']:.4g} -> {row['current']:.4g} "
+                  f"(x{row['ratio']:.2f})", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+
+if __name__ == "__main__":
+    main()
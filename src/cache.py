@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Cache LRU có giới hạn kích thước, đếm hits/misses/evictions.
+    ttl (giây) tuỳ chọn: entry quá hạn được coi như miss và bị xoá"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._expires_at: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Lấy value theo key, đánh dấu là vừa được dùng"""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING and self.ttl is not None and self._expires_at[key] <= self._clock():
+                del self._data[key]
+                del self._expires_at[key]
+                self.expirations += 1
+                value = _MISSING
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Lưu value, loại bỏ entry ít dùng nhất nếu vượt maxsize"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.ttl is not None:
+                self._expires_at[key] = self._clock() + self.ttl
+            while len(self._data) > self.maxsize:
+                evicted_key, _ = self._data.popitem(last=False)
+                self._expires_at.pop(evicted_key, None)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Lấy value từ cache, nếu chưa có thì tính bằng compute() và lưu lại"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Xoá toàn bộ entries (giữ nguyên counters)"""
+        with self._lock:
+            self._data.clear()
+            self._expires_at.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê cache"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+class LRUPairCache:
+    """Cache LRU của function(a, b) theo cặp (a, b) cho vòng lặp trong (similarity theo cặp).
+    Dùng functools.lru_cache (implement bằng C, thread-safe) nên mỗi lần hit không phải lấy lock
+    và move_to_end ở Python. Gọi qua lookup(a, b); counters lấy từ cache_info()"""
+
+    def __init__(self, function: Callable[[str, str], Any], maxsize: int = 1024):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.lookup = lru_cache(maxsize=maxsize)(function)
+
+    def __len__(self) -> int:
+        return self.lookup.cache_info().currsize
+
+    def clear(self) -> None:
+        """Xoá toàn bộ entries (lru_cache reset cả counters)"""
+        self.lookup.cache_clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê cache, cùng format với LRUCache.stats"""
+        info = self.lookup.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'size': info.currsize,
+            'maxsize': self.maxsize,
+            'hits': info.hits,
+            'misses': info.misses,
+            # Mỗi miss thêm một entry nên entries không còn trong cache là đã bị loại
+            'evictions': max(info.misses - info.currsize, 0),
+            'expirations': 0,
+            'hit_rate': info.hits / lookups if lookups else 0.0
+        }
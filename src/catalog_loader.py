@@ -0,0 +1,231 @@
+import json
+import re
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+# Schema feature theo design_document.md
+REQUIRED_FIELDS = ('feature_id', 'feature_name')
+STRING_FIELDS = ('feature_id', 'feature_name', 'category', 'subcategory', 'description',
+                 'implementation_complexity', 'time_to_value')
+LIST_FIELDS = ('key_capabilities', 'pain_points_addressed', 'keywords', 'use_cases',
+               'integration_requirements', 'success_metrics')
+
+CHUNK_SIZE = 64 * 1024
+MAX_ENTRY_SIZE = 16 * 1024 * 1024
+
+_WHITESPACE = re.compile(r'\s*')
+# Ký tự có ý nghĩa cấu trúc khi quét một phần tử JSON
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_BODY = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR_END = re.compile(r'[,\]]')
+_DECODER = json.JSONDecoder()
+
+
+class CatalogFormatError(Exception):
+    """Catalog không parse tiếp được (sai cấu trúc ở mức file)"""
+
+
+def validate_feature(feature: Any) -> List[str]:
+    """Kiểm tra một feature theo schema trong design document, trả về danh sách lỗi"""
+    if not isinstance(feature, dict):
+        return [f"Feature must be an object, got {type(feature).__name__}"]
+
+    errors = []
+    for field in REQUIRED_FIELDS:
+        if not feature.get(field):
+            errors.append(f"Missing required field '{field}'")
+    for field in STRING_FIELDS:
+        if field in feature and not isinstance(feature[field], str):
+            errors.append(f"Field '{field}' must be a string")
+    for field in LIST_FIELDS:
+        if field in feature:
+            value = feature[field]
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                errors.append(f"Field '{field}' must be a list of strings")
+    return errors
+
+
+class CatalogLoadReport:
+    """Kết quả load catalog: số features hợp lệ và các entries bị loại"""
+
+    def __init__(self, source: str, max_reported: int = 100):
+        self.source = source
+        self.max_reported = max_reported
+        self.loaded = 0
+        self.malformed_count = 0
+        self.malformed: List[Dict[str, Any]] = []
+        self.fatal_error: Optional[str] = None
+
+    def add_malformed(self, entry: int, errors: List[str], feature_id: Any = None) -> None:
+        self.malformed_count += 1
+        if len(self.malformed) < self.max_reported:
+            self.malformed.append({'entry': entry, 'feature_id': feature_id, 'errors': errors})
+
+    @property
+    def ok(self) -> bool:
+        return self.fatal_error is None and self.malformed_count == 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'source': self.source,
+            'loaded': self.loaded,
+            'malformed_count': self.malformed_count,
+            'malformed': self.malformed,
+            'fatal_error': self.fatal_error
+        }
+
+
+class _ChunkReader:
+    """Buffer text đọc dần theo chunk, bỏ phần đã xử lý để giới hạn bộ nhớ"""
+
+    def __init__(self, stream: IO[str]):
+        self.stream = stream
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> int:
+        """Đọc thêm một chunk và bỏ phần trước pos.
+        Trả về số ký tự đã bỏ (để caller dịch các vị trí), -1 nếu đã hết file"""
+        if self.eof:
+            return -1
+        chunk = self.stream.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return -1
+        shift = self.pos
+        self.buffer = self.buffer[shift:] + chunk
+        self.pos = 0
+        return shift
+
+    def peek(self) -> str:
+        """Ký tự khác whitespace tiếp theo ('' nếu hết file)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.fill() < 0:
+                return ''
+
+    def scan_element(self) -> str:
+        """Trả về text của phần tử JSON bắt đầu tại pos (object/array theo độ sâu ngoặc,
+        scalar đến dấu ',' hoặc ']' kế tiếp) và dịch pos qua phần tử đó"""
+        if self.buffer[self.pos] not in '{[':
+            while True:
+                match = _SCALAR_END.search(self.buffer, self.pos)
+                if match is not None or self.fill() < 0:
+                    end = match.start() if match is not None else len(self.buffer)
+                    text, self.pos = self.buffer[self.pos:end], end
+                    return text
+
+        depth = 0
+        scan = self.pos
+        while True:
+            match = _STRUCTURAL.search(self.buffer, scan)
+            if match is not None and match.group() == '"':
+                body = _STRING_BODY.match(self.buffer, match.end())
+                if body is not None:
+                    scan = body.end()
+                    continue
+                # String chưa đọc hết: đọc thêm rồi quét lại từ dấu nháy mở
+                scan = match.start()
+                match = None
+            if match is None:
+                if len(self.buffer) - self.pos > MAX_ENTRY_SIZE:
+                    raise CatalogFormatError(f"Entry larger than {MAX_ENTRY_SIZE} characters")
+                shift = self.fill()
+                if shift < 0:
+                    raise CatalogFormatError("Unexpected end of file inside an entry")
+                scan -= shift
+                continue
+
+            depth += 1 if match.group() in '{[' else -1
+            scan = match.end()
+            if depth == 0:
+                text, self.pos = self.buffer[self.pos:scan], scan
+                return text
+
+
+def _iter_json_array(stream: IO[str], report: CatalogLoadReport) -> Iterator[Tuple[int, Any]]:
+    """Parse từng phần tử của JSON array, yield (số thứ tự entry, value)"""
+    reader = _ChunkReader(stream)
+    if reader.peek() != '[':
+        raise CatalogFormatError("Catalog must be a JSON array or JSON Lines")
+    reader.pos += 1
+
+    entry = 0
+    while True:
+        char = reader.peek()
+        if char == ']':
+            return
+        if char == '':
+            raise CatalogFormatError("Unexpected end of file, missing ']'")
+        if char == ',':
+            reader.pos += 1
+            continue
+
+        entry += 1
+        # Đường nhanh: decode trực tiếp trên buffer. Chỉ khi phần tử bị cắt ở cuối chunk
+        # (hoặc sai cú pháp) mới quét cấu trúc để tìm ranh giới phần tử
+        try:
+            value, end = _DECODER.raw_decode(reader.buffer, reader.pos)
+        except json.JSONDecodeError:
+            end = len(reader.buffer)
+        if end < len(reader.buffer):
+            reader.pos = end
+            yield entry, value
+        else:
+            text = reader.scan_element()
+            try:
+                yield entry, json.loads(text)
+            except json.JSONDecodeError as e:
+                report.add_malformed(entry, [f"Invalid JSON: {e.msg}"])
+
+        char = reader.peek()
+        if char == '':
+            raise CatalogFormatError("Unexpected end of file, missing ']'")
+        if char not in (',', ']'):
+            raise CatalogFormatError(f"Expected ',' or ']' after entry {entry}")
+
+
+def _iter_json_lines(stream: IO[str], report: CatalogLoadReport) -> Iterator[Tuple[int, Any]]:
+    """Parse catalog JSON Lines, mỗi dòng một feature"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            report.add_malformed(line_number, [f"Invalid JSON: {e.msg}"])
+
+
+def iter_catalog(path: str, report: CatalogLoadReport) -> Iterator[Dict[str, Any]]:
+    """Stream các features hợp lệ từ catalog (JSON array hoặc JSON Lines).
+    Entries sai schema hoặc trùng feature_id bị bỏ qua và ghi vào report;
+    lỗi cấu trúc file được ghi vào report.fatal_error và dừng parse"""
+    with open(path, 'r', encoding='utf-8') as stream:
+        # Ký tự đầu tiên quyết định format: '[' là JSON array, còn lại là JSON Lines
+        first_char = ''
+        while not first_char:
+            chunk = stream.read(1)
+            if not chunk:
+                return
+            first_char = chunk.strip()
+        stream.seek(0)
+        parse = _iter_json_array if first_char == '[' else _iter_json_lines
+
+        seen_ids = set()
+        try:
+            for entry, feature in parse(stream, report):
+                errors = validate_feature(feature)
+                feature_id = feature.get('feature_id') if isinstance(feature, dict) else None
+                if not errors and feature_id in seen_ids:
+                    errors = [f"Duplicate feature_id '{feature_id}'"]
+                if errors:
+                    report.add_malformed(entry, errors, feature_id)
+                    continue
+                seen_ids.add(feature_id)
+                report.loaded += 1
+                yield feature
+        except CatalogFormatError as e:
+            report.fatal_error = str(e)
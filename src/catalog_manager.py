@@ -0,0 +1,339 @@
+import hashlib
+import json
+import sys
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from agent import PainPointToSolutionAgent
+from knowledge_base import CatalogSnapshot, FeatureRecord, KnowledgeBase
+
+
+def _intern(value: Any) -> Any:
+    """Copy JSON value với mọi string (kể cả key) được intern"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {sys.intern(key) if isinstance(key, str) else key: _intern(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_intern(item) for item in value]
+    return value
+
+
+def estimate_size(value: Any, seen: Optional[set] = None) -> int:
+    """Ước lượng số bytes của value và các object nó tham chiếu (mỗi object tính một lần)"""
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif isinstance(item, FeatureRecord):
+            stack.extend(getattr(item, slot) for slot in FeatureRecord.__slots__
+                         if slot not in ('context_scores', 'feasibility_scores'))
+    return total
+
+
+class FeaturePool:
+    """Pool FeatureRecord dùng chung giữa các tenants: feature giống hệt nhau ở nhiều catalog
+    chỉ có một FeatureRecord (cùng dict, tuples, strings đã intern). Mỗi record được đếm số
+    lần đang được giữ; record không còn tenant nào giữ thì bị xoá khỏi pool"""
+
+    def __init__(self):
+        # key -> [record, bytes ước lượng, số lần đang được giữ]
+        self._entries: Dict[bytes, List[Any]] = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(feature: Dict[str, Any]) -> bytes:
+        canonical = json.dumps(feature, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+    def acquire(self, feature: Dict[str, Any]) -> Tuple[bytes, FeatureRecord]:
+        """Record dùng chung cho feature (tạo mới nếu chưa có), trả về (key, record)"""
+        key = self._key(feature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0].data == feature:
+                entry[2] += 1
+                self.hits += 1
+                return key, entry[0]
+
+        record = FeatureRecord(_intern(feature))
+        for slot in ('keywords', 'pain_points', 'use_cases'):
+            setattr(record, slot, tuple(sys.intern(value) for value in getattr(record, slot)))
+        size = estimate_size(record)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0].data == feature:
+                # Thread khác vừa tạo cùng feature
+                entry[2] += 1
+                self.hits += 1
+                return key, entry[0]
+            if entry is not None:
+                # Trùng hash nhưng khác nội dung (gần như không xảy ra): không đưa vào pool
+                self.misses += 1
+                return b'', record
+            self._entries[key] = [record, size, 1]
+            self.total_bytes += size
+            self.misses += 1
+            return key, record
+
+    def release(self, keys: Iterable[bytes]) -> None:
+        """Bỏ giữ các records đã acquire"""
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                entry[2] -= 1
+                if entry[2] <= 0:
+                    del self._entries[key]
+                    self.total_bytes -= entry[1]
+
+
+class _PoolHoldings:
+    """Các records trong pool mà một lần load của tenant đang giữ: id(record) -> [key, record, số lần giữ].
+    Sau khi tenant bị unload (active=False), records tạo thêm không được lấy từ pool nữa"""
+
+    __slots__ = ('entries', 'active', 'lock')
+
+    def __init__(self):
+        self.entries: Dict[int, List[Any]] = {}
+        self.active = True
+        self.lock = threading.Lock()
+
+
+class _Tenant:
+    __slots__ = ('name', 'features_file', 'agent', 'holdings', 'index_bytes', 'load_lock', 'pins')
+
+    def __init__(self, name: str, features_file: str):
+        self.name = name
+        self.features_file = features_file
+        self.agent: Optional[PainPointToSolutionAgent] = None
+        self.holdings: Optional[_PoolHoldings] = None
+        self.index_bytes = 0
+        self.load_lock = threading.Lock()
+        # Số get_agent đang load/trả về agent của tenant; tenant đang được pin không bị evict
+        self.pins = 0
+
+
+class CatalogManager:
+    """Quản lý nhiều catalog (mỗi tenant một features file) trong một process.
+
+    Tenant được load lazy ở request đầu tiên; features giống nhau giữa các tenants dùng chung
+    record qua FeaturePool. Khi tổng bộ nhớ ước lượng (records trong pool + index của từng tenant)
+    vượt memory_budget_mb hoặc số tenants đã load vượt max_loaded, tenant dùng ít gần đây nhất
+    bị unload. Request đang chạy trên tenant bị unload vẫn hoàn tất với agent nó đang giữ"""
+
+    def __init__(self, tenants: Optional[Dict[str, str]] = None, memory_budget_mb: Optional[float] = None,
+                 max_loaded: Optional[int] = None, **agent_options):
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb is not None else None
+        self.max_loaded = max_loaded
+        self.agent_options = agent_options
+        self.pool = FeaturePool()
+        self._tenants: Dict[str, _Tenant] = {}
+        self._loaded: "OrderedDict[str, _Tenant]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        for name, features_file in (tenants or {}).items():
+            self.register_tenant(name, features_file)
+
+    def register_tenant(self, name: str, features_file: str) -> None:
+        """Khai báo tenant (chưa load); đăng ký lại với file khác thì unload bản cũ"""
+        with self._lock:
+            old = self._tenants.get(name)
+            self._tenants[name] = _Tenant(name, features_file)
+        if old is not None:
+            self._unload(old)
+
+    def unregister_tenant(self, name: str) -> None:
+        """Xoá tenant và giải phóng catalog của nó"""
+        with self._lock:
+            tenant = self._tenants.pop(name)
+        self._unload(tenant)
+
+    @property
+    def tenants(self) -> List[str]:
+        return list(self._tenants)
+
+    @property
+    def loaded_tenants(self) -> List[str]:
+        """Các tenants đang load, từ ít đến nhiều gần đây nhất"""
+        with self._lock:
+            return list(self._loaded)
+
+    def memory_usage(self) -> int:
+        """Bộ nhớ ước lượng (bytes) của các tenants đang load"""
+        with self._lock:
+            return self.pool.total_bytes + sum(tenant.index_bytes for tenant in self._loaded.values())
+
+    def get_agent(self, name: str) -> PainPointToSolutionAgent:
+        """Agent của tenant, load nếu chưa có (KeyError nếu tenant chưa đăng ký)"""
+        with self._lock:
+            tenant = self._tenants[name]
+            if tenant.agent is not None:
+                self._loaded.move_to_end(name)
+                return tenant.agent
+            tenant.pins += 1
+
+        try:
+            with tenant.load_lock:
+                agent = tenant.agent
+                if agent is None:
+                    agent = self._load(tenant)
+            self._evict_over_budget(keep=name)
+        finally:
+            with self._lock:
+                tenant.pins -= 1
+        return agent
+
+    def process_input(self, name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """process_input trên catalog của tenant"""
+        return self.get_agent(name).process_input(input_data)
+
+    def _load(self, tenant: _Tenant) -> PainPointToSolutionAgent:
+        """Load catalog của tenant và trả về agent vừa tạo"""
+        holdings = _PoolHoldings()
+
+        def pooled_record(feature: Dict[str, Any]) -> FeatureRecord:
+            with holdings.lock:
+                if not holdings.active:
+                    # Tenant đã bị unload (agent cũ vẫn có thể reload): không giữ record trong pool nữa
+                    return FeatureRecord(feature)
+                key, record = self.pool.acquire(feature)
+                if key:
+                    entry = holdings.entries.get(id(record))
+                    if entry is None:
+                        holdings.entries[id(record)] = [key, record, 1]
+                    else:
+                        entry[2] += 1
+                return record
+
+        def on_publish(old: CatalogSnapshot, new: CatalogSnapshot) -> None:
+            # Records bị thay thế (reload, apply_changes) hoặc tạo ra nhưng không được publish thì trả lại pool
+            in_use = Counter(id(record) for record in new.records)
+            with holdings.lock:
+                if not holdings.active:
+                    return
+                released = []
+                for record_id, entry in list(holdings.entries.items()):
+                    extra = entry[2] - in_use.get(record_id, 0)
+                    if extra > 0:
+                        released.extend([entry[0]] * extra)
+                        entry[2] -= extra
+                        if not entry[2]:
+                            del holdings.entries[record_id]
+                self.pool.release(released)
+            index_bytes = self._index_size(new)
+            with self._lock:
+                if tenant.holdings is holdings:
+                    tenant.index_bytes = index_bytes
+
+        try:
+            knowledge_base = KnowledgeBase(tenant.features_file, record_factory=pooled_record)
+        except BaseException:
+            self._release(holdings)
+            raise
+        knowledge_base.add_publish_listener(on_publish)
+        agent = PainPointToSolutionAgent(knowledge_base=knowledge_base, **self.agent_options)
+        index_bytes = self._index_size(knowledge_base.snapshot)
+        with self._lock:
+            if self._tenants.get(tenant.name) is not tenant:
+                # Tenant bị xoá/đăng ký lại trong lúc load
+                tenant.agent = agent
+                stale = True
+            else:
+                stale = False
+                tenant.agent = agent
+                tenant.holdings = holdings
+                tenant.index_bytes = index_bytes
+                self._loaded[tenant.name] = tenant
+                self.loads += 1
+        if stale:
+            self._release(holdings)
+            knowledge_base.stop_watching()
+        return agent
+
+    def _release(self, holdings: Optional[_PoolHoldings]) -> None:
+        """Trả lại pool mọi record của holdings; records tạo sau đó không lấy từ pool nữa"""
+        if holdings is None:
+            return
+        with holdings.lock:
+            holdings.active = False
+            released = [entry[0] for entry in holdings.entries.values() for _ in range(entry[2])]
+            holdings.entries.clear()
+            self.pool.release(released)
+
+    @staticmethod
+    def _index_size(snapshot: CatalogSnapshot) -> int:
+        """Bộ nhớ riêng của tenant: danh sách records và các index (không tính records trong pool).
+        Các index phụ (search, tfidf, lsh) không được tính"""
+        seen = {id(record) for record in snapshot.records}
+        seen.update(id(feature) for feature in snapshot.features)
+        return estimate_size([snapshot.records, snapshot.features, snapshot.records_by_id, snapshot.positions,
+                              snapshot.keyword_index, snapshot.token_index, snapshot.doc_lengths, snapshot.facets],
+                             seen)
+
+    def _unload(self, tenant: _Tenant) -> None:
+        with self._lock:
+            if self._loaded.get(tenant.name) is tenant:
+                del self._loaded[tenant.name]
+            agent, tenant.agent = tenant.agent, None
+            holdings, tenant.holdings = tenant.holdings, None
+            tenant.index_bytes = 0
+        self._release(holdings)
+        if agent is not None:
+            agent.knowledge_base.stop_watching()
+
+    def _evict_over_budget(self, keep: str) -> None:
+        """Unload tenants dùng ít gần đây nhất cho tới khi nằm trong budget
+        (không unload tenant keep và các tenants đang được get_agent khác load)"""
+        while True:
+            with self._lock:
+                over_count = self.max_loaded is not None and len(self._loaded) > self.max_loaded
+                over_memory = self.memory_budget is not None and \
+                    self.pool.total_bytes + sum(t.index_bytes for t in self._loaded.values()) > self.memory_budget
+                victim = next((tenant for name, tenant in self._loaded.items()
+                               if name != keep and not tenant.pins), None)
+                if not (over_count or over_memory) or victim is None:
+                    return
+                self.evictions += 1
+            self._unload(victim)
+
+    def evict(self, name: str) -> None:
+        """Unload tenant (load lại ở request tiếp theo)"""
+        with self._lock:
+            tenant = self._tenants[name]
+        self._unload(tenant)
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê: tenants đang load, bộ nhớ ước lượng, pool và số lần load/evict"""
+        with self._lock:
+            index_bytes = {name: tenant.index_bytes for name, tenant in self._loaded.items()}
+            return {
+                'tenants': len(self._tenants),
+                'loaded': list(self._loaded),
+                'memory_mb': (self.pool.total_bytes + sum(index_bytes.values())) / (1024 * 1024),
+                'pool': {'records': len(self.pool), 'memory_mb': self.pool.total_bytes / (1024 * 1024),
+                         'hits': self.pool.hits, 'misses': self.pool.misses},
+                'index_memory_mb': {name: size / (1024 * 1024) for name, size in index_bytes.items()},
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
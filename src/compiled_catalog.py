@@ -0,0 +1,381 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Layout file snapshot (byte order native, kiểm tra bằng BYTE_ORDER_MARK):
+#   header | string offsets (u64) | string data (utf-8) | features | fields | items
+#   | token vocab | token postings | keyword vocab | keyword postings
+# Mỗi section căn theo 8 bytes để memoryview.cast đọc trực tiếp từ mmap
+MAGIC = b'PPCATLG\x00'
+FORMAT_VERSION = 1
+BYTE_ORDER_MARK = 0x01020304
+
+SECTIONS = ('string_offsets', 'string_data', 'features', 'fields', 'items',
+            'token_vocab', 'token_postings', 'keyword_vocab', 'keyword_postings')
+_HEADER = struct.Struct('=8sIIII' + 'QQ' * len(SECTIONS))
+
+# Mỗi feature: id, complexity, time_to_value, doc_length, (start, count) của
+# fields / keywords / pain points / use cases (các list đã normalize)
+FEATURE_WIDTH = 12
+# Mỗi field: key, kind, a, b
+FIELD_WIDTH = 4
+KIND_STRING = 0       # a = string id
+KIND_STRING_LIST = 1  # a = vị trí bắt đầu trong items, b = số phần tử
+KIND_JSON = 2         # a = string id của JSON text (giá trị khác string/list string)
+# Mỗi entry vocab: string id của key, vị trí bắt đầu postings, số postings
+VOCAB_WIDTH = 3
+
+
+class CompiledCatalogError(Exception):
+    """File snapshot không hợp lệ hoặc khác phiên bản format"""
+
+
+def is_compiled_catalog(path: str) -> bool:
+    """True nếu file bắt đầu bằng magic của catalog đã compile"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class _StringTable:
+    """Intern strings khi compile: mỗi string chỉ lưu một lần"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.offsets = array('Q', [0])
+        self.data = bytearray()
+
+    def add(self, text: str) -> int:
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.ids)
+            self.data += text.encode('utf-8')
+            self.offsets.append(len(self.data))
+        return string_id
+
+
+def write_compiled_catalog(snapshot: Any, path: str) -> None:
+    """Compile một CatalogSnapshot (records + index) thành file snapshot nhị phân.
+    File được ghi ra file tạm rồi os.replace, nên process đang mmap file cũ không bị ảnh hưởng"""
+    strings = _StringTable()
+    features = array('I')
+    fields = array('I')
+    items = array('I')
+
+    def add_list(values: Any) -> Tuple[int, int]:
+        start = len(items)
+        items.extend(strings.add(value) for value in values)
+        return start, len(items) - start
+
+    positions = {}
+    for position, record in enumerate(snapshot.records):
+        positions[record.feature_id] = position
+        field_start = len(fields) // FIELD_WIDTH
+        for key, value in record.data.items():
+            if isinstance(value, str):
+                fields.extend((strings.add(key), KIND_STRING, strings.add(value), 0))
+            elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+                fields.extend((strings.add(key), KIND_STRING_LIST) + add_list(value))
+            else:
+                fields.extend((strings.add(key), KIND_JSON, strings.add(json.dumps(value, ensure_ascii=False)), 0))
+
+        features.extend((strings.add(record.feature_id), strings.add(record.complexity),
+                         strings.add(record.time_to_value), snapshot.doc_lengths.get(record.feature_id, 0),
+                         field_start, len(fields) // FIELD_WIDTH - field_start))
+        features.extend(add_list(record.keywords) + add_list(record.pain_points) + add_list(record.use_cases))
+
+    # Vocab sắp xếp theo key để tra cứu bằng binary search trên mmap
+    token_vocab, token_postings = array('I'), array('I')
+    for token in sorted(snapshot.token_index):
+        postings = snapshot.token_index[token]
+        token_vocab.extend((strings.add(token), len(token_postings) // 2, len(postings)))
+        for feature_id, count in postings:
+            token_postings.extend((positions[feature_id], count))
+
+    keyword_vocab, keyword_postings = array('I'), array('I')
+    for keyword in sorted(snapshot.keyword_index):
+        postings = snapshot.keyword_index[keyword]
+        keyword_vocab.extend((strings.add(keyword), len(keyword_postings), len(postings)))
+        keyword_postings.extend(positions[feature_id] for feature_id in postings)
+
+    sections = [strings.offsets.tobytes(), bytes(strings.data), features.tobytes(), fields.tobytes(),
+                items.tobytes(), token_vocab.tobytes(), token_postings.tobytes(),
+                keyword_vocab.tobytes(), keyword_postings.tobytes()]
+
+    layout = []
+    offset = _HEADER.size
+    for data in sections:
+        offset += -offset % 8
+        layout.extend((offset, len(data)))
+        offset += len(data)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER_MARK, len(snapshot.records), len(strings.ids), *layout)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            for data in sections:
+                f.write(b'\0' * (-f.tell() % 8))
+                f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class CompiledFeature(Mapping):
+    """Feature dict đọc thẳng từ mmap: từng field chỉ được decode khi truy cập.
+    Pickle/copy trả về dict thường"""
+
+    __slots__ = ('_catalog', '_start', '_count')
+
+    def __init__(self, catalog: 'CompiledCatalog', start: int, count: int):
+        self._catalog = catalog
+        self._start = start
+        self._count = count
+
+    def _field_offsets(self) -> range:
+        return range(self._start * FIELD_WIDTH, (self._start + self._count) * FIELD_WIDTH, FIELD_WIDTH)
+
+    def __getitem__(self, key: str) -> Any:
+        catalog = self._catalog
+        fields = catalog._fields
+        for base in self._field_offsets():
+            if catalog.key_name(fields[base]) == key:
+                return catalog._decode_value(fields[base + 1], fields[base + 2], fields[base + 3])
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        catalog = self._catalog
+        for base in self._field_offsets():
+            yield catalog.key_name(catalog._fields[base])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class _MappedIndex(Mapping):
+    """Index key -> postings đọc từ mmap; key tra bằng binary search trên vocab đã sắp xếp"""
+
+    def __init__(self, catalog: 'CompiledCatalog', vocab: memoryview, postings: memoryview,
+                 decode: Callable[[memoryview], list]):
+        self._catalog = catalog
+        self._vocab = vocab
+        self._postings = postings
+        self._decode = decode
+        self._size = len(vocab) // VOCAB_WIDTH
+
+    def _find(self, key: str) -> int:
+        string = self._catalog.string
+        vocab = self._vocab
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = string(vocab[middle * VOCAB_WIDTH])
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def __getitem__(self, key: str) -> list:
+        entry = self._find(key) if isinstance(key, str) else -1
+        if entry < 0:
+            raise KeyError(key)
+        base = entry * VOCAB_WIDTH
+        return self._decode(self._postings, self._vocab[base + 1], self._vocab[base + 2])
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        string = self._catalog.string
+        for base in range(0, self._size * VOCAB_WIDTH, VOCAB_WIDTH):
+            yield string(self._vocab[base])
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class CompiledCatalog:
+    """Catalog đã compile, mở bằng mmap (read-only). Các process cùng mở một file
+    dùng chung page cache thay vì mỗi process giữ một bản parse JSON riêng"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CompiledCatalogError(f"{path} is empty")
+        # Mọi memoryview trên mmap, phải release hết trước khi đóng mmap
+        self._views: List[memoryview] = []
+        try:
+            self._open_sections()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open_sections(self) -> None:
+        path = self.path
+        if len(self._mmap) < _HEADER.size:
+            raise CompiledCatalogError(f"{path} is not a compiled catalog")
+
+        magic, format_version, byte_order, self.feature_count, self.string_count, *layout = \
+            _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise CompiledCatalogError(f"{path} is not a compiled catalog")
+        if format_version != FORMAT_VERSION:
+            raise CompiledCatalogError(f"Unsupported compiled catalog format {format_version} (expected {FORMAT_VERSION})")
+        if byte_order != BYTE_ORDER_MARK:
+            raise CompiledCatalogError(f"{path} was compiled on a machine with different byte order")
+
+        view = memoryview(self._mmap)
+        self._views.append(view)
+        sections = {}
+        for name, offset, length in zip(SECTIONS, layout[0::2], layout[1::2]):
+            if offset + length > len(self._mmap):
+                raise CompiledCatalogError(f"{path} is truncated")
+            sections[name] = view[offset:offset + length]
+            self._views.append(sections[name])
+
+        def cast(name: str, format: str) -> memoryview:
+            section = sections[name].cast(format)
+            self._views.append(section)
+            return section
+
+        self._string_offsets = cast('string_offsets', 'Q')
+        self._string_data = sections['string_data']
+        self._features = cast('features', 'I')
+        self._fields = cast('fields', 'I')
+        self._items = cast('items', 'I')
+        self._key_names: Dict[int, str] = {}
+        self._feature_ids: Optional[List[str]] = None
+
+        self.token_index = _MappedIndex(self, cast('token_vocab', 'I'), cast('token_postings', 'I'),
+                                        self._decode_token_postings)
+        self.keyword_index = _MappedIndex(self, cast('keyword_vocab', 'I'), cast('keyword_postings', 'I'),
+                                          self._decode_keyword_postings)
+
+    @property
+    def closed(self) -> bool:
+        return self._mmap.closed
+
+    def close(self) -> None:
+        """Release các memoryview và đóng mmap; features/index đọc từ catalog không dùng được nữa"""
+        # Release view dẫn xuất trước view gốc
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mmap.close()
+
+    def __enter__(self) -> 'CompiledCatalog':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def string(self, string_id: int) -> str:
+        """Decode một string trong string table"""
+        return str(self._string_data[self._string_offsets[string_id]:self._string_offsets[string_id + 1]], 'utf-8')
+
+    def key_name(self, string_id: int) -> str:
+        """Tên field (số lượng ít nên được cache)"""
+        name = self._key_names.get(string_id)
+        if name is None:
+            name = self._key_names[string_id] = self.string(string_id)
+        return name
+
+    def _string_list(self, start: int, count: int, decode: Callable[[int], str]) -> List[str]:
+        return [decode(string_id) for string_id in self._items[start:start + count]]
+
+    def _decode_value(self, kind: int, a: int, b: int) -> Any:
+        if kind == KIND_STRING:
+            return self.string(a)
+        if kind == KIND_STRING_LIST:
+            return self._string_list(a, b, self.string)
+        return json.loads(self.string(a))
+
+    @property
+    def feature_ids(self) -> List[str]:
+        if self._feature_ids is None:
+            features = self._features
+            self._feature_ids = [self.string(features[i * FEATURE_WIDTH]) for i in range(self.feature_count)]
+        return self._feature_ids
+
+    def _decode_token_postings(self, postings: memoryview, start: int, count: int) -> List[Tuple[str, int]]:
+        values = postings[start * 2:(start + count) * 2].tolist()
+        feature_ids = self.feature_ids
+        return [(feature_ids[position], tf) for position, tf in zip(values[0::2], values[1::2])]
+
+    def _decode_keyword_postings(self, postings: memoryview, start: int, count: int) -> List[str]:
+        feature_ids = self.feature_ids
+        return [feature_ids[position] for position in postings[start:start + count].tolist()]
+
+    def feature(self, position: int) -> CompiledFeature:
+        base = position * FEATURE_WIDTH
+        return CompiledFeature(self, self._features[base + 4], self._features[base + 5])
+
+    def iter_records(self) -> Iterator[Tuple[CompiledFeature, str, Tuple[str, ...], Tuple[str, ...],
+                                             Tuple[str, ...], str, str, int]]:
+        """Yield (data, feature_id, keywords, pain_points, use_cases, complexity,
+        time_to_value, doc_length) cho từng feature. Các field dùng để scoring được
+        decode ngay (strings trùng nhau dùng chung một object), còn lại decode lazy"""
+        interned: Dict[int, str] = {}
+
+        def decode(string_id: int) -> str:
+            text = interned.get(string_id)
+            if text is None:
+                text = interned[string_id] = self.string(string_id)
+            return text
+
+        features = self._features
+        feature_ids = self.feature_ids
+        for position in range(self.feature_count):
+            row = features[position * FEATURE_WIDTH:(position + 1) * FEATURE_WIDTH].tolist()
+            yield (CompiledFeature(self, row[4], row[5]), feature_ids[position],
+                   tuple(self._string_list(row[6], row[7], decode)),
+                   tuple(self._string_list(row[8], row[9], decode)),
+                   tuple(self._string_list(row[10], row[11], decode)),
+                   decode(row[1]), decode(row[2]), row[3])
+
+
+def main(argv=None):
+    """Compile features file (JSON array hoặc JSON Lines) thành snapshot nhị phân"""
+    from knowledge_base import KnowledgeBase  # import tại đây để tránh import vòng
+
+    parser = argparse.ArgumentParser(description="Compile feature catalog thành snapshot mmap")
+    parser.add_argument('features_file', nargs='?', default='data/filum_features.json')
+    parser.add_argument('--output', '-o', default=None, help="File output (mặc định: <features_file>.snap)")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.features_file)[0] + '.snap'
+    knowledge_base = KnowledgeBase(args.features_file)
+    if knowledge_base.load_report.fatal_error:
+        print(f"Error: {knowledge_base.load_report.fatal_error}", file=sys.stderr)
+        return 1
+    write_compiled_catalog(knowledge_base.snapshot, output)
+    print(f"Compiled {len(knowledge_base.records)} features to {output} ({os.path.getsize(output)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
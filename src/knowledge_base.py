@@ -1,93 +1,885 @@
+import copy
 import json
 import os
-from typing import List, Dict, Any
+import re
+import threading
+import weakref
+from array import array
+from collections import Counter
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+
+from catalog_loader import CatalogLoadReport, iter_catalog, validate_feature
+from compiled_catalog import CompiledCatalog, CompiledCatalogError, is_compiled_catalog
+
+STOP_WORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those', 'we', 'our', 'us', 'they', 'them', 'their'})
+
+_WORD_PATTERN = re.compile(r'\b\w+\b')
+
+# Quy đổi đơn vị thời gian sang tuần khi parse time_to_value
+_WEEKS_PER_UNIT = {'day': 1 / 7, 'week': 1.0, 'month': 4.0}
+_TIME_RANGE_PATTERN = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(?:-|–|to)?\s*(\d+(?:\.\d+)?)?\s*(day|week|month)s?'
+)
+
+
+# Giá trị business context có ảnh hưởng tới context/feasibility score; giá trị khác được quy về ''
+COMPANY_SIZES = ('small', 'medium', 'large')
+BUDGET_LEVELS = ('low', 'moderate', 'high', 'flexible')
+URGENCY_LEVELS = ('high', 'medium')
+
+# Bảng điểm dùng chung cho mọi feature cùng complexity / time_to_value
+_CONTEXT_TABLES: Dict[str, Dict[Tuple[str, bool], float]] = {}
+_FEASIBILITY_TABLES: Dict[Tuple[str, bool, bool], Dict[Tuple[str, str], float]] = {}
+MAX_CACHED_INDUSTRIES = 1024
+
+# Các field được đếm facet incremental trong mỗi snapshot (xem get_feature_statistics)
+FACET_FIELDS = ('category', 'implementation_complexity', 'subcategory', 'time_to_value', 'use_cases')
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách text thành tokens: lowercase, bỏ punctuation, stop words và từ ngắn"""
+    words = _WORD_PATTERN.findall(text.lower())
+    return [word for word in words if word not in STOP_WORDS and len(word) > 2]
+
+
+def _normalize_list(values: Iterable[Any]) -> Tuple[str, ...]:
+    """Lowercase và loại bỏ phần tử trùng, giữ nguyên thứ tự"""
+    return tuple(dict.fromkeys(value.lower() for value in values if isinstance(value, str)))
+
+
+def parse_time_to_value(text: str) -> Optional[Tuple[float, float]]:
+    """Parse time_to_value (vd: '2-4 weeks') thành khoảng (min, max) tính theo tuần"""
+    match = _TIME_RANGE_PATTERN.search(text.lower()) if isinstance(text, str) else None
+    if not match:
+        return None
+    low, high, unit = match.groups()
+    factor = _WEEKS_PER_UNIT[unit]
+    low_weeks = float(low) * factor
+    high_weeks = float(high) * factor if high else low_weeks
+    return (low_weeks, high_weeks)
+
+
+def facet_values(data: Dict[str, Any], field: str) -> Iterable[Any]:
+    """Giá trị facet của một feature: field dạng list đếm từng phần tử (không trùng),
+    field thiếu được tính là 'Unknown'"""
+    value = data.get(field, 'Unknown')
+    values = value if isinstance(value, list) else (value,)
+    return dict.fromkeys(item if isinstance(item, (str, int, float, bool, type(None)))
+                         else json.dumps(item, sort_keys=True, ensure_ascii=False) for item in values)
+
+
+def context_score_table(complexity: str) -> Dict[Tuple[str, bool], float]:
+    """Context score theo (company_size, industry có trong use cases) cho một complexity"""
+    table = _CONTEXT_TABLES.get(complexity)
+    if table is not None:
+        return table
+    
+    table = {}
+    for company_size in COMPANY_SIZES + ('',):
+        for industry_match in (False, True):
+            score = 0.5  # Base score
+            
+            # Industry relevance
+            if industry_match:
+                score += 0.3
+            
+            # Company size vs implementation complexity
+            if company_size == 'small' and complexity == 'low':
+                score += 0.2
+            elif company_size == 'medium' and complexity in ('low', 'medium'):
+                score += 0.2
+            elif company_size == 'large' and complexity in ('medium', 'high'):
+                score += 0.2
+            
+            table[company_size, industry_match] = min(score, 1.0)
+    _CONTEXT_TABLES[complexity] = table
+    return table
+
+
+def feasibility_score_table(complexity: str, time_to_value: str) -> Dict[Tuple[str, str], float]:
+    """Feasibility score theo (budget_constraints, urgency_level) cho một complexity + time_to_value"""
+    key = (complexity, '1-2 weeks' in time_to_value, '2-4 weeks' in time_to_value)
+    table = _FEASIBILITY_TABLES.get(key)
+    if table is not None:
+        return table
+    
+    _, fast, medium = key
+    table = {}
+    for budget in BUDGET_LEVELS + ('',):
+        for urgency in URGENCY_LEVELS + ('',):
+            score = 0.5  # Base score
+            
+            # Budget constraints
+            if budget == 'low' and complexity == 'low':
+                score += 0.3
+            elif budget == 'moderate' and complexity in ('low', 'medium'):
+                score += 0.3
+            elif budget == 'high' and complexity in ('medium', 'high'):
+                score += 0.3
+            elif budget == 'flexible':
+                score += 0.2
+            
+            # Urgency vs time to value
+            if urgency == 'high' and fast:
+                score += 0.2
+            elif urgency == 'medium' and medium:
+                score += 0.2
+            
+            table[budget, urgency] = min(score, 1.0)
+    _FEASIBILITY_TABLES[key] = table
+    return table
+
+
+class FeatureRecord:
+    """Feature đã được compile một lần lúc load: các field dùng để scoring
+    được lowercase, dedup và lưu dạng tuple; dict gốc giữ trong `data`"""
+
+    __slots__ = ('feature_id', 'data', 'keywords', 'pain_points', 'use_cases',
+                 'complexity', 'time_to_value', 'time_to_value_weeks',
+                 'context_scores', 'feasibility_scores')
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.feature_id = data.get('feature_id', '')
+        self.keywords = _normalize_list(data.get('keywords', []))
+        self.pain_points = _normalize_list(data.get('pain_points_addressed', []))
+        self.use_cases = _normalize_list(data.get('use_cases', []))
+        self.complexity = (data.get('implementation_complexity') or '').lower()
+        self.time_to_value = data.get('time_to_value') or ''
+        self.time_to_value_weeks = parse_time_to_value(self.time_to_value)
+        self.context_scores = context_score_table(self.complexity)
+        self.feasibility_scores = feasibility_score_table(self.complexity, self.time_to_value)
+
+    @classmethod
+    def from_compiled(cls, data: Dict[str, Any], feature_id: str, keywords: Tuple[str, ...],
+                      pain_points: Tuple[str, ...], use_cases: Tuple[str, ...], complexity: str,
+                      time_to_value: str, time_to_value_weeks: Optional[Tuple[float, float]]) -> 'FeatureRecord':
+        """Tạo record từ các field đã compile sẵn (catalog snapshot), bỏ qua bước normalize"""
+        record = cls.__new__(cls)
+        record.data = data
+        record.feature_id = feature_id
+        record.keywords = keywords
+        record.pain_points = pain_points
+        record.use_cases = use_cases
+        record.complexity = complexity
+        record.time_to_value = time_to_value
+        record.time_to_value_weeks = time_to_value_weeks
+        record.context_scores = context_score_table(complexity)
+        record.feasibility_scores = feasibility_score_table(complexity, time_to_value)
+        return record
+    
+    def matches_industry(self, industry: str) -> bool:
+        """True nếu industry (lowercase) xuất hiện trong một use case"""
+        return any(industry in case for case in self.use_cases)
+    
+    def __repr__(self) -> str:
+        return f"FeatureRecord({self.feature_id!r})"
+
+
+class CatalogSnapshot:
+    """Một phiên bản immutable của catalog cùng các index dẫn xuất.
+    KnowledgeBase publish snapshot mới bằng một phép gán, nên request đang chạy
+    luôn thấy một catalog nhất quán mà không cần lock"""
+    
+    def __init__(self, records: Iterable[FeatureRecord], version: int = 0,
+                 facet_fields: Tuple[str, ...] = FACET_FIELDS):
+        self.version = version
+        self.facet_fields = tuple(facet_fields)
+        self.facets: Dict[str, Dict[Any, int]] = {field: {} for field in self.facet_fields}
+        self.records: List[FeatureRecord] = []
+        self.records_by_id: Dict[str, FeatureRecord] = {}
+        self.positions: Dict[str, int] = {}
+        self.keyword_index: Dict[str, List[str]] = {}
+        self.token_index: Dict[str, List[Tuple[str, int]]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_doc_length = 0
+        # CompiledCatalog (mmap) mà records/index của snapshot đọc từ đó, None nếu build từ JSON
+        self.compiled: Optional[CompiledCatalog] = None
+        self._owned_postings = None
+        self._init_caches()
+        
+        # records có thể là generator (streaming loader): index dần từng record
+        for position, record in enumerate(records):
+            self.records.append(record)
+            self._count_facets(record, 1)
+            feature_id = record.feature_id
+            # feature_id rỗng hoặc trùng không được index (giữ bản đầu tiên)
+            if not feature_id or feature_id in self.records_by_id:
+                continue
+            self.records_by_id[feature_id] = record
+            self.positions[feature_id] = position
+            self._index_record(record)
+        self.features = [record.data for record in self.records]
+    
+    @classmethod
+    def from_compiled(cls, catalog: CompiledCatalog, version: int = 0,
+                      facet_fields: Tuple[str, ...] = FACET_FIELDS) -> 'CatalogSnapshot':
+        """Snapshot từ catalog đã compile: không parse JSON hay tokenize lại,
+        keyword/token index đọc thẳng từ mmap và feature dict được decode lazy"""
+        snapshot = cls.__new__(cls)
+        snapshot.version = version
+        snapshot.facet_fields = tuple(facet_fields)
+        snapshot.facets = {field: {} for field in snapshot.facet_fields}
+        snapshot.records = []
+        snapshot.records_by_id = {}
+        snapshot.positions = {}
+        snapshot.doc_lengths = {}
+        snapshot.compiled = catalog
+        snapshot._owned_postings = None
+        snapshot._init_caches()
+        
+        time_ranges: Dict[str, Optional[Tuple[float, float]]] = {}
+        for position, (data, feature_id, keywords, pain_points, use_cases, complexity, time_to_value,
+                       doc_length) in enumerate(catalog.iter_records()):
+            if time_to_value not in time_ranges:
+                time_ranges[time_to_value] = parse_time_to_value(time_to_value)
+            record = FeatureRecord.from_compiled(data, feature_id, keywords, pain_points, use_cases, complexity,
+                                                 time_to_value, time_ranges[time_to_value])
+            snapshot.records.append(record)
+            snapshot._count_facets(record, 1)
+            snapshot.records_by_id[feature_id] = record
+            snapshot.positions[feature_id] = position
+            snapshot.doc_lengths[feature_id] = doc_length
+        
+        snapshot.features = [record.data for record in snapshot.records]
+        snapshot.keyword_index = catalog.keyword_index
+        snapshot.token_index = catalog.token_index
+        snapshot.total_doc_length = sum(snapshot.doc_lengths.values())
+        return snapshot
+    
+    def _init_caches(self) -> None:
+        """Các cấu trúc dẫn xuất được build lazy, riêng cho từng snapshot"""
+        self._industry_matches: Dict[str, frozenset] = {}
+        self._extra_facets: Dict[str, Dict[Any, int]] = {}
+        # Trigram -> id(record) của các records có text chứa trigram, và id(record) -> vị trí
+        self._trigram_index: Optional[Dict[str, array]] = None
+        self._trigram_positions: Dict[int, int] = {}
+        self._tfidf_index = None
+        self._lsh_indexes: Dict[Tuple[int, int], Any] = {}
+        self._build_lock = threading.Lock()
+    
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_doc_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+    
+    @property
+    def fully_indexed(self) -> bool:
+        """True nếu mọi record có feature_id riêng (điều kiện để cập nhật incremental)"""
+        return len(self.records_by_id) == len(self.records)
+    
+    def _count_facets(self, record: FeatureRecord, delta: int) -> None:
+        """Cộng (delta=1) hoặc trừ (delta=-1) các giá trị facet của record"""
+        for field in self.facet_fields:
+            counts = self.facets[field]
+            for value in facet_values(record.data, field):
+                count = counts.get(value, 0) + delta
+                if count:
+                    counts[value] = count
+                else:
+                    del counts[value]
+    
+    def get_facet_counts(self, field: str) -> Dict[Any, int]:
+        """Số features theo từng giá trị của field. Field trong facet_fields được duy trì
+        incremental nên đọc không phụ thuộc kích thước catalog; field khác được đếm một lần rồi cache"""
+        counts = self.facets.get(field)
+        if counts is None:
+            counts = self._extra_facets.get(field)
+            if counts is None:
+                counts = {}
+                for record in self.records:
+                    for value in facet_values(record.data, field):
+                        counts[value] = counts.get(value, 0) + 1
+                self._extra_facets[field] = counts
+        return dict(counts)
+    
+    @staticmethod
+    def _document_tokens(record: FeatureRecord) -> Counter:
+        """Document cho BM25 = keywords + pain points addressed"""
+        token_counts = Counter()
+        for text in record.keywords + record.pain_points:
+            token_counts.update(tokenize(text))
+        return token_counts
+    
+    def _postings(self, index: Dict[str, list], key: str) -> list:
+        """Posting list có thể sửa: khi derive thì copy list của snapshot cũ ở lần chạm đầu tiên"""
+        postings = index.get(key)
+        if postings is None:
+            postings = index[key] = []
+        elif self._owned_postings is not None and (id(index), key) not in self._owned_postings:
+            postings = index[key] = list(postings)
+        if self._owned_postings is not None:
+            self._owned_postings.add((id(index), key))
+        return postings
+    
+    def _index_record(self, record: FeatureRecord) -> None:
+        feature_id = record.feature_id
+        for keyword in record.keywords:
+            self._postings(self.keyword_index, keyword).append(feature_id)
+        
+        token_counts = self._document_tokens(record)
+        for token, count in token_counts.items():
+            self._postings(self.token_index, token).append((feature_id, count))
+        self.doc_lengths[feature_id] = sum(token_counts.values())
+        self.total_doc_length += self.doc_lengths[feature_id]
+    
+    def _unindex_record(self, record: FeatureRecord) -> None:
+        feature_id = record.feature_id
+        for keyword in record.keywords:
+            postings = self._postings(self.keyword_index, keyword)
+            postings[:] = [fid for fid in postings if fid != feature_id]
+            if not postings:
+                del self.keyword_index[keyword]
+        
+        for token in self._document_tokens(record):
+            postings = self._postings(self.token_index, token)
+            postings[:] = [item for item in postings if item[0] != feature_id]
+            if not postings:
+                del self.token_index[token]
+        self.total_doc_length -= self.doc_lengths.pop(feature_id)
+    
+    def derive(self, records: List[FeatureRecord], added: List[FeatureRecord],
+               removed: List[FeatureRecord]) -> 'CatalogSnapshot':
+        """Tạo snapshot mới (version + 1) với danh sách records mới; chỉ index của
+        các records bị xoá/thêm được cập nhật, phần còn lại dùng chung với snapshot cũ.
+        Yêu cầu feature_id duy nhất ở cả hai phiên bản"""
+        snapshot = CatalogSnapshot.__new__(CatalogSnapshot)
+        snapshot.version = self.version + 1
+        snapshot.facet_fields = self.facet_fields
+        snapshot.facets = {field: dict(counts) for field, counts in self.facets.items()}
+        snapshot.records = records
+        snapshot.features = [record.data for record in records]
+        snapshot.records_by_id = dict(self.records_by_id)
+        snapshot.positions = {record.feature_id: position for position, record in enumerate(records)}
+        snapshot.keyword_index = dict(self.keyword_index)
+        snapshot.token_index = dict(self.token_index)
+        snapshot.doc_lengths = dict(self.doc_lengths)
+        snapshot.total_doc_length = self.total_doc_length
+        # Records/index dùng chung với snapshot cũ nên vẫn đọc từ cùng catalog đã compile
+        snapshot.compiled = self.compiled
+        snapshot._owned_postings = set()
+        snapshot._init_caches()
+        
+        for record in removed:
+            del snapshot.records_by_id[record.feature_id]
+            snapshot._unindex_record(record)
+            snapshot._count_facets(record, -1)
+        for record in added:
+            snapshot.records_by_id[record.feature_id] = record
+            snapshot._index_record(record)
+            snapshot._count_facets(record, 1)
+        
+        snapshot._owned_postings = None
+        if self._trigram_index is not None:
+            snapshot._derive_search_index(self._trigram_index, added, removed)
+        # LSH không phụ thuộc thống kê toàn catalog: cập nhật incremental thay vì build lại
+        for key, index in list(self._lsh_indexes.items()):
+            snapshot._lsh_indexes[key] = index.derive(added, removed)
+        return snapshot
+    
+    def industry_matches(self, industry: str) -> frozenset:
+        """Các records có use case chứa industry; tính một lần cho mỗi industry trên snapshot"""
+        matches = self._industry_matches.get(industry)
+        if matches is None:
+            matches = frozenset(record for record in self.records if record.matches_industry(industry))
+            if len(self._industry_matches) >= MAX_CACHED_INDUSTRIES:
+                self._industry_matches = {}
+            self._industry_matches[industry] = matches
+        return matches
+    
+    @staticmethod
+    def _search_texts(record: FeatureRecord) -> List[str]:
+        """Các text (lowercase) được search_features tìm substring: name, description, keywords, pain points"""
+        data = record.data
+        return [(data.get('feature_name') or '').lower(), (data.get('description') or '').lower()] + \
+            list(record.keywords) + list(record.pain_points)
+    
+    @classmethod
+    def _record_trigrams(cls, record: FeatureRecord) -> set:
+        trigrams = set()
+        for text in cls._search_texts(record):
+            trigrams.update(text[i:i + 3] for i in range(len(text) - 2))
+        return trigrams
+    
+    def build_search_index(self) -> None:
+        """Build trigram index cho search(). KnowledgeBase gọi ở phía writer trước khi publish
+        snapshot, derive() cập nhật incremental, nên search không phải build lại cả catalog"""
+        if self._trigram_index is None:
+            with self._build_lock:
+                if self._trigram_index is None:
+                    index: Dict[str, array] = {}
+                    for record in self.records:
+                        key = id(record)
+                        for trigram in self._record_trigrams(record):
+                            postings = index.get(trigram)
+                            if postings is None:
+                                postings = index[trigram] = array('Q')
+                            postings.append(key)
+                    self._trigram_positions = {id(record): position for position, record in enumerate(self.records)}
+                    self._trigram_index = index
+    
+    def _derive_search_index(self, parent_index: Dict[str, array], added: List[FeatureRecord],
+                             removed: List[FeatureRecord]) -> None:
+        """Trigram index của snapshot derive: copy-on-write posting lists của parent và chỉ
+        cập nhật trigrams của records bị xoá/thêm. Postings giữ id(record) nên không phụ thuộc vị trí"""
+        index = dict(parent_index)
+        owned = set()
+        
+        def postings_for(trigram: str) -> array:
+            postings = index.get(trigram)
+            if postings is None:
+                postings = index[trigram] = array('Q')
+            elif trigram not in owned:
+                postings = index[trigram] = array('Q', postings)
+            owned.add(trigram)
+            return postings
+        
+        for record in removed:
+            key = id(record)
+            for trigram in self._record_trigrams(record):
+                postings = postings_for(trigram)
+                postings.remove(key)
+                if not postings:
+                    del index[trigram]
+        for record in added:
+            key = id(record)
+            for trigram in self._record_trigrams(record):
+                postings_for(trigram).append(key)
+        self._trigram_positions = {id(record): position for position, record in enumerate(self.records)}
+        self._trigram_index = index
+    
+    def get_tfidf_index(self) -> 'TfidfIndex':
+        """TF-IDF vectors của pain points addressed + description (semantic_mode='tfidf'),
+        build ở lần dùng đầu tiên. idf phụ thuộc toàn bộ catalog nên snapshot mới cần index mới:
+        KnowledgeBase build trước khi publish nếu snapshot trước đã có index"""
+        if self._tfidf_index is None:
+            with self._build_lock:
+                if self._tfidf_index is None:
+                    # Import tại chỗ: tfidf dùng tokenize/FeatureRecord của module này
+                    from tfidf import TfidfIndex
+                    self._tfidf_index = TfidfIndex(self.records)
+        return self._tfidf_index
+    
+    def get_lsh_index(self, bands: int, rows: int) -> 'MinHashLSH':
+        """Index MinHash/LSH trên pain points addressed (candidate_mode='lsh') theo (bands, rows), build ở
+        lần dùng đầu tiên; snapshot sau đó được derive() hoặc KnowledgeBase cập nhật/build trước khi publish"""
+        index = self._lsh_indexes.get((bands, rows))
+        if index is None:
+            with self._build_lock:
+                index = self._lsh_indexes.get((bands, rows))
+                if index is None:
+                    from lsh import MinHashLSH
+                    index = self._lsh_indexes[bands, rows] = MinHashLSH(self.records, bands, rows)
+        return index
+    
+    def search(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[FeatureRecord]:
+        """Records có name/description/keyword/pain point chứa query (không phân biệt hoa thường),
+        theo thứ tự catalog. Chỉ các records chứa mọi trigram của query mới được kiểm tra substring"""
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("limit and offset must be non-negative")
+        if limit == 0:
+            return []
+        query = query.lower()
+        trigrams = {query[i:i + 3] for i in range(len(query) - 2)}
+        
+        if trigrams:
+            # Thường đã được build ở phía writer; snapshot tạo trực tiếp thì build ở lần search đầu tiên
+            self.build_search_index()
+            index, record_positions = self._trigram_index, self._trigram_positions
+        if trigrams and len(record_positions) == len(self.records):
+            posting_lists = sorted((index.get(trigram, ()) for trigram in trigrams), key=len)
+            candidates = set(posting_lists[0])
+            for postings in posting_lists[1:]:
+                # Ít candidates thì kiểm tra substring trực tiếp rẻ hơn giao tiếp posting lists
+                if len(candidates) <= 16:
+                    break
+                candidates.intersection_update(postings)
+            positions: Iterable[int] = sorted(record_positions[key] for key in candidates)
+        else:
+            # Query ngắn hơn 3 ký tự (không có trigram) hoặc một record xuất hiện nhiều lần: kiểm tra toàn bộ
+            positions = range(len(self.records))
+        
+        results = []
+        for position in positions:
+            record = self.records[position]
+            if not any(query in text for text in self._search_texts(record)):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            results.append(record)
+            if len(results) == limit:
+                break
+        return results
+    
+    def get_records_by_ids(self, feature_ids: Iterable[str]) -> List[FeatureRecord]:
+        """Lấy records theo danh sách ID, sắp xếp theo thứ tự trong catalog"""
+        positions = self.positions
+        ordered_ids = sorted((fid for fid in set(feature_ids) if fid in positions), key=positions.__getitem__)
+        return [self.records_by_id[fid] for fid in ordered_ids]
+
 
 class KnowledgeBase:
     """Quản lý knowledge base của các tính năng Filum.ai"""
     
-    def __init__(self, features_file: str = "data/filum_features.json"):
+    def __init__(self, features_file: str = "data/filum_features.json",
+                 facet_fields: Tuple[str, ...] = FACET_FIELDS,
+                 record_factory: Callable[[Dict[str, Any]], FeatureRecord] = FeatureRecord,
+                 search_index: bool = True):
         self.features_file = features_file
-        self.features = self._load_features()
+        # Build trigram index của search_features khi load (tắt ở process không cần search, vd: workers)
+        self.search_index = search_index
+        self.facet_fields = tuple(facet_fields)
+        # Tạo FeatureRecord từ feature dict (vd: lấy từ pool dùng chung giữa các tenants, xem catalog_manager.py)
+        self.record_factory = record_factory
+        self._write_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+        self._file_signature = self._read_file_signature()
+        self.load_report = CatalogLoadReport(features_file)
+        if is_compiled_catalog(features_file):
+            self._snapshot = self._open_compiled(self.load_report) or CatalogSnapshot([], 0, self.facet_fields)
+        else:
+            # Parse hết file trước khi tạo records: lỗi cấu trúc giữa file thì bỏ cả catalog
+            # (như khi file không đọc được) thay vì publish phần đã parse
+            features = list(self._stream_features(self.load_report))
+            if self.load_report.fatal_error:
+                features = []
+                self.load_report.loaded = 0
+            self._snapshot = CatalogSnapshot((record_factory(feature) for feature in features), 0, self.facet_fields)
+        if search_index:
+            self._snapshot.build_search_index()
+        self._warn_load_problems(self.load_report)
+        self.last_reload_stats: Optional[Dict[str, int]] = None
+        # Các lần apply_changes đã thay đổi catalog kể từ lần load file gần nhất; worker process
+        # load lại features file rồi chạy lại theo thứ tự để có cùng catalog (xem agent._init_worker)
+        self.applied_changes: Tuple[Dict[str, Any], ...] = ()
+        # Callbacks (snapshot cũ, snapshot mới) gọi sau mỗi lần publish, trong write lock
+        self._publish_listeners: List[Callable[[CatalogSnapshot, CatalogSnapshot], None]] = []
+    
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        """Snapshot catalog hiện tại; giữ lại reference để dùng nhất quán trong một request"""
+        return self._snapshot
+    
+    # Các thuộc tính dưới đây đọc từ snapshot hiện tại
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+    
+    @property
+    def features(self) -> List[Dict[str, Any]]:
+        return self._snapshot.features
+    
+    @property
+    def records(self) -> List[FeatureRecord]:
+        return self._snapshot.records
+    
+    @property
+    def records_by_id(self) -> Dict[str, FeatureRecord]:
+        return self._snapshot.records_by_id
+    
+    @property
+    def keyword_index(self) -> Dict[str, List[str]]:
+        return self._snapshot.keyword_index
     
-    def _load_features(self) -> List[Dict[str, Any]]:
-        """Load features từ JSON file"""
+    @property
+    def token_index(self) -> Dict[str, List[Tuple[str, int]]]:
+        return self._snapshot.token_index
+    
+    def _read_file_signature(self) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) của features file, None nếu không đọc được"""
+        try:
+            stat = os.stat(self.features_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _stream_features(self, report: CatalogLoadReport) -> Iterator[Dict[str, Any]]:
+        """Stream features hợp lệ từ file (JSON array hoặc JSON Lines), lỗi ghi vào report"""
         try:
-            with open(self.features_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            yield from iter_catalog(self.features_file, report)
         except FileNotFoundError:
-            print(f"Warning: Features file {self.features_file} not found")
-            return []
-        except json.JSONDecodeError:
-            print(f"Error: Invalid JSON in {self.features_file}")
-            return []
+            report.fatal_error = f"Features file {self.features_file} not found"
+        except (OSError, UnicodeDecodeError) as e:
+            report.fatal_error = f"Cannot read {self.features_file}: {e}"
+    
+    def _open_compiled(self, report: CatalogLoadReport, version: int = 0) -> Optional[CatalogSnapshot]:
+        """Mở features file đã compile (xem compiled_catalog.py), None nếu lỗi"""
+        try:
+            snapshot = CatalogSnapshot.from_compiled(CompiledCatalog(self.features_file), version, self.facet_fields)
+        except (OSError, CompiledCatalogError) as e:
+            report.fatal_error = f"Cannot open compiled catalog {self.features_file}: {e}"
+            return None
+        report.loaded = len(snapshot.records)
+        return snapshot
+    
+    def _warn_load_problems(self, report: CatalogLoadReport) -> None:
+        """In cảnh báo nếu load catalog có lỗi"""
+        if report.fatal_error:
+            print(f"Warning: {report.fatal_error}")
+        if report.malformed_count:
+            print(f"Warning: Skipped {report.malformed_count} malformed features in {self.features_file}")
+    
+    def add_publish_listener(self, listener: Callable[[CatalogSnapshot, CatalogSnapshot], None]) -> None:
+        """Đăng ký callback(snapshot cũ, snapshot mới) được gọi mỗi khi reload/apply_changes publish version mới"""
+        self._publish_listeners.append(listener)
+    
+    def _build_indexes(self, snapshot: CatalogSnapshot, previous: CatalogSnapshot) -> None:
+        """Build trước khi publish (trong write lock) các index phụ mà snapshot trước đã có và
+        derive() chưa cập nhật, để request đầu tiên trên snapshot mới không phải build lại"""
+        if self.search_index or previous._trigram_index is not None:
+            snapshot.build_search_index()
+        for bands, rows in list(previous._lsh_indexes):
+            snapshot.get_lsh_index(bands, rows)
+        # idf phụ thuộc toàn bộ catalog nên TF-IDF index được build lại (ở writer, không phải trên request)
+        if previous._tfidf_index is not None:
+            snapshot.get_tfidf_index()
+    
+    def _publish(self, snapshot: CatalogSnapshot) -> None:
+        """Thay snapshot hiện tại bằng một phép gán (atomic với readers).
+        Catalog đã compile mà snapshot mới không còn dùng thì được đóng (unmap) khi snapshot cũ
+        được giải phóng: ngay lập tức, hoặc khi request cuối cùng còn giữ snapshot đó kết thúc"""
+        self._build_indexes(snapshot, self._snapshot)
+        old, self._snapshot = self._snapshot, snapshot
+        if old.compiled is not None and old.compiled is not snapshot.compiled:
+            weakref.finalize(old, old.compiled.close)
+        for listener in self._publish_listeners:
+            listener(old, snapshot)
+    
+    def _diff_and_build(self, features: List[Dict[str, Any]]) -> Tuple[CatalogSnapshot, Dict[str, int]]:
+        """So sánh catalog mới với snapshot hiện tại theo feature_id và build snapshot mới,
+        dùng lại records không đổi và chỉ cập nhật index của records thay đổi"""
+        current = self._snapshot
+        feature_ids = [feature.get('feature_id') if isinstance(feature, dict) else None for feature in features]
+        
+        # feature_id thiếu hoặc trùng thì không diff được, build lại toàn bộ
+        if not current.fully_indexed or not all(feature_ids) or len(set(feature_ids)) != len(feature_ids):
+            records = [self.record_factory(feature) for feature in features]
+            stats = {'added': len(records), 'updated': 0, 'removed': len(current.records), 'unchanged': 0,
+                     'full_rebuild': 1}
+            return CatalogSnapshot(records, current.version + 1, self.facet_fields), stats
+        
+        records, added, removed = [], [], []
+        updated = 0
+        for feature in features:
+            old_record = current.records_by_id.get(feature['feature_id'])
+            if old_record is not None and old_record.data == feature:
+                records.append(old_record)
+                continue
+            record = self.record_factory(feature)
+            records.append(record)
+            added.append(record)
+            if old_record is not None:
+                removed.append(old_record)
+                updated += 1
+        
+        new_ids = set(feature_ids)
+        deleted = [record for feature_id, record in current.records_by_id.items() if feature_id not in new_ids]
+        removed.extend(deleted)
+        
+        stats = {'added': len(added) - updated, 'updated': updated, 'removed': len(deleted),
+                 'unchanged': len(records) - len(added), 'full_rebuild': 0}
+        return current.derive(records, added, removed), stats
+    
+    def reload(self) -> Dict[str, int]:
+        """Đọc lại features file, cập nhật incremental theo feature_id và publish version mới.
+        Nếu file không đọc được thì giữ nguyên catalog hiện tại"""
+        with self._write_lock:
+            signature = self._read_file_signature()
+            report = CatalogLoadReport(self.features_file)
+            if is_compiled_catalog(self.features_file):
+                # Snapshot đã compile được mở lại toàn bộ (chỉ tốn mmap + build records)
+                snapshot = self._open_compiled(report, self._snapshot.version + 1)
+                features = None
+            else:
+                features = list(self._stream_features(report))
+            self._warn_load_problems(report)
+            if report.fatal_error:
+                print(f"Warning: Cannot reload {self.features_file}, keeping current catalog")
+                return {}
+            self._file_signature = signature
+            self.load_report = report
+            if features is None:
+                stats = {'added': len(snapshot.records), 'updated': 0, 'removed': len(self._snapshot.records),
+                         'unchanged': 0, 'full_rebuild': 1}
+            else:
+                snapshot, stats = self._diff_and_build(features)
+            self._publish(snapshot)
+            # Catalog quay về nội dung file nên các thay đổi trước đó không còn hiệu lực
+            self.applied_changes = ()
+            self.last_reload_stats = stats
+            return stats
+    
+    def reload_if_changed(self) -> bool:
+        """Reload nếu mtime/size của features file đã thay đổi"""
+        if self._read_file_signature() == self._file_signature:
+            return False
+        self.reload()
+        return True
+    
+    def start_watching(self, interval: float = 2.0) -> None:
+        """Chạy thread nền poll features file và hot reload khi có thay đổi"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_watching.clear()
+        
+        def watch() -> None:
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"Warning: Hot reload of {self.features_file} failed: {e}")
+        
+        self._watcher = threading.Thread(target=watch, name='kb-watcher', daemon=True)
+        self._watcher.start()
+    
+    def stop_watching(self) -> None:
+        """Dừng thread theo dõi features file"""
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+    
+    @staticmethod
+    def _validated(feature: Any) -> Dict[str, Any]:
+        """Copy feature (để caller sửa dict của mình không ảnh hưởng catalog), ValueError nếu sai schema"""
+        errors = validate_feature(feature)
+        if errors:
+            raise ValueError(f"Invalid feature: {'; '.join(errors)}")
+        return copy.deepcopy(feature)
+    
+    def apply_changes(self, add: Iterable[Dict[str, Any]] = (), update: Optional[Dict[str, Dict[str, Any]]] = None,
+                      delete: Iterable[str] = ()) -> Dict[str, int]:
+        """Thêm/sửa/xoá features lúc runtime và publish tất cả trong một version mới.
+        
+        update: feature_id -> các field thay đổi (merge vào feature hiện tại).
+        Snapshot mới được derive copy-on-write từ snapshot hiện tại nên readers đang giữ
+        snapshot cũ không bị ảnh hưởng và không cần lock. Thay đổi có lỗi (KeyError với
+        feature_id không tồn tại, ValueError với feature sai schema) thì không thay đổi gì.
+        Thay đổi chỉ nằm trong bộ nhớ: reload features file sẽ đưa catalog về nội dung file"""
+        add, delete = list(add), list(delete)
+        with self._write_lock:
+            current = self._snapshot
+            by_id = current.records_by_id
+            # feature_id -> record mới, None nếu bị xoá
+            replaced: Dict[str, Optional[FeatureRecord]] = {}
+            for feature_id in delete:
+                if feature_id not in by_id or feature_id in replaced:
+                    raise KeyError(f"Unknown feature_id: {feature_id}")
+                replaced[feature_id] = None
+            for feature_id, changes in (update or {}).items():
+                if feature_id not in by_id or feature_id in replaced:
+                    raise KeyError(f"Unknown feature_id: {feature_id}")
+                if changes.get('feature_id', feature_id) != feature_id:
+                    raise ValueError(f"Cannot change feature_id of {feature_id}")
+                feature = dict(by_id[feature_id].data)
+                feature.update(changes)
+                replaced[feature_id] = self.record_factory(self._validated(feature))
+            added: List[FeatureRecord] = []
+            for feature in add:
+                record = self.record_factory(self._validated(feature))
+                if record.feature_id in by_id or any(other.feature_id == record.feature_id for other in added):
+                    raise ValueError(f"Duplicate feature_id: {record.feature_id}")
+                added.append(record)
+        
+            stats = {'added': len(added), 'updated': sum(1 for record in replaced.values() if record is not None),
+                     'removed': sum(1 for record in replaced.values() if record is None), 'unchanged': 0,
+                     'full_rebuild': 0}
+            if not replaced and not added:
+                stats['unchanged'] = len(current.records)
+                return stats
+        
+            records = []
+            for record in current.records:
+                if record.feature_id in replaced:
+                    record = replaced[record.feature_id]
+                    if record is None:
+                        continue
+                records.append(record)
+            records.extend(added)
+            stats['unchanged'] = len(records) - stats['added'] - stats['updated']
+        
+            if current.fully_indexed:
+                new_records = [record for record in replaced.values() if record is not None] + added
+                snapshot = current.derive(records, new_records, [by_id[feature_id] for feature_id in replaced])
+            else:
+                # Có feature_id trùng thì không cập nhật incremental được
+                stats['full_rebuild'] = 1
+                snapshot = CatalogSnapshot(records, current.version + 1, self.facet_fields)
+            self._publish(snapshot)
+            self.applied_changes += (copy.deepcopy({'add': add, 'update': update or {}, 'delete': delete}),)
+            return stats
+    
+    def add_feature(self, feature: Dict[str, Any]) -> Dict[str, int]:
+        """Thêm một feature mới (feature_id chưa tồn tại)"""
+        return self.apply_changes(add=[feature])
+    
+    def update_feature(self, feature_id: str, changes: Dict[str, Any]) -> Dict[str, int]:
+        """Cập nhật các field của feature"""
+        return self.apply_changes(update={feature_id: changes})
+    
+    def delete_feature(self, feature_id: str) -> Dict[str, int]:
+        """Xoá feature theo ID"""
+        return self.apply_changes(delete=[feature_id])
     
     def get_all_features(self) -> List[Dict[str, Any]]:
         """Lấy tất cả features"""
-        return self.features
+        return self._snapshot.features
+    
+    def get_all_records(self) -> List[FeatureRecord]:
+        """Lấy tất cả features dưới dạng FeatureRecord đã compile"""
+        return self._snapshot.records
     
     def get_feature_by_id(self, feature_id: str) -> Dict[str, Any]:
         """Lấy feature theo ID"""
-        for feature in self.features:
-            if feature.get('feature_id') == feature_id:
-                return feature
-        return {}
+        record = self._snapshot.records_by_id.get(feature_id)
+        return record.data if record is not None else {}
+    
+    def get_records_by_ids(self, feature_ids: Iterable[str]) -> List[FeatureRecord]:
+        """Lấy records theo danh sách ID, sắp xếp theo thứ tự trong catalog"""
+        return self._snapshot.get_records_by_ids(feature_ids)
     
     def get_features_by_category(self, category: str) -> List[Dict[str, Any]]:
         """Lấy features theo category"""
         return [f for f in self.features if f.get('category') == category]
     
-    def get_features_by_keywords(self, keywords: List[str]) -> List[Dict[str, Any]]:
-        """Lấy features có chứa keywords"""
-        matching_features = []
-        for feature in self.features:
-            feature_keywords = feature.get('keywords', [])
-            if any(keyword.lower() in [k.lower() for k in feature_keywords] for keyword in keywords):
-                matching_features.append(feature)
-        return matching_features
-    
-    def search_features(self, query: str) -> List[Dict[str, Any]]:
-        """Tìm kiếm features theo query"""
-        query_lower = query.lower()
-        matching_features = []
-        
-        for feature in self.features:
-            # Tìm trong feature name
-            if query_lower in feature.get('feature_name', '').lower():
-                matching_features.append(feature)
-                continue
-            
-            # Tìm trong description
-            if query_lower in feature.get('description', '').lower():
-                matching_features.append(feature)
-                continue
-            
-            # Tìm trong keywords
-            keywords = feature.get('keywords', [])
-            if any(query_lower in keyword.lower() for keyword in keywords):
-                matching_features.append(feature)
-                continue
-            
-            # Tìm trong pain points addressed
-            pain_points = feature.get('pain_points_addressed', [])
-            if any(query_lower in point.lower() for point in pain_points):
-                matching_features.append(feature)
+    def get_features_by_keywords(self, keywords: List[str], match: str = 'any') -> List[Dict[str, Any]]:
+        """Lấy features có chứa keywords (match='any': ít nhất một, 'all': tất cả)"""
+        if match not in ('any', 'all'):
+            raise ValueError(f"Unknown match mode: {match}")
         
-        return matching_features
-    
-    def get_feature_statistics(self) -> Dict[str, Any]:
-        """Lấy thống kê về features"""
-        categories = {}
-        complexities = {}
+        snapshot = self._snapshot
+        posting_lists = [snapshot.keyword_index.get(keyword.lower(), []) for keyword in keywords]
+        if not posting_lists:
+            return []
         
-        for feature in self.features:
-            category = feature.get('category', 'Unknown')
-            complexity = feature.get('implementation_complexity', 'Unknown')
-            
-            categories[category] = categories.get(category, 0) + 1
-            complexities[complexity] = complexities.get(complexity, 0) + 1
+        if match == 'any':
+            feature_ids = set().union(*posting_lists)
+        else:
+            # Bắt đầu từ posting list ngắn nhất để giao nhanh hơn
+            posting_lists.sort(key=len)
+            feature_ids = set(posting_lists[0])
+            for postings in posting_lists[1:]:
+                feature_ids.intersection_update(postings)
         
+        return [record.data for record in snapshot.get_records_by_ids(feature_ids)]
+    
+    def search_features(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Tìm kiếm features theo query (substring trong name, description, keywords, pain points).
+        limit/offset để phân trang kết quả"""
+        return [record.data for record in self._snapshot.search(query, limit, offset)]
+    
+    def get_facet_counts(self, field: str) -> Dict[Any, int]:
+        """Số features theo từng giá trị của field (vd: 'subcategory', 'use_cases')"""
+        return self._snapshot.get_facet_counts(field)
+    
+    def get_feature_statistics(self) -> Dict[str, Any]:
+        """Lấy thống kê về features (đọc từ facet counts duy trì incremental, không duyệt catalog)"""
+        snapshot = self._snapshot
         return {
-            'total_features': len(self.features),
-            'categories': categories,
-            'complexities': complexities
-        } 
\ No newline at end of file
+            'total_features': len(snapshot.records),
+            'categories': snapshot.get_facet_counts('category'),
+            'complexities': snapshot.get_facet_counts('implementation_complexity'),
+            'facets': {field: snapshot.get_facet_counts(field) for field in snapshot.facet_fields},
+            'version': snapshot.version
+        }
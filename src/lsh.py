@@ -0,0 +1,162 @@
+import random
+import zlib
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from knowledge_base import FeatureRecord, tokenize
+
+# Mặc định: 20 bands x 4 rows. Một pain point addressed có Jaccard s (trên tập tokens)
+# với query trở thành candidate với xác suất 1 - (1 - s^rows)^bands (s = 0.5 -> 0.73, s = 0.7 -> 0.99):
+#   tăng bands / giảm rows -> recall cao hơn, nhiều candidates hơn (chậm hơn)
+#   giảm bands / tăng rows -> ít candidates hơn (nhanh hơn), bỏ sót nhiều hơn
+DEFAULT_LSH_BANDS = 20
+DEFAULT_LSH_ROWS = 4
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+class MinHashLSH:
+    """Index LSH trên pain points addressed của catalog: mỗi text là tập tokens (shingle = 1 token),
+    được tóm tắt bằng MinHash signature (bands * rows giá trị) rồi chia thành bands; text nào có
+    chung toàn bộ rows của một band với query thì nằm cùng bucket và thành candidate.
+    Lookup chỉ chạm vào các buckets của query nên không phụ thuộc tuyến tính vào kích thước catalog"""
+
+    def __init__(self, records: Iterable[FeatureRecord], bands: int = DEFAULT_LSH_BANDS,
+                 rows: int = DEFAULT_LSH_ROWS, seed: int = 1):
+        if bands < 1 or rows < 1:
+            raise ValueError("LSH bands and rows must be positive")
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self._permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(_MERSENNE_PRIME))
+                              for _ in range(bands * rows)]
+
+        # Tập tokens giống nhau (ở một hay nhiều features) chỉ là một document
+        self.document_features: List[Optional[List[str]]] = []
+        self.buckets: Dict[int, List[int]] = {}
+        self._documents: Dict[FrozenSet[str], int] = {}
+        # feature_id -> thứ tự thêm vào index (thứ tự trả về của candidates)
+        self._order: Dict[str, int] = {}
+        self._next_order = 0
+        # (id(container), key) đã được copy trong lúc derive; None ngoài derive
+        self._owned: Optional[set] = None
+        token_hashes: Dict[str, Tuple[int, ...]] = {}
+        for record in records:
+            # feature_id trùng chỉ lấy feature đầu tiên (giống records_by_id)
+            if not record.feature_id or record.feature_id in self._order:
+                continue
+            self._add(record, token_hashes)
+
+    def derive(self, added: Iterable[FeatureRecord], removed: Iterable[FeatureRecord]) -> 'MinHashLSH':
+        """Index mới (copy-on-write) sau khi xoá/thêm records: bands/buckets không phụ thuộc
+        thống kê toàn catalog nên chỉ documents của các records thay đổi được cập nhật.
+        Index hiện tại không bị thay đổi (snapshot cũ vẫn dùng được)"""
+        index = MinHashLSH.__new__(MinHashLSH)
+        index.bands = self.bands
+        index.rows = self.rows
+        index._permutations = self._permutations
+        index.document_features = list(self.document_features)
+        index.buckets = dict(self.buckets)
+        index._documents = dict(self._documents)
+        index._order = dict(self._order)
+        index._next_order = self._next_order
+        index._owned = set()
+        token_hashes: Dict[str, Tuple[int, ...]] = {}
+        for record in removed:
+            index._remove(record, token_hashes)
+        for record in added:
+            index._add(record, token_hashes)
+        index._owned = None
+        return index
+
+    def _own(self, container: dict, key: Any) -> list:
+        """List có thể sửa của container[key]: khi derive thì copy list dùng chung ở lần chạm đầu tiên"""
+        value = container[key]
+        if self._owned is not None and (id(container), key) not in self._owned:
+            value = container[key] = list(value)
+            self._owned.add((id(container), key))
+        return value
+
+    def _add(self, record: FeatureRecord, token_hashes: Dict[str, Tuple[int, ...]]) -> None:
+        feature_id = record.feature_id
+        self._order[feature_id] = self._next_order
+        self._next_order += 1
+        for text in record.pain_points:
+            shingles = frozenset(tokenize(text))
+            if not shingles:
+                continue
+            document = self._documents.get(shingles)
+            if document is None:
+                document = self._documents[shingles] = len(self.document_features)
+                self.document_features.append([])
+                if self._owned is not None:
+                    self._owned.add((id(self.document_features), document))
+                for key in self._band_keys(self._signature(shingles, token_hashes)):
+                    if key in self.buckets:
+                        self._own(self.buckets, key).append(document)
+                    else:
+                        self.buckets[key] = [document]
+                        if self._owned is not None:
+                            self._owned.add((id(self.buckets), key))
+            features = self.document_features[document]
+            if not features or features[-1] != feature_id:
+                self._own(self.document_features, document).append(feature_id)
+
+    def _remove(self, record: FeatureRecord, token_hashes: Dict[str, Tuple[int, ...]]) -> None:
+        feature_id = record.feature_id
+        del self._order[feature_id]
+        for text in record.pain_points:
+            shingles = frozenset(tokenize(text))
+            document = self._documents.get(shingles)
+            if document is None or feature_id not in self.document_features[document]:
+                continue
+            features = self._own(self.document_features, document)
+            features.remove(feature_id)
+            if features:
+                continue
+            # Document không còn feature nào: bỏ khỏi buckets
+            del self._documents[shingles]
+            self.document_features[document] = None
+            for key in self._band_keys(self._signature(shingles, token_hashes)):
+                bucket = self._own(self.buckets, key)
+                bucket.remove(document)
+                if not bucket:
+                    del self.buckets[key]
+
+    def _token_hash(self, token: str) -> Tuple[int, ...]:
+        """Giá trị của token dưới mỗi hàm hash (a * x + b) mod p"""
+        value = zlib.crc32(token.encode('utf-8'))
+        return tuple((a * value + b) % _MERSENNE_PRIME for a, b in self._permutations)
+
+    def _signature(self, shingles: FrozenSet[str], token_hashes: Dict[str, Tuple[int, ...]]) -> Tuple[int, ...]:
+        """MinHash signature: min theo từng hàm hash trên các tokens"""
+        vectors = []
+        for token in shingles:
+            vector = token_hashes.get(token)
+            if vector is None:
+                vector = token_hashes[token] = self._token_hash(token)
+            vectors.append(vector)
+        return tuple(map(min, zip(*vectors)))
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> Iterator[int]:
+        # Key là hash của (band, rows); va chạm hash chỉ thêm candidate thừa, không làm sai điểm
+        rows = self.rows
+        for band in range(self.bands):
+            yield hash((band, signature[band * rows:(band + 1) * rows]))
+
+    def candidates(self, text: str, min_band_matches: int = 1) -> List[str]:
+        """feature_id của các features có pain point addressed chung bucket với text ở ít nhất
+        min_band_matches bands (tăng để lọc bớt candidates có Jaccard thấp), theo thứ tự thêm vào index
+        (thứ tự catalog, trừ records được thêm/sửa bằng derive)"""
+        shingles = frozenset(tokenize(text))
+        if not shingles:
+            return []
+        matches: Dict[int, int] = {}
+        for key in self._band_keys(self._signature(shingles, {})):
+            for document in self.buckets.get(key, ()):
+                matches[document] = matches.get(document, 0) + 1
+
+        features = set()
+        for document, count in matches.items():
+            if count >= min_band_matches:
+                features.update(self.document_features[document])
+        return sorted(features, key=self._order.__getitem__)
@@ -1,116 +1,264 @@
-import re
-from typing import List, Dict, Any, Tuple
-from fuzzywuzzy import fuzz
-from knowledge_base import KnowledgeBase
+import heapq
+import math
+from operator import itemgetter
+from typing import List, Dict, Any, Tuple, Union, Optional
+from knowledge_base import (KnowledgeBase, CatalogSnapshot, FeatureRecord, tokenize,
+                            COMPANY_SIZES, BUDGET_LEVELS, URGENCY_LEVELS)
+from cache import LRUPairCache
+from similarity import DEFAULT_SIMILARITY_BACKEND, get_similarity_function
+from lsh import DEFAULT_LSH_BANDS, DEFAULT_LSH_ROWS
+
+FeatureLike = Union[Dict[str, Any], FeatureRecord]
+
+SCORING_MODES = ('fuzzy', 'bm25')
+# Semantic score: fuzzy = similarity ratio với từng pain point addressed,
+# tfidf = cosine TF-IDF (word + char n-grams) với pain points addressed và description
+SEMANTIC_MODES = ('fuzzy', 'tfidf')
+# Candidates được score: all = toàn bộ catalog (bm25: các features có chung token),
+# lsh = các features có pain point addressed gần query theo MinHash/LSH (xem lsh.py)
+CANDIDATE_MODES = ('all', 'lsh')
+
+# Stage -> method được đo khi bật profiling (xem profiling.StageProfiler)
+PROFILED_STAGES = {
+    'find_solutions': 'find_solutions',
+    'compile_query': 'compile_query',
+    'bm25': '_bm25_scores',
+    'tfidf': '_tfidf_scores',
+    'lsh': '_lsh_candidates',
+    'keyword': '_keyword_score',
+    'semantic': '_semantic_score',
+    'context': '_context_score',
+    'feasibility': '_feasibility_score',
+    'build_solution': '_build_solution',
+    'confidence': 'calculate_confidence_score'
+}
+
+class MatchQuery:
+    """Query đã compile cho một request: pain point được tokenize/lowercase
+    và business context được resolve đúng một lần, dùng lại cho mọi feature"""
+    
+    __slots__ = ('pain_point', 'pain_point_lower', 'keywords', 'business_context',
+                 'industry', 'company_size', 'budget', 'urgency', 'keyword_scores', 'catalog',
+                 'industry_matches', 'context_key', 'feasibility_key', 'semantic_scores')
+    
+    def __init__(self, pain_point: str, keywords: Tuple[str, ...], business_context: Dict[str, Any],
+                 catalog: CatalogSnapshot):
+        # Snapshot catalog cố định cho cả request, không bị ảnh hưởng khi catalog được reload
+        self.catalog = catalog
+        self.pain_point = pain_point
+        self.pain_point_lower = pain_point.lower()
+        self.keywords = keywords
+        self.business_context = business_context
+        self.industry = business_context.get('industry', '').lower()
+        self.company_size = business_context.get('company_size', '').lower()
+        self.budget = business_context.get('budget_constraints', '').lower()
+        self.urgency = business_context.get('urgency_level', '').lower()
+        # Key tra bảng context/feasibility score của feature (giá trị ngoài tập đã biết -> '')
+        self.context_key = self.company_size if self.company_size in COMPANY_SIZES else ''
+        self.feasibility_key = (self.budget if self.budget in BUDGET_LEVELS else '',
+                                self.urgency if self.urgency in URGENCY_LEVELS else '')
+        self.industry_matches = catalog.industry_matches(self.industry) if self.industry else frozenset()
+        # Điểm keyword theo feature_id, chỉ dùng ở mode bm25
+        self.keyword_scores: Optional[Dict[str, float]] = None
+        # Điểm semantic theo feature_id, chỉ dùng ở semantic mode tfidf
+        self.semantic_scores: Optional[Dict[str, float]] = None
 
 class PainPointMatcher:
     """Thực hiện matching giữa pain points và Filum.ai features"""
     
-    def __init__(self, knowledge_base: KnowledgeBase):
+    def __init__(self, knowledge_base: KnowledgeBase, scoring_mode: str = 'fuzzy',
+                 bm25_k1: float = 1.5, bm25_b: float = 0.75,
+                 token_cache_size: int = 100000, phrase_cache_size: int = 10000,
+                 similarity_backend: str = DEFAULT_SIMILARITY_BACKEND, semantic_mode: str = 'fuzzy',
+                 candidate_mode: str = 'all', lsh_bands: int = DEFAULT_LSH_BANDS, lsh_rows: int = DEFAULT_LSH_ROWS,
+                 lsh_min_band_matches: int = 1):
+        if scoring_mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {scoring_mode}")
+        if semantic_mode not in SEMANTIC_MODES:
+            raise ValueError(f"Unknown semantic mode: {semantic_mode}")
+        if candidate_mode not in CANDIDATE_MODES:
+            raise ValueError(f"Unknown candidate mode: {candidate_mode}")
         self.kb = knowledge_base
+        self.scoring_mode = scoring_mode
+        self.semantic_mode = semantic_mode
+        if semantic_mode == 'tfidf':
+            # Build TF-IDF index ngay để request đầu tiên không phải chờ
+            knowledge_base.snapshot.get_tfidf_index()
+        # LSH: recall/latency điều chỉnh qua bands, rows và số bands tối thiểu phải trùng
+        self.candidate_mode = candidate_mode
+        self.lsh_bands = lsh_bands
+        self.lsh_rows = lsh_rows
+        self.lsh_min_band_matches = lsh_min_band_matches
+        if candidate_mode == 'lsh':
+            knowledge_base.snapshot.get_lsh_index(lsh_bands, lsh_rows)
+        self.bm25_k1 = bm25_k1
+        self.bm25_b = bm25_b
+        # Hàm similarity 0..100 dùng cho keyword/semantic score (xem similarity.py)
+        self.similarity_backend = similarity_backend
+        ratio = get_similarity_function(similarity_backend)
         
-    def extract_keywords(self, text: str) -> List[str]:
-        """Trích xuất keywords từ text"""
-        # Loại bỏ các từ không quan trọng
-        stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'can', 'this', 'that', 'these', 'those', 'we', 'our', 'us', 'they', 'them', 'their'}
+        # Cache LRU similarity theo cặp token / cặp phrase (size 0 = tắt cache); gọi cho mọi cặp
+        # keyword trong vòng lặp scoring nên dùng lru_cache (C) thay vì LRUCache có lock
+        self.token_cache = LRUPairCache(ratio, token_cache_size) if token_cache_size > 0 else None
+        self.phrase_cache = LRUPairCache(ratio, phrase_cache_size) if phrase_cache_size > 0 else None
+        self._token_ratio = self.token_cache.lookup if self.token_cache is not None else ratio
+        self._phrase_ratio = self.phrase_cache.lookup if self.phrase_cache is not None else ratio
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Thống kê hits/misses/evictions của các similarity cache"""
+        return {
+            'token_similarity': self.token_cache.stats() if self.token_cache is not None else None,
+            'phrase_similarity': self.phrase_cache.stats() if self.phrase_cache is not None else None
+        }
+    
+    def clear_caches(self) -> None:
+        """Xoá các similarity cache"""
+        for cache in (self.token_cache, self.phrase_cache):
+            if cache is not None:
+                cache.clear()
         
-        # Tách từ và loại bỏ punctuation
-        words = re.findall(r'\b\w+\b', text.lower())
+    def extract_keywords(self, text: str) -> List[str]:
+        """Trích xuất keywords từ text (bỏ punctuation, stop words và từ ngắn)"""
+        return tokenize(text)
+    
+    def compile_query(self, pain_point: str, business_context: Dict[str, Any] = None,
+                      catalog: Optional[CatalogSnapshot] = None) -> MatchQuery:
+        """Compile pain point + business context thành MatchQuery trên snapshot catalog hiện tại"""
+        if business_context is None:
+            business_context = {}
+        if catalog is None:
+            catalog = self.kb.snapshot
+        query = MatchQuery(pain_point, tuple(self.extract_keywords(pain_point)), business_context, catalog)
+        if self.scoring_mode == 'bm25':
+            query.keyword_scores = self._bm25_scores(query.keywords, catalog)
+        if self.semantic_mode == 'tfidf':
+            query.semantic_scores = self._tfidf_scores(pain_point, catalog)
+        return query
+    
+    def _bm25_scores(self, keywords: Tuple[str, ...], catalog: CatalogSnapshot) -> Dict[str, float]:
+        """Tính BM25 qua inverted index, chỉ chạm vào features có chung token với query.
+        Điểm được chuẩn hoá về [0, 1) bằng tổng idf * (k1 + 1) của các token có trong index"""
+        token_index = catalog.token_index
+        doc_lengths = catalog.doc_lengths
+        avg_doc_length = catalog.avg_doc_length or 1.0
+        document_count = len(doc_lengths)
+        k1, b = self.bm25_k1, self.bm25_b
         
-        # Loại bỏ stop words và từ ngắn
-        keywords = [word for word in words if word not in stop_words and len(word) > 2]
+        scores: Dict[str, float] = {}
+        max_score = 0.0
+        for token in dict.fromkeys(keywords):
+            postings = token_index.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            max_score += idf * (k1 + 1)
+            for feature_id, term_frequency in postings:
+                length_norm = k1 * (1 - b + b * doc_lengths[feature_id] / avg_doc_length)
+                scores[feature_id] = scores.get(feature_id, 0.0) + \
+                    idf * term_frequency * (k1 + 1) / (term_frequency + length_norm)
         
-        return keywords
+        if max_score > 0:
+            for feature_id in scores:
+                scores[feature_id] /= max_score
+        return scores
+    
+    def _tfidf_scores(self, pain_point: str, catalog: CatalogSnapshot) -> Dict[str, float]:
+        """Cosine TF-IDF của pain point với mọi feature bằng một sparse dot product"""
+        return catalog.get_tfidf_index().feature_scores(pain_point)
     
-    def calculate_keyword_score(self, pain_point: str, feature: Dict[str, Any]) -> float:
+    def _lsh_candidates(self, pain_point: str, catalog: CatalogSnapshot) -> List[FeatureRecord]:
+        """Features có pain point addressed gần pain point theo LSH, theo thứ tự catalog"""
+        index = catalog.get_lsh_index(self.lsh_bands, self.lsh_rows)
+        return catalog.get_records_by_ids(index.candidates(pain_point, self.lsh_min_band_matches))
+    
+    @staticmethod
+    def _as_record(feature: FeatureLike) -> FeatureRecord:
+        """Chấp nhận cả dict thô lẫn FeatureRecord đã compile"""
+        if isinstance(feature, FeatureRecord):
+            return feature
+        return FeatureRecord(feature)
+    
+    def _compile_for(self, pain_point: str, business_context: Optional[Dict[str, Any]],
+                     feature: FeatureLike) -> Tuple[MatchQuery, FeatureRecord]:
+        """Query + record cho các API tính điểm một feature riêng lẻ"""
+        record = self._as_record(feature)
+        query = self.compile_query(pain_point, business_context)
+        if query.catalog.records_by_id.get(record.feature_id) is not record:
+            # Feature ngoài catalog không có trong bảng industry / TF-IDF index của snapshot
+            if query.industry:
+                query.industry_matches = frozenset([record]) if record.matches_industry(query.industry) else frozenset()
+            if query.semantic_scores is not None:
+                query.semantic_scores = {
+                    record.feature_id: query.catalog.get_tfidf_index().similarity(pain_point, record)}
+        return query, record
+    
+    def calculate_keyword_score(self, pain_point: str, feature: FeatureLike) -> float:
         """Tính điểm keyword matching"""
-        pain_keywords = self.extract_keywords(pain_point)
-        feature_keywords = feature.get('keywords', [])
+        return self._keyword_score(*self._compile_for(pain_point, None, feature))
+    
+    def calculate_semantic_score(self, pain_point: str, feature: FeatureLike) -> float:
+        """Tính điểm semantic similarity"""
+        return self._semantic_score(*self._compile_for(pain_point, None, feature))
+    
+    def calculate_context_score(self, business_context: Dict[str, Any], feature: FeatureLike) -> float:
+        """Tính điểm context relevance"""
+        return self._context_score(*self._compile_for('', business_context, feature))
+    
+    def calculate_feasibility_score(self, business_context: Dict[str, Any], feature: FeatureLike) -> float:
+        """Tính điểm implementation feasibility"""
+        return self._feasibility_score(*self._compile_for('', business_context, feature))
+    
+    def calculate_relevance_score(self, pain_point: str, business_context: Dict[str, Any], feature: FeatureLike) -> float:
+        """Tính điểm relevance tổng hợp"""
+        return self._relevance_score(*self._compile_for(pain_point, business_context, feature))
+    
+    def _keyword_score(self, query: MatchQuery, record: FeatureRecord) -> float:
+        """Keyword matching trên query đã compile"""
+        pain_keywords = query.keywords
+        feature_keywords = record.keywords
         
         if not pain_keywords or not feature_keywords:
             return 0.0
         
         # Tính similarity cho từng keyword
+        ratio = self._token_ratio
         total_score = 0
         for pain_keyword in pain_keywords:
-            max_similarity = 0
-            for feature_keyword in feature_keywords:
-                similarity = fuzz.ratio(pain_keyword.lower(), feature_keyword.lower()) / 100.0
-                max_similarity = max(max_similarity, similarity)
-            total_score += max_similarity
+            total_score += max(ratio(pain_keyword, feature_keyword) for feature_keyword in feature_keywords) / 100.0
         
         return total_score / len(pain_keywords)
     
-    def calculate_semantic_score(self, pain_point: str, feature: Dict[str, Any]) -> float:
-        """Tính điểm semantic similarity"""
-        # So sánh với pain points addressed
-        pain_points_addressed = feature.get('pain_points_addressed', [])
+    def _semantic_score(self, query: MatchQuery, record: FeatureRecord) -> float:
+        """Semantic similarity với pain points addressed"""
+        if query.semantic_scores is not None:
+            return query.semantic_scores.get(record.feature_id, 0.0)
+        pain_point_lower = query.pain_point_lower
+        ratio = self._phrase_ratio
         max_similarity = 0
         
-        for addressed_point in pain_points_addressed:
-            similarity = fuzz.ratio(pain_point.lower(), addressed_point.lower()) / 100.0
+        for addressed_point in record.pain_points:
+            similarity = ratio(pain_point_lower, addressed_point) / 100.0
             max_similarity = max(max_similarity, similarity)
         
         return max_similarity
     
-    def calculate_context_score(self, business_context: Dict[str, Any], feature: Dict[str, Any]) -> float:
-        """Tính điểm context relevance"""
-        score = 0.5  # Base score
-        
-        # Kiểm tra industry relevance
-        industry = business_context.get('industry', '').lower()
-        use_cases = [case.lower() for case in feature.get('use_cases', [])]
-        
-        if industry and any(industry in case for case in use_cases):
-            score += 0.3
-        
-        # Kiểm tra company size vs implementation complexity
-        company_size = business_context.get('company_size', '').lower()
-        complexity = feature.get('implementation_complexity', '').lower()
-        
-        if company_size == 'small' and complexity == 'low':
-            score += 0.2
-        elif company_size == 'medium' and complexity in ['low', 'medium']:
-            score += 0.2
-        elif company_size == 'large' and complexity in ['medium', 'high']:
-            score += 0.2
-        
-        return min(score, 1.0)
+    def _context_score(self, query: MatchQuery, record: FeatureRecord) -> float:
+        """Context relevance: tra bảng tính sẵn theo (company size, industry match) của feature"""
+        return record.context_scores[query.context_key, record in query.industry_matches]
     
-    def calculate_feasibility_score(self, business_context: Dict[str, Any], feature: Dict[str, Any]) -> float:
-        """Tính điểm implementation feasibility"""
-        score = 0.5  # Base score
-        
-        # Kiểm tra budget constraints
-        budget = business_context.get('budget_constraints', '').lower()
-        complexity = feature.get('implementation_complexity', '').lower()
-        
-        if budget == 'low' and complexity == 'low':
-            score += 0.3
-        elif budget == 'moderate' and complexity in ['low', 'medium']:
-            score += 0.3
-        elif budget == 'high' and complexity in ['medium', 'high']:
-            score += 0.3
-        elif budget == 'flexible':
-            score += 0.2
-        
-        # Kiểm tra urgency
-        urgency = business_context.get('urgency_level', '').lower()
-        time_to_value = feature.get('time_to_value', '')
-        
-        if urgency == 'high' and '1-2 weeks' in time_to_value:
-            score += 0.2
-        elif urgency == 'medium' and '2-4 weeks' in time_to_value:
-            score += 0.2
-        
-        return min(score, 1.0)
+    def _feasibility_score(self, query: MatchQuery, record: FeatureRecord) -> float:
+        """Implementation feasibility: tra bảng tính sẵn theo (budget, urgency) của feature"""
+        return record.feasibility_scores[query.feasibility_key]
     
-    def calculate_relevance_score(self, pain_point: str, business_context: Dict[str, Any], feature: Dict[str, Any]) -> float:
-        """Tính điểm relevance tổng hợp"""
-        keyword_score = self.calculate_keyword_score(pain_point, feature)
-        semantic_score = self.calculate_semantic_score(pain_point, feature)
-        context_score = self.calculate_context_score(business_context, feature)
-        feasibility_score = self.calculate_feasibility_score(business_context, feature)
+    def _relevance_score(self, query: MatchQuery, record: FeatureRecord) -> float:
+        """Relevance tổng hợp trên query đã compile"""
+        if query.keyword_scores is not None:
+            keyword_score = query.keyword_scores.get(record.feature_id, 0.0)
+        else:
+            keyword_score = self._keyword_score(query, record)
+        semantic_score = self._semantic_score(query, record)
+        context_score = self._context_score(query, record)
+        feasibility_score = self._feasibility_score(query, record)
         
         # Weighted scoring
         relevance_score = (keyword_score * 0.4) + \
@@ -120,46 +268,95 @@ class PainPointMatcher:
         
         return min(relevance_score, 1.0)
     
-    def find_solutions(self, pain_point: str, business_context: Dict[str, Any] = None, max_results: int = 3) -> List[Dict[str, Any]]:
-        """Tìm solutions cho pain point"""
-        if business_context is None:
-            business_context = {}
+    def find_solutions(self, pain_point: str, business_context: Dict[str, Any] = None, max_results: int = 3,
+                       exhaustive: bool = False) -> List[Dict[str, Any]]:
+        """Tìm solutions cho pain point.
+        Mặc định dùng top-k có pruning; exhaustive=True score toàn bộ để đối chiếu (kết quả giống hệt)"""
+        query = self.compile_query(pain_point, business_context)
         
-        all_features = self.kb.get_all_features()
-        scored_features = []
-        
-        for feature in all_features:
-            relevance_score = self.calculate_relevance_score(pain_point, business_context, feature)
-            
-            if relevance_score > 0.1:  # Chỉ lấy những features có relevance > 10%
-                scored_features.append({
-                    'feature': feature,
-                    'relevance_score': relevance_score
-                })
+        # Mode lsh chỉ score (chính xác) các candidates của LSH index;
+        # mode bm25 chỉ score các features nằm trong posting lists của query
+        if self.candidate_mode == 'lsh':
+            candidates = self._lsh_candidates(pain_point, query.catalog)
+        elif query.keyword_scores is not None:
+            candidates = query.catalog.get_records_by_ids(query.keyword_scores)
+        else:
+            candidates = query.catalog.records
         
-        # Sắp xếp theo relevance score
-        scored_features.sort(key=lambda x: x['relevance_score'], reverse=True)
+        if exhaustive or max_results <= 0:
+            top_features = self._rank_exhaustive(query, candidates)[:max_results]
+        else:
+            top_features = self._rank_top_k(query, candidates, max_results)
         
         # Trả về top results
-        results = []
-        for item in scored_features[:max_results]:
-            feature = item['feature']
-            relevance_score = item['relevance_score']
+        return [self._build_solution(pain_point, record, score)
+                for score, record in top_features]
+    
+    def _rank_exhaustive(self, query: MatchQuery, candidates: List[FeatureRecord]) -> List[Tuple[float, FeatureRecord]]:
+        """Score toàn bộ candidates, trả về (score, record) đã sắp xếp giảm dần"""
+        relevance_score = self._relevance_score
+        
+        # Chỉ giữ (score, record) cho những features có relevance > 10%
+        scored_features = []
+        for record in candidates:
+            score = relevance_score(query, record)
+            if score > 0.1:
+                scored_features.append((score, record))
+        
+        # Sắp xếp theo relevance score (stable: giữ thứ tự catalog khi bằng điểm)
+        scored_features.sort(key=itemgetter(0), reverse=True)
+        return scored_features
+    
+    def _rank_top_k(self, query: MatchQuery, candidates: List[FeatureRecord], k: int) -> List[Tuple[float, FeatureRecord]]:
+        """Top-k bằng heap có giới hạn và upper bound.
+        Context/feasibility rẻ nên tính trước; keyword/semantic (fuzzy) bị bỏ qua khi
+        upper bound (thay điểm chưa tính bằng 1.0) không thể vượt phần tử thứ k.
+        Feature đến sau thua khi bằng điểm, nên kết quả giống hệt _rank_exhaustive"""
+        keyword_scores = query.keyword_scores
+        heap: List[Tuple[float, int, FeatureRecord]] = []  # (score, -position, record)
+        
+        for position, record in enumerate(candidates):
+            context_part = self._context_score(query, record) * 0.15
+            feasibility_part = self._feasibility_score(query, record) * 0.1
+            threshold = heap[0][0] if len(heap) >= k else 0.1
             
-            solution = {
-                'feature_name': feature.get('feature_name', ''),
-                'category': f"{feature.get('category', '')} - {feature.get('subcategory', '')}",
-                'description': feature.get('description', ''),
-                'relevance_score': round(relevance_score, 2),
-                'how_it_helps': self._generate_how_it_helps(pain_point, feature),
-                'implementation_steps': feature.get('integration_requirements', []),
-                'estimated_impact': self._get_estimated_impact(feature),
-                'time_to_implement': feature.get('time_to_value', '')
-            }
+            # Phép cộng đơn điệu nên upper bound luôn >= điểm thật
+            if min((1.0 * 0.4) + (1.0 * 0.35) + context_part + feasibility_part, 1.0) <= threshold:
+                continue
             
-            results.append(solution)
+            if keyword_scores is not None:
+                keyword_score = keyword_scores.get(record.feature_id, 0.0)
+            else:
+                keyword_score = self._keyword_score(query, record)
+            if min((keyword_score * 0.4) + (1.0 * 0.35) + context_part + feasibility_part, 1.0) <= threshold:
+                continue
+            
+            semantic_score = self._semantic_score(query, record)
+            score = min((keyword_score * 0.4) + (semantic_score * 0.35) + context_part + feasibility_part, 1.0)
+            if score <= threshold:
+                continue
+            
+            if len(heap) >= k:
+                heapq.heapreplace(heap, (score, -position, record))
+            else:
+                heapq.heappush(heap, (score, -position, record))
         
-        return results
+        heap.sort(key=itemgetter(0, 1), reverse=True)
+        return [(score, record) for score, _, record in heap]
+    
+    def _build_solution(self, pain_point: str, record: FeatureRecord, relevance_score: float) -> Dict[str, Any]:
+        """Tạo solution output cho một feature"""
+        feature = record.data
+        return {
+            'feature_name': feature.get('feature_name', ''),
+            'category': f"{feature.get('category', '')} - {feature.get('subcategory', '')}",
+            'description': feature.get('description', ''),
+            'relevance_score': round(relevance_score, 2),
+            'how_it_helps': self._generate_how_it_helps(pain_point, feature),
+            'implementation_steps': feature.get('integration_requirements', []),
+            'estimated_impact': self._get_estimated_impact(feature),
+            'time_to_implement': feature.get('time_to_value', '')
+        }
     
     def _generate_how_it_helps(self, pain_point: str, feature: Dict[str, Any]) -> str:
         """Tạo mô tả how it helps"""
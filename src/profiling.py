@@ -0,0 +1,124 @@
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+# Stage -> [tổng thời gian (giây), số lần gọi]
+StageTimes = Dict[str, List[float]]
+
+
+class StageProfiler:
+    """Đo wall time và số lần gọi theo stage, cho từng request và cộng dồn.
+
+    Instrument bằng cách gán wrapper đè lên method của instance (xem instrument());
+    khi tắt thì xoá wrapper nên code path trở lại đúng như cũ, không tốn chi phí.
+    Stage lồng nhau được tính gộp (vd: find_solutions bao gồm keyword/semantic...)"""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.totals: StageTimes = {}
+        self.last_request: StageTimes = {}
+
+    def record(self, stage: str, elapsed: float) -> None:
+        current = getattr(self._local, 'current', None)
+        if current is None:
+            # Gọi ngoài request (vd: gọi thẳng matcher): không thuộc report nào nên bỏ qua
+            return
+        entry = current.get(stage)
+        if entry is None:
+            current[stage] = [elapsed, 1]
+        else:
+            entry[0] += elapsed
+            entry[1] += 1
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        """Bọc function để ghi thời gian vào stage"""
+        clock = self._clock
+        record = self.record
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, clock() - start)
+
+        return timed
+
+    def wrap_request(self, stage: str, function: Callable) -> Callable:
+        """Bọc entry point của một request: các stage bên trong được gom lại theo request"""
+        clock = self._clock
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            outer = getattr(self._local, 'current', None)
+            self._local.current = {}
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, clock() - start)
+                self._finish_request(self._local.current)
+                self._local.current = outer
+
+        return timed
+
+    def _finish_request(self, stages: StageTimes) -> None:
+        with self._lock:
+            self.requests += 1
+            self.last_request = stages
+            for stage, (elapsed, calls) in stages.items():
+                entry = self.totals.setdefault(stage, [0.0, 0])
+                entry[0] += elapsed
+                entry[1] += calls
+
+    def reset(self) -> None:
+        """Xoá số liệu đã thu thập"""
+        with self._lock:
+            self.requests = 0
+            self.totals = {}
+            self.last_request = {}
+
+    @staticmethod
+    def _format(stages: StageTimes, requests: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        report = {}
+        for stage, (elapsed, calls) in sorted(stages.items(), key=lambda item: -item[1][0]):
+            report[stage] = {
+                'calls': int(calls),
+                'total_ms': elapsed * 1000.0,
+                'mean_ms': elapsed * 1000.0 / calls if calls else 0.0
+            }
+            if requests:
+                report[stage]['per_request_ms'] = elapsed * 1000.0 / requests
+        return report
+
+    def report(self) -> Dict[str, Any]:
+        """Số liệu theo stage (sắp xếp theo tổng thời gian giảm dần)"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'stages': self._format(self.totals, self.requests),
+                'last_request': self._format(self.last_request)
+            }
+
+
+def instrument(target: Any, stages: Dict[str, str], profiler: StageProfiler,
+               request_stage: Optional[str] = None) -> None:
+    """Gán wrapper đo thời gian cho các method của target (stage -> tên method).
+    request_stage: tên stage của method đánh dấu ranh giới một request"""
+    for stage, method_name in stages.items():
+        method = getattr(type(target), method_name).__get__(target)
+        if stage == request_stage:
+            setattr(target, method_name, profiler.wrap_request(stage, method))
+        else:
+            setattr(target, method_name, profiler.wrap(stage, method))
+
+
+def uninstrument(target: Any, stages: Dict[str, str]) -> None:
+    """Bỏ các wrapper, method trở lại implementation gốc của class"""
+    for method_name in stages.values():
+        target.__dict__.pop(method_name, None)
@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent import PainPointToSolutionAgent
+from benchmark import _git_commit, latency_summary
+from lsh import DEFAULT_LSH_BANDS, DEFAULT_LSH_ROWS
+from matcher import SCORING_MODES, SEMANTIC_MODES, CANDIDATE_MODES
+from similarity import DEFAULT_SIMILARITY_BACKEND, SIMILARITY_BACKENDS
+from utils import open_text_stream
+
+REGRESSION_FORMAT_VERSION = 1
+QUALITY_METRICS = ('ndcg_at_k', 'recall_at_k', 'top1_accuracy')
+LATENCY_METRICS = ('p50', 'p95')
+
+LabelledCase = Tuple[Dict[str, Any], List[str]]
+
+
+def _load_records(path: str) -> List[Any]:
+    """Đọc JSON array hoặc JSON Lines (có thể gzip)"""
+    with open_text_stream(path, 'r') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def load_labelled_set(inputs_path: str, outputs_path: str) -> List[LabelledCase]:
+    """Ghép inputs với outputs mong đợi (cùng format examples/, theo thứ tự):
+    trả về (input, feature_names mong đợi theo thứ tự xếp hạng)"""
+    inputs, outputs = _load_records(inputs_path), _load_records(outputs_path)
+    if len(inputs) != len(outputs):
+        raise ValueError(f"{inputs_path} has {len(inputs)} inputs but {outputs_path} has {len(outputs)} outputs")
+    return [(input_data, [solution['feature_name'] for solution in output.get('suggested_solutions', [])])
+            for input_data, output in zip(inputs, outputs)]
+
+
+def resolve_feature_names(expected: Sequence[str], catalog_names: Sequence[str]) -> Tuple[List[str], List[str]]:
+    """Map feature_name mong đợi sang tên trong catalog: khớp chính xác, không phân biệt hoa thường,
+    rồi tới tên catalog duy nhất chứa (hoặc nằm trong) tên mong đợi. Trả về (tên đã map, tên không map được)"""
+    by_lower = {name.lower(): name for name in catalog_names}
+    resolved, unresolved = [], []
+    for name in expected:
+        lowered = name.lower().strip()
+        match = by_lower.get(lowered)
+        if match is None:
+            candidates = [catalog_name for catalog_lower, catalog_name in by_lower.items()
+                          if catalog_lower in lowered or lowered in catalog_lower]
+            match = candidates[0] if len(candidates) == 1 else None
+        if match is None:
+            unresolved.append(name)
+        elif match not in resolved:
+            resolved.append(match)
+    return resolved, unresolved
+
+
+def ndcg_at_k(expected: Sequence[str], returned: Sequence[str], k: int) -> float:
+    """nDCG@k với relevance theo thứ tự mong đợi: feature thứ i (từ 0) trong n features có relevance n - i"""
+    relevance = {name: len(expected) - position for position, name in enumerate(expected)}
+    dcg = sum(relevance.get(name, 0) / math.log2(rank + 2) for rank, name in enumerate(returned[:k]))
+    ideal = sum(value / math.log2(rank + 2)
+                for rank, value in enumerate(sorted(relevance.values(), reverse=True)[:k]))
+    return dcg / ideal if ideal else 0.0
+
+
+def recall_at_k(expected: Sequence[str], returned: Sequence[str], k: int) -> float:
+    """Tỉ lệ features mong đợi nằm trong top k"""
+    if not expected:
+        return 0.0
+    return len(set(expected) & set(returned[:k])) / len(expected)
+
+
+def dataset_digest(cases: Sequence[LabelledCase]) -> str:
+    """Hash của labelled set, để chỉ so sánh với baseline chạy trên cùng dữ liệu"""
+    canonical = json.dumps(cases, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def evaluate(agent: PainPointToSolutionAgent, cases: Sequence[LabelledCase], k: int = 3,
+             repeat: int = 3) -> Dict[str, Any]:
+    """Chạy labelled set qua agent: chất lượng xếp hạng (nDCG@k, recall@k, top-1) so với features
+    mong đợi và latency process_input của từng query (median của repeat lần chạy, mỗi lần cache rỗng,
+    sau một lần chạy warm-up). Query không có feature mong đợi chỉ được tính latency"""
+    if k < 1 or repeat < 1:
+        raise ValueError("k and repeat must be >= 1")
+    catalog_names = [feature.get('feature_name', '') for feature in agent.knowledge_base.snapshot.features]
+    inputs = [input_data for input_data, _ in cases]
+
+    for input_data in inputs:
+        agent.process_input(input_data)
+    timings: List[List[float]] = [[] for _ in inputs]
+    returned: List[List[str]] = []
+    for _ in range(repeat):
+        agent.matcher.clear_caches()
+        agent.clear_result_cache()
+        for position, input_data in enumerate(inputs):
+            start = time.perf_counter()
+            result = agent.process_input(input_data)
+            timings[position].append(time.perf_counter() - start)
+            if len(returned) < len(inputs):
+                returned.append([solution['feature_name'] for solution in result.get('suggested_solutions', [])])
+
+    queries, unresolved_names = [], []
+    totals = {metric: 0.0 for metric in QUALITY_METRICS}
+    labelled = 0
+    for position, ((input_data, expected_names), names) in enumerate(zip(cases, returned)):
+        expected, unresolved = resolve_feature_names(expected_names, catalog_names)
+        unresolved_names.extend(name for name in unresolved if name not in unresolved_names)
+        query = {
+            'index': position,
+            'pain_point': input_data.get('pain_point') if isinstance(input_data, dict) else None,
+            'expected': expected,
+            'returned': names[:k],
+            'latency_ms': statistics.median(timings[position]) * 1000.0
+        }
+        if expected:
+            labelled += 1
+            query.update(ndcg_at_k=ndcg_at_k(expected, names, k), recall_at_k=recall_at_k(expected, names, k),
+                         top1_accuracy=float(bool(names) and names[0] == expected[0]))
+            for metric in QUALITY_METRICS:
+                totals[metric] += query[metric]
+        queries.append(query)
+
+    return {
+        'format_version': REGRESSION_FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': dict(agent.agent_options, k=k, repeat=repeat),
+        'dataset': {'queries': len(cases), 'labelled_queries': labelled, 'digest': dataset_digest(cases)},
+        'quality': {metric: totals[metric] / labelled if labelled else 0.0 for metric in QUALITY_METRICS},
+        'latency_ms': latency_summary([statistics.median(samples) for samples in timings]),
+        'unresolved_feature_names': unresolved_names,
+        'queries': queries
+    }
+
+
+def compare_to_baseline(baseline: Dict[str, Any], current: Dict[str, Any], max_quality_drop: float = 0.01,
+                        max_latency_increase: float = 0.5, min_latency_delta_ms: float = 1.0) -> Dict[str, Any]:
+    """So sánh report với baseline (phải cùng labelled set và k).
+    Regression khi một metric chất lượng giảm quá max_quality_drop (tuyệt đối), hoặc latency p50/p95
+    tăng quá max_latency_increase (tỉ lệ) và quá min_latency_delta_ms (bỏ qua nhiễu ở query rất nhanh).
+    Kèm danh sách queries có top k thay đổi"""
+    if baseline['dataset']['digest'] != current['dataset']['digest']:
+        raise ValueError("Baseline was recorded on a different labelled set")
+    if baseline['config'].get('k') != current['config'].get('k'):
+        raise ValueError(f"Baseline was recorded with k={baseline['config'].get('k')}")
+
+    metrics, regressions = [], []
+    for metric in QUALITY_METRICS:
+        old, new = baseline['quality'][metric], current['quality'][metric]
+        row = {'metric': f"quality.{metric}", 'baseline': old, 'current': new, 'delta': new - old}
+        metrics.append(row)
+        if old - new > max_quality_drop:
+            regressions.append(row)
+    for metric in LATENCY_METRICS:
+        old, new = baseline['latency_ms'][metric], current['latency_ms'][metric]
+        row = {'metric': f"latency_ms.{metric}", 'baseline': old, 'current': new, 'delta': new - old,
+               'ratio': new / old if old else None}
+        metrics.append(row)
+        if new > old * (1 + max_latency_increase) and new - old > min_latency_delta_ms:
+            regressions.append(row)
+
+    changed = [{'index': new['index'], 'pain_point': new['pain_point'],
+                'baseline': old['returned'], 'current': new['returned']}
+               for old, new in zip(baseline['queries'], current['queries']) if old['returned'] != new['returned']]
+    return {'metrics': metrics, 'regressions': regressions, 'changed_rankings': changed}
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    quality, latency = report['quality'], report['latency_ms']
+    print(f"{report['dataset']['labelled_queries']}/{report['dataset']['queries']} labelled queries: "
+          f"nDCG@{report['config']['k']} {quality['ndcg_at_k']:.3f}, recall@{report['config']['k']} "
+          f"{quality['recall_at_k']:.3f}, top-1 {quality['top1_accuracy']:.3f}, "
+          f"p50 {latency['p50']:.2f}ms, p95 {latency['p95']:.2f}ms", file=sys.stderr)
+    if report['unresolved_feature_names']:
+        print(f"Expected feature names not in catalog: {report['unresolved_feature_names']}", file=sys.stderr)
+
+
+def main(argv=None) -> int:
+    """Chạy labelled set, so sánh với baseline; exit code 1 nếu chất lượng hoặc latency bị regression"""
+    parser = argparse.ArgumentParser(description="Pain Point to Solution Agent - ranking quality/latency regression")
+    parser.add_argument('--inputs', default='examples/input_examples.json', help='JSON array hoặc JSON Lines inputs')
+    parser.add_argument('--outputs', default='examples/output_examples.json', help='Outputs mong đợi, cùng thứ tự')
+    parser.add_argument('--features-file', default='data/filum_features.json')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần đo latency mỗi query (lấy median)')
+    parser.add_argument('--scoring-mode', default='fuzzy', choices=SCORING_MODES)
+    parser.add_argument('--similarity-backend', default=DEFAULT_SIMILARITY_BACKEND, choices=list(SIMILARITY_BACKENDS))
+    parser.add_argument('--semantic-mode', default='fuzzy', choices=SEMANTIC_MODES)
+    parser.add_argument('--candidate-mode', default='all', choices=CANDIDATE_MODES)
+    parser.add_argument('--lsh-bands', type=int, default=DEFAULT_LSH_BANDS)
+    parser.add_argument('--lsh-rows', type=int, default=DEFAULT_LSH_ROWS)
+    parser.add_argument('--baseline', default=None, help='File report baseline để so sánh')
+    parser.add_argument('--update-baseline', action='store_true', help='Ghi report hiện tại vào --baseline')
+    parser.add_argument('--max-quality-drop', type=float, default=0.01)
+    parser.add_argument('--max-latency-increase', type=float, default=0.5, help='Tỉ lệ, 0.5 = chậm hơn 50%%')
+    parser.add_argument('--min-latency-delta-ms', type=float, default=1.0)
+    parser.add_argument('--output', '-o', default=None, help="File JSON report, '-' = stdout")
+    args = parser.parse_args(argv)
+
+    agent = PainPointToSolutionAgent(args.features_file, scoring_mode=args.scoring_mode,
+                                     similarity_backend=args.similarity_backend,
+                                     semantic_mode=args.semantic_mode,
+                                     candidate_mode=args.candidate_mode, lsh_bands=args.lsh_bands,
+                                     lsh_rows=args.lsh_rows)
+    report = evaluate(agent, load_labelled_set(args.inputs, args.outputs), k=args.k, repeat=args.repeat)
+    _print_report(report)
+
+    exit_code = 0
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(report, indent=2, ensure_ascii=False) + '\n')
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    elif args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report['comparison'] = compare_to_baseline(json.load(f), report, args.max_quality_drop,
+                                                       args.max_latency_increase, args.min_latency_delta_ms)
+        for row in report['comparison']['metrics']:
+            flag = '  REGRESSION' if row in report['comparison']['regressions'] else ''
+            print(f"{row['metric']:<26} {row['baseline']:.4g} -> {row['current']:.4g}{flag}", file=sys.stderr)
+        for change in report['comparison']['changed_rankings']:
+            print(f"Ranking changed for query {change['index']}: {change['baseline']} -> {change['current']}",
+                  file=sys.stderr)
+        exit_code = 1 if report['comparison']['regressions'] else 0
+
+    if args.output:
+        text = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.output == '-':
+            print(text)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
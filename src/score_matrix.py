@@ -0,0 +1,349 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy là optional, không có thì chỉ ghi được CSV
+    np = None
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import agent as agent_module
+from agent import PainPointToSolutionAgent, _init_worker
+from knowledge_base import CatalogSnapshot
+from matcher import SCORING_MODES, SEMANTIC_MODES
+from similarity import DEFAULT_SIMILARITY_BACKEND, SIMILARITY_BACKENDS
+from stream import iter_input_lines
+from utils import open_text_stream, validate_input_format
+
+MATRIX_FORMATS = ('npy', 'csv')
+MATRIX_DTYPES = ('float32', 'float64')
+MANIFEST_FILE = 'manifest.json'
+
+# Các option của agent ảnh hưởng tới điểm; chạy tiếp với option khác sẽ bị từ chối
+_SCORE_OPTIONS = ('scoring_mode', 'bm25_k1', 'bm25_b', 'similarity_backend', 'semantic_mode')
+
+
+def catalog_fingerprint(catalog: CatalogSnapshot) -> str:
+    """Hash nội dung catalog (theo thứ tự features) để nhận ra catalog đã thay đổi giữa hai lần chạy"""
+    canonical = json.dumps(catalog.features, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _chunk_path(output_dir: str, chunk: int, extension: str) -> str:
+    return os.path.join(output_dir, f"chunk-{chunk:06d}.{extension}")
+
+
+def _inputs_digest(inputs: List[Any]) -> str:
+    canonical = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _write_atomic(path: str, write) -> None:
+    """Ghi ra file tạm rồi rename, file bị ngắt giữa chừng không bao giờ mang tên thật"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def _compile_row(matcher, catalog: CatalogSnapshot, input_data: Any):
+    """MatchQuery của một input, None nếu input không hợp lệ (thiếu field, sai kiểu,...)"""
+    if not isinstance(input_data, dict) or not validate_input_format(input_data)['is_valid']:
+        return None
+    try:
+        return matcher.compile_query(input_data['pain_point'], input_data.get('business_context') or {}, catalog)
+    except Exception:
+        # vd: pain_point hoặc giá trị context không phải string
+        return None
+
+
+class _ChunkScorer:
+    """Score các chunks của một lần chạy trên một snapshot catalog cố định: fingerprint và
+    VectorizedScorer chỉ được tính/build một lần (mỗi process) thay vì cho mỗi chunk"""
+
+    def __init__(self, agent: PainPointToSolutionAgent, dtype: str = 'float64'):
+        self.matcher = agent.matcher
+        self.catalog = agent.knowledge_base.snapshot
+        self.fingerprint = catalog_fingerprint(self.catalog)
+        self.dtype = dtype
+        self._vectorized = None
+
+    def score(self, inputs: List[Any]) -> Tuple[Any, List[bool]]:
+        """(các hàng điểm, input nào hợp lệ). Có numpy thì các hàng là ma trận dtype (hàng NaN = input
+        không hợp lệ) được điền từng hàng bằng VectorizedScorer, nên ngoài chính chunk đó chỉ cần
+        bộ nhớ cho một hàng float64; không có numpy thì là list (None = input không hợp lệ)"""
+        queries = [_compile_row(self.matcher, self.catalog, input_data) for input_data in inputs]
+        valid = [query is not None for query in queries]
+        if np is None:
+            return [[self.matcher._relevance_score(query, record) for record in self.catalog.records]
+                    if query is not None else None for query in queries], valid
+
+        if self._vectorized is None:
+            from vector_engine import VectorizedScorer
+            self._vectorized = VectorizedScorer(self.matcher)
+        matrix = np.full((len(inputs), len(self.catalog.records)), np.nan, dtype=self.dtype)
+        positions = [position for position, query in enumerate(queries) if query is not None]
+        scores = self._vectorized.iter_query_scores([queries[position] for position in positions],
+                                                    mask_non_candidates=False)
+        for position, row in zip(positions, scores):
+            matrix[position] = row
+        return matrix, valid
+
+
+def _write_chunk(scorer: _ChunkScorer, output_dir: str, chunk: int, start_row: int,
+                 inputs: List[Any], manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Score một chunk rồi ghi file dữ liệu và file metadata (metadata có mặt = chunk đã xong)"""
+    if scorer.fingerprint != manifest['catalog_fingerprint']:
+        raise RuntimeError("Catalog differs from the one the score matrix was started with")
+    rows, valid = scorer.score(inputs)
+    columns = len(manifest['feature_ids'])
+
+    if manifest['format'] == 'npy':
+        _write_atomic(_chunk_path(output_dir, chunk, 'npy'), lambda f: np.save(f, rows))
+    else:
+        # Đủ chữ số để đọc lại đúng giá trị float32/float64
+        value_format = '%.9g' if manifest['dtype'] == 'float32' else '%.17g'
+
+        def write_csv(f):
+            text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(['row'] + manifest['feature_ids'])
+            for row, (scores, is_valid) in enumerate(zip(rows, valid), start_row):
+                # Ô trống = input không hợp lệ
+                writer.writerow([row] + ([value_format % score for score in scores] if is_valid
+                                         else [''] * columns))
+            text.flush()
+            text.detach()
+        _write_atomic(_chunk_path(output_dir, chunk, 'csv'), write_csv)
+
+    meta = {'chunk': chunk, 'start_row': start_row, 'rows': len(inputs), 'errors': valid.count(False),
+            'inputs_digest': _inputs_digest(inputs)}
+    _write_atomic(_chunk_path(output_dir, chunk, 'json'),
+                  lambda f: f.write(json.dumps(meta, indent=2).encode('utf-8')))
+    return meta
+
+
+_worker_scorer: Optional[_ChunkScorer] = None
+
+
+def _score_chunk_task(task: Tuple[str, int, int, List[Any], Dict[str, Any]]) -> Dict[str, Any]:
+    """Chạy trong worker process (agent được tạo bởi _init_worker, scorer được build ở chunk đầu tiên)"""
+    global _worker_scorer
+    output_dir, chunk, start_row, inputs, manifest = task
+    if _worker_scorer is None:
+        _worker_scorer = _ChunkScorer(agent_module._worker_agent, manifest['dtype'])
+    return _write_chunk(_worker_scorer, output_dir, chunk, start_row, inputs, manifest)
+
+
+def _load_manifest(output_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    _write_atomic(os.path.join(output_dir, MANIFEST_FILE),
+                  lambda f: f.write(json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8')))
+
+
+def _load_chunk_meta(output_dir: str, chunk: int) -> Optional[Dict[str, Any]]:
+    path = _chunk_path(output_dir, chunk, 'json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compute_score_matrix(agent: PainPointToSolutionAgent, inputs: Iterable[Any], output_dir: str,
+                         chunk_size: int = 10000, fmt: str = 'npy', dtype: str = 'float32',
+                         max_workers: int = 1, progress=None) -> Dict[str, Any]:
+    """Tính ma trận relevance đầy đủ (số input x số feature) theo từng chunk chunk_size inputs
+    và ghi mỗi chunk ra một file trong output_dir (chunk-NNNNNN.npy hoặc .csv + .json metadata).
+
+    Bộ nhớ chỉ giới hạn ở các chunks đang xử lý (tối đa 2 * max_workers chunks inputs).
+    Chạy lại với cùng inputs/options trên cùng output_dir thì các chunks đã ghi xong được bỏ qua,
+    nên bị ngắt giữa chừng chỉ mất chunk đang ghi. Input không hợp lệ cho hàng NaN (ô trống ở CSV).
+    progress(meta, skipped) được gọi sau mỗi chunk. Trả về manifest (gồm thống kê của lần chạy)"""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+    if fmt not in MATRIX_FORMATS:
+        raise ValueError(f"Unknown matrix format: {fmt!r} (expected one of {MATRIX_FORMATS})")
+    if dtype not in MATRIX_DTYPES:
+        raise ValueError(f"Unknown matrix dtype: {dtype!r} (expected one of {MATRIX_DTYPES})")
+    if fmt == 'npy' and np is None:
+        raise ImportError("The npy format requires numpy (pip install numpy), use fmt='csv'")
+
+    # Mọi chunk được score trên snapshot hiện tại, kể cả khi catalog thay đổi trong lúc chạy
+    scorer = _ChunkScorer(agent, dtype)
+    manifest = {
+        'format': fmt,
+        'dtype': dtype,
+        'chunk_size': chunk_size,
+        'feature_ids': [record.feature_id for record in scorer.catalog.records],
+        'catalog_fingerprint': scorer.fingerprint,
+        'options': {option: getattr(agent.matcher, option) for option in _SCORE_OPTIONS},
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    existing = _load_manifest(output_dir)
+    if existing is not None:
+        mismatched = [key for key in manifest if existing.get(key) != manifest[key]]
+        if mismatched:
+            raise ValueError(f"{output_dir} holds a score matrix with different {', '.join(mismatched)}; "
+                             "use a new output directory")
+    _save_manifest(output_dir, dict(manifest, complete=False))
+
+    stats = {'chunks': 0, 'computed_chunks': 0, 'skipped_chunks': 0, 'rows': 0, 'errors': 0}
+
+    def record(meta: Dict[str, Any], skipped: bool) -> None:
+        stats['chunks'] += 1
+        stats['skipped_chunks' if skipped else 'computed_chunks'] += 1
+        stats['rows'] += meta['rows']
+        stats['errors'] += meta['errors']
+        if progress is not None:
+            progress(meta, skipped)
+
+    def pending_chunks() -> Iterator[Tuple[int, int, List[Any], Optional[Dict[str, Any]]]]:
+        """(chunk, hàng đầu, inputs, metadata nếu chunk đã xong từ lần chạy trước)"""
+        iterator = iter(inputs)
+        chunk, start_row = 0, 0
+        while True:
+            chunk_inputs = list(islice(iterator, chunk_size))
+            if not chunk_inputs:
+                return
+            meta = _load_chunk_meta(output_dir, chunk)
+            if meta is not None and (meta['rows'] != len(chunk_inputs) or
+                                     meta['inputs_digest'] != _inputs_digest(chunk_inputs)):
+                raise ValueError(f"Inputs of chunk {chunk} differ from the previous run in {output_dir}; "
+                                 "use a new output directory")
+            yield chunk, start_row, chunk_inputs, meta
+            chunk += 1
+            start_row += len(chunk_inputs)
+
+    if max_workers == 1:
+        for chunk, start_row, chunk_inputs, meta in pending_chunks():
+            if meta is not None:
+                record(meta, True)
+            else:
+                record(_write_chunk(scorer, output_dir, chunk, start_row, chunk_inputs, manifest), False)
+    else:
+        # Workers tự ghi chunk của mình, main process chỉ giữ inputs của các chunks đang chạy
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=agent._worker_initargs()) as executor:
+            pending = deque()
+            for chunk, start_row, chunk_inputs, meta in pending_chunks():
+                if meta is not None:
+                    pending.append((None, meta))
+                else:
+                    pending.append((executor.submit(_score_chunk_task,
+                                                    (output_dir, chunk, start_row, chunk_inputs, manifest)), None))
+                while len(pending) > 2 * max_workers or (pending and pending[0][0] is None):
+                    future, meta = pending.popleft()
+                    record(future.result() if future is not None else meta, future is None)
+            while pending:
+                future, meta = pending.popleft()
+                record(future.result() if future is not None else meta, future is None)
+
+    manifest.update(complete=True, rows=stats['rows'], chunks=stats['chunks'])
+    _save_manifest(output_dir, manifest)
+    return dict(manifest, stats=stats)
+
+
+def iter_score_chunks(output_dir: str) -> Iterator[Tuple[int, Any]]:
+    """Đọc lại ma trận đã ghi theo từng chunk: yield (hàng đầu, ma trận của chunk).
+    npy cho numpy array (memory-mapped), csv cho list các hàng (None = input không hợp lệ)"""
+    manifest = _load_manifest(output_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No score matrix in {output_dir}")
+    chunk = 0
+    while True:
+        meta = _load_chunk_meta(output_dir, chunk)
+        if meta is None:
+            return
+        path = _chunk_path(output_dir, chunk, manifest['format'])
+        if manifest['format'] == 'npy':
+            yield meta['start_row'], np.load(path, mmap_mode='r')
+        else:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(f)
+                next(reader)
+                yield meta['start_row'], [[float(value) for value in row[1:]] if row[1:] and row[1] != ''
+                                          else None for row in reader]
+        chunk += 1
+
+
+def load_score_matrix(output_dir: str):
+    """Ghép toàn bộ chunks thành một numpy array (cần đủ RAM cho cả ma trận)"""
+    if np is None:
+        raise ImportError("load_score_matrix requires numpy (pip install numpy), use iter_score_chunks")
+    manifest = _load_manifest(output_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No score matrix in {output_dir}")
+    chunks = []
+    for _, matrix in iter_score_chunks(output_dir):
+        if not isinstance(matrix, np.ndarray):
+            matrix = np.array([row if row is not None else [math.nan] * len(manifest['feature_ids'])
+                               for row in matrix], dtype=manifest['dtype'])
+        chunks.append(np.asarray(matrix))
+    if not chunks:
+        return np.empty((0, len(manifest['feature_ids'])), dtype=manifest['dtype'])
+    return np.concatenate(chunks)
+
+
+def main(argv=None):
+    """Tính ma trận relevance đầy đủ cho file JSON Lines inputs (có thể chạy tiếp sau khi bị ngắt)"""
+    parser = argparse.ArgumentParser(description="Pain Point to Solution Agent - full score matrix")
+    parser.add_argument('--input', '-i', default='-', help="File JSON Lines đầu vào (.gz được hỗ trợ), '-' = stdin")
+    parser.add_argument('--output-dir', '-o', required=True, help='Thư mục chứa các chunks và manifest.json')
+    parser.add_argument('--features-file', default='data/filum_features.json')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Số inputs mỗi chunk (mặc định: 10000)')
+    parser.add_argument('--format', default='npy' if np is not None else 'csv', choices=MATRIX_FORMATS)
+    parser.add_argument('--dtype', default='float32', choices=MATRIX_DTYPES)
+    parser.add_argument('--workers', type=int, default=1, help='Số worker process (mặc định: 1, tuần tự)')
+    parser.add_argument('--scoring-mode', default='fuzzy', choices=SCORING_MODES)
+    parser.add_argument('--similarity-backend', default=DEFAULT_SIMILARITY_BACKEND, choices=list(SIMILARITY_BACKENDS))
+    parser.add_argument('--semantic-mode', default='fuzzy', choices=SEMANTIC_MODES)
+    args = parser.parse_args(argv)
+
+    agent = PainPointToSolutionAgent(args.features_file, scoring_mode=args.scoring_mode,
+                                     similarity_backend=args.similarity_backend,
+                                     semantic_mode=args.semantic_mode)
+    bad_lines = 0
+
+    def parsed_inputs() -> Iterator[Any]:
+        nonlocal bad_lines
+        for _, input_data, error in iter_input_lines(source):
+            # Dòng JSON lỗi vẫn chiếm một hàng (NaN) để số hàng khớp với số dòng
+            bad_lines += error is not None
+            yield input_data
+
+    def report(meta: Dict[str, Any], skipped: bool) -> None:
+        status = 'skipped (already written)' if skipped else f"{meta['errors']} invalid inputs"
+        print(f"Chunk {meta['chunk']}: rows {meta['start_row']}-{meta['start_row'] + meta['rows'] - 1} {status}",
+              file=sys.stderr)
+
+    with open_text_stream(args.input, 'r') as source:
+        result = compute_score_matrix(agent, parsed_inputs(), args.output_dir, chunk_size=args.chunk_size,
+                                      fmt=args.format, dtype=args.dtype, max_workers=args.workers,
+                                      progress=report)
+    stats = result['stats']
+    print(f"Score matrix {stats['rows']} x {len(result['feature_ids'])} in {stats['chunks']} chunks "
+          f"({stats['computed_chunks']} computed, {stats['skipped_chunks']} resumed, "
+          f"{stats['errors']} invalid inputs, {bad_lines} of them unparsable)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
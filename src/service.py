@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import json
+import sys
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import unquote
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent import PainPointToSolutionAgent, _init_worker, _process_item
+from lsh import DEFAULT_LSH_BANDS, DEFAULT_LSH_ROWS
+from matcher import SCORING_MODES, SEMANTIC_MODES, CANDIDATE_MODES
+from similarity import DEFAULT_SIMILARITY_BACKEND, SIMILARITY_BACKENDS
+from utils import validate_input_format
+
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+_STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+
+class HTTPError(Exception):
+    """Lỗi HTTP trả về cho client dạng JSON"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AgentService:
+    """Service HTTP/JSON chạy trên asyncio, bọc PainPointToSolutionAgent.process_input.
+
+    Scoring được đẩy sang worker pool (process pool mặc định, thread pool nếu
+    use_processes=False); các requests giống hệt nhau đang xử lý được gộp lại
+    thành một lần tính. Features có thể được thêm/sửa/xoá lúc service đang chạy
+    qua /features (xem KnowledgeBase.apply_changes)."""
+
+    def __init__(self, features_file: str = "data/filum_features.json", max_workers: Optional[int] = None,
+                 use_processes: bool = True, **matcher_options):
+        self.agent = PainPointToSolutionAgent(features_file, **matcher_options)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            'requests': 0,
+            'items': 0,
+            'computed': 0,
+            'coalesced': 0,
+            'errors': 0
+        }
+
+    def _get_executor(self) -> Executor:
+        """Tạo worker pool khi cần lần đầu"""
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=_init_worker,
+                    initargs=self.agent._worker_initargs())
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _run_in_pool(self, executor: Executor, input_data: Dict[str, Any]) -> "asyncio.Future":
+        """Submit một input vào worker pool"""
+        loop = asyncio.get_running_loop()
+        if self.use_processes:
+            return loop.run_in_executor(executor, _process_item, input_data)
+        return loop.run_in_executor(executor, self.agent._process_isolated, input_data)
+
+    async def _compute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Chạy input trong worker pool. Worker process chết làm cả pool hỏng (BrokenProcessPool):
+        bỏ pool đó, tạo pool mới và thử lại một lần"""
+        executor = self._get_executor()
+        try:
+            return await self._run_in_pool(executor, input_data)
+        except BrokenProcessPool:
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False)
+            return await self._run_in_pool(self._get_executor(), input_data)
+
+    async def match(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Xử lý một input; requests giống hệt đang chạy thì dùng chung kết quả"""
+        self.stats['items'] += 1
+        key = json.dumps(input_data, sort_keys=True, ensure_ascii=False)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            task = asyncio.ensure_future(self._compute(input_data))
+            self._in_flight[key] = task
+            self.stats['computed'] += 1
+
+            # Bỏ khỏi in-flight khi tính xong (không phải khi client chờ bị huỷ), để requests
+            # giống hệt đến trong lúc đó vẫn dùng chung lần tính đang chạy
+            def done(finished: "asyncio.Future") -> None:
+                if self._in_flight.get(key) is finished:
+                    del self._in_flight[key]
+            task.add_done_callback(done)
+        # shield để một client ngắt kết nối không huỷ kết quả của các client khác
+        return await asyncio.shield(task)
+
+    async def match_batch(self, inputs: List[Any]) -> List[Dict[str, Any]]:
+        """Xử lý batch inputs song song, giữ thứ tự"""
+        return await asyncio.gather(*(self.match(input_data) for input_data in inputs))
+
+    async def edit_features(self, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Thêm/sửa/xoá features (changes: tham số của KnowledgeBase.apply_changes).
+        Requests đang chạy hoàn tất trên catalog cũ, requests sau đó thấy version mới"""
+        loop = asyncio.get_running_loop()
+        try:
+            stats = await loop.run_in_executor(None, lambda: self.agent.knowledge_base.apply_changes(**changes))
+        except KeyError as e:
+            raise HTTPError(404, e.args[0])
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+        # Không gộp requests mới vào kết quả đang tính trên catalog cũ
+        self._in_flight.clear()
+        if self.use_processes and self._executor is not None:
+            # Worker processes giữ catalog riêng: thay pool mới, pool cũ tự đóng khi xong việc đang chạy
+            executor, self._executor = self._executor, None
+            executor.shutdown(wait=False)
+        return {'version': self.agent.knowledge_base.version, 'changes': stats}
+
+    async def handle_request(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        """Route request, trả về (status, payload)"""
+        path = path.split('?', 1)[0].rstrip('/') or '/'
+
+        if path == '/health':
+            self._require_method(method, 'GET')
+            return 200, {'status': 'ok'}
+
+        if path == '/stats':
+            self._require_method(method, 'GET')
+            return 200, {
+                'service': dict(self.stats, in_flight=len(self._in_flight)),
+                'knowledge_base': self.agent.get_feature_statistics()
+            }
+
+        if path == '/match':
+            self._require_method(method, 'POST')
+            input_data = self._parse_json(body)
+            validation = validate_input_format(input_data) if isinstance(input_data, dict) else \
+                {'is_valid': False, 'errors': ['Input must be a JSON object']}
+            if not validation['is_valid']:
+                raise HTTPError(400, '; '.join(validation['errors']))
+            return 200, await self.match(input_data)
+
+        if path == '/match/batch':
+            self._require_method(method, 'POST')
+            payload = self._parse_json(body)
+            inputs = payload.get('inputs') if isinstance(payload, dict) else payload
+            if not isinstance(inputs, list):
+                raise HTTPError(400, "Batch body must be a JSON list or {\"inputs\": [...]}")
+            return 200, {'results': await self.match_batch(inputs)}
+
+        if path == '/features':
+            self._require_method(method, 'POST')
+            return 200, await self.edit_features({'add': [self._parse_json(body)]})
+
+        if path.startswith('/features/'):
+            feature_id = unquote(path[len('/features/'):])
+            if method == 'GET':
+                feature = self.agent.knowledge_base.get_feature_by_id(feature_id)
+                if not feature:
+                    raise HTTPError(404, f"Unknown feature_id: {feature_id}")
+                return 200, dict(feature)
+            if method == 'PATCH':
+                changes = self._parse_json(body)
+                if not isinstance(changes, dict):
+                    raise HTTPError(400, "Body must be a JSON object of changed fields")
+                return 200, await self.edit_features({'update': {feature_id: changes}})
+            if method == 'DELETE':
+                return 200, await self.edit_features({'delete': [feature_id]})
+            raise HTTPError(405, "Use GET, PATCH or DELETE")
+
+        raise HTTPError(404, f"Unknown path: {path}")
+
+    @staticmethod
+    def _require_method(method: str, expected: str) -> None:
+        if method != expected:
+            raise HTTPError(405, f"Use {expected}")
+
+    @staticmethod
+    def _parse_json(body: bytes) -> Any:
+        try:
+            return json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HTTPError(400, f"Invalid JSON body: {e}")
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """Đọc một HTTP request; None khi client đóng kết nối"""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length header")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length header")
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), path, headers, body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Xử lý một kết nối (hỗ trợ keep-alive)"""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    self.stats['requests'] += 1
+                    status, payload = await self.handle_request(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+                if status != 200:
+                    self.stats['errors'] += 1
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        """Mở server, trả về asyncio server (port=0 để chọn port ngẫu nhiên)"""
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self) -> None:
+        """Dừng worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+async def serve(service: AgentService, host: str, port: int) -> None:
+    """Chạy service cho đến khi bị dừng"""
+    server = await service.start(host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Pain Point to Solution service listening on http://{address[0]}:{address[1]}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """Chạy agent dưới dạng HTTP/JSON service"""
+    parser = argparse.ArgumentParser(description="Pain Point to Solution Agent - JSON service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--features-file', default='data/filum_features.json')
+    parser.add_argument('--workers', type=int, default=None, help='Số worker (mặc định: số CPU)')
+    parser.add_argument('--threads', action='store_true', help='Dùng thread pool thay cho process pool')
+    parser.add_argument('--scoring-mode', default='fuzzy', choices=SCORING_MODES)
+    parser.add_argument('--similarity-backend', default=DEFAULT_SIMILARITY_BACKEND, choices=list(SIMILARITY_BACKENDS))
+    parser.add_argument('--semantic-mode', default='fuzzy', choices=SEMANTIC_MODES)
+    parser.add_argument('--candidate-mode', default='all', choices=CANDIDATE_MODES)
+    parser.add_argument('--lsh-bands', type=int, default=DEFAULT_LSH_BANDS)
+    parser.add_argument('--lsh-rows', type=int, default=DEFAULT_LSH_ROWS)
+    parser.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                        help='Hot reload features file, poll mỗi SECONDS giây')
+    args = parser.parse_args()
+
+    service = AgentService(args.features_file, max_workers=args.workers,
+                           use_processes=not args.threads, scoring_mode=args.scoring_mode,
+                           similarity_backend=args.similarity_backend, semantic_mode=args.semantic_mode,
+                           candidate_mode=args.candidate_mode, lsh_bands=args.lsh_bands, lsh_rows=args.lsh_rows,
+                           catalog_poll_interval=args.watch)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import importlib
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
+
+# Backend similarity dùng cho keyword/semantic score. Mỗi backend trả về
+# ratio(a, b) -> int trong khoảng 0..100; thư viện ngoài chỉ được import khi backend được chọn.
+#   fuzzywuzzy   - fuzz.ratio (mặc định, giữ nguyên điểm số cũ; không có python-Levenshtein thì dùng difflib)
+#   levenshtein  - built-in, không cần package ngoài: Indel ratio tính bằng bit-parallel LCS,
+#                  cho kết quả giống fuzz.ratio khi có python-Levenshtein
+#   rapidfuzz    - rapidfuzz.fuzz.ratio (cùng kết quả với levenshtein, nhanh hơn nếu đã cài)
+DEFAULT_SIMILARITY_BACKEND = 'fuzzywuzzy'
+
+
+def _round_ratio(value: float) -> int:
+    # Làm tròn giống fuzzywuzzy (utils.intr)
+    return int(round(value))
+
+
+@lru_cache(maxsize=4096)
+def _pattern_masks(pattern: str) -> Tuple[Dict[str, int], int]:
+    """Bitmask vị trí của từng ký tự trong pattern (bit i = pattern[i])"""
+    masks: Dict[str, int] = {}
+    for position, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << position)
+    return masks, (1 << len(pattern)) - 1
+
+
+def lcs_length(a: str, b: str) -> int:
+    """Độ dài longest common subsequence, thuật toán bit-parallel (Allison-Dix / Hyyrö):
+    mỗi ký tự của b cập nhật cả vector trạng thái của a trong O(1) phép toán số nguyên"""
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return 0
+    masks, full = _pattern_masks(a)
+    state = full
+    for char in b:
+        matches = state & masks.get(char, 0)
+        state = ((state + matches) | (state - matches)) & full
+    # Mỗi bit 0 còn lại trong state là một ký tự của LCS
+    return len(a) - bin(state).count('1')
+
+
+def levenshtein_ratio(a: str, b: str) -> int:
+    """Similarity 0..100 theo Indel distance: 100 * 2 * LCS / (len(a) + len(b))"""
+    # Giống fuzz.ratio: kiểm tra a == b trước chuỗi rỗng nên ratio('', '') == 100
+    if a == b:
+        return 100
+    if not a or not b:
+        return 0
+    return _round_ratio(100.0 * 2 * lcs_length(a, b) / (len(a) + len(b)))
+
+
+def _load_fuzzywuzzy() -> Callable[[str, str], int]:
+    fuzz = importlib.import_module('fuzzywuzzy.fuzz')
+    return fuzz.ratio
+
+
+def _load_levenshtein() -> Callable[[str, str], int]:
+    return levenshtein_ratio
+
+
+def _load_rapidfuzz() -> Callable[[str, str], int]:
+    fuzz = importlib.import_module('rapidfuzz.fuzz')
+    rapidfuzz_ratio = fuzz.ratio
+
+    def ratio(a: str, b: str) -> int:
+        if a == b:
+            return 100
+        return _round_ratio(rapidfuzz_ratio(a, b))
+
+    return ratio
+
+
+SIMILARITY_BACKENDS: Dict[str, Callable[[], Callable[[str, str], int]]] = {
+    'fuzzywuzzy': _load_fuzzywuzzy,
+    'levenshtein': _load_levenshtein,
+    'rapidfuzz': _load_rapidfuzz,
+}
+
+
+def get_similarity_function(backend: str = DEFAULT_SIMILARITY_BACKEND) -> Callable[[str, str], int]:
+    """Trả về hàm ratio(a, b) của backend (import thư viện tương ứng khi cần)"""
+    loader = SIMILARITY_BACKENDS.get(backend)
+    if loader is None:
+        raise ValueError(f"Unknown similarity backend: {backend} (choose from {', '.join(SIMILARITY_BACKENDS)})")
+    try:
+        return loader()
+    except ImportError as e:
+        raise ImportError(f"Similarity backend '{backend}' is not available: {e}. "
+                          f"Use similarity_backend='levenshtein' for the built-in implementation") from e
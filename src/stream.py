@@ -0,0 +1,83 @@
+import argparse
+import json
+import sys
+import os
+from typing import Dict, Any, IO, Iterable, Iterator, Optional, Tuple
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent import PainPointToSolutionAgent, _InputError
+from lsh import DEFAULT_LSH_BANDS, DEFAULT_LSH_ROWS
+from matcher import SCORING_MODES, SEMANTIC_MODES, CANDIDATE_MODES
+from similarity import DEFAULT_SIMILARITY_BACKEND, SIMILARITY_BACKENDS
+from utils import open_text_stream, write_json_line
+
+
+def iter_input_lines(stream: IO[str]) -> Iterator[Tuple[int, Any, Optional[str]]]:
+    """Đọc JSON Lines từng dòng, yield (số dòng, input, lỗi parse). Dòng trống bị bỏ qua"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON on line {line_number}: {e.msg}"
+
+
+def match_stream(agent: PainPointToSolutionAgent, lines: Iterable[Tuple[int, Any, Optional[str]]],
+                 max_workers: int = 1, chunksize: int = 64, ordered: bool = True) -> Iterator[Dict[str, Any]]:
+    """Generator pipeline: (số dòng, input, lỗi) -> {'line': ..., 'result': ...}.
+    Mọi dòng đi qua agent.process_batch (dòng lỗi dưới dạng _InputError) nên kết quả lỗi
+    giữ đúng vị trí (ordered) hoặc theo thứ tự hoàn thành (unordered).
+    Bộ nhớ chỉ giới hạn ở các chunks đang xử lý"""
+    line_numbers = {}  # index trong process_batch -> số dòng
+
+    def inputs() -> Iterator[Any]:
+        for position, (line_number, input_data, error) in enumerate(lines):
+            line_numbers[position] = line_number
+            yield _InputError(error) if error is not None else input_data
+
+    for index, result in agent.process_batch(inputs(), max_workers=max_workers,
+                                             chunksize=chunksize, ordered=ordered):
+        yield {'line': line_numbers.pop(index), 'result': result}
+
+
+def main(argv=None):
+    """Bulk matching: đọc JSON Lines (có thể gzip) và ghi kết quả JSON Lines tăng dần"""
+    parser = argparse.ArgumentParser(description="Pain Point to Solution Agent - streaming JSON Lines")
+    parser.add_argument('--input', '-i', default='-', help="File JSON Lines đầu vào (.gz được hỗ trợ), '-' = stdin")
+    parser.add_argument('--output', '-o', default='-', help="File JSON Lines đầu ra (.gz để nén), '-' = stdout")
+    parser.add_argument('--features-file', default='data/filum_features.json')
+    parser.add_argument('--scoring-mode', default='fuzzy', choices=SCORING_MODES)
+    parser.add_argument('--similarity-backend', default=DEFAULT_SIMILARITY_BACKEND, choices=list(SIMILARITY_BACKENDS))
+    parser.add_argument('--semantic-mode', default='fuzzy', choices=SEMANTIC_MODES)
+    parser.add_argument('--candidate-mode', default='all', choices=CANDIDATE_MODES)
+    parser.add_argument('--lsh-bands', type=int, default=DEFAULT_LSH_BANDS)
+    parser.add_argument('--lsh-rows', type=int, default=DEFAULT_LSH_ROWS)
+    parser.add_argument('--workers', type=int, default=1, help='Số worker process (mặc định: 1, tuần tự)')
+    parser.add_argument('--chunksize', type=int, default=64)
+    parser.add_argument('--unordered', action='store_true', help='Ghi kết quả theo thứ tự hoàn thành')
+    args = parser.parse_args(argv)
+
+    agent = PainPointToSolutionAgent(args.features_file, scoring_mode=args.scoring_mode,
+                                     similarity_backend=args.similarity_backend,
+                                     semantic_mode=args.semantic_mode,
+                                     candidate_mode=args.candidate_mode, lsh_bands=args.lsh_bands,
+                                     lsh_rows=args.lsh_rows)
+    processed = 0
+    errors = 0
+
+    with open_text_stream(args.input, 'r') as source, open_text_stream(args.output, 'w') as sink:
+        for record in match_stream(agent, iter_input_lines(source), max_workers=args.workers,
+                                   chunksize=args.chunksize, ordered=not args.unordered):
+            write_json_line(sink, record)
+            processed += 1
+            errors += 'error' in record['result']
+
+    print(f"Processed {processed} lines ({errors} errors)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import math
+from array import array
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy là optional, không có thì cộng dồn posting lists bằng Python
+    np = None
+
+from knowledge_base import FeatureRecord, tokenize
+
+# Vector của một text gồm hai khối được chuẩn hoá L2 riêng rồi nhân trọng số, nên
+# dot product = WORD_WEIGHT * cosine(word n-grams) + CHAR_WEIGHT * cosine(char n-grams)
+WORD_WEIGHT = 0.5
+CHAR_WEIGHT = 0.5
+WORD_NGRAMS = (1, 2)
+# Char n-grams lấy trong từng từ (có padding khoảng trắng) để bắt biến thể như churn/churned
+CHAR_NGRAMS = (3, 4)
+
+TermWeights = Dict[str, float]
+
+
+def word_terms(words: Sequence[str]) -> Counter:
+    """Word n-grams (unigram, bigram) từ danh sách tokens"""
+    terms = Counter()
+    for n in range(WORD_NGRAMS[0], WORD_NGRAMS[1] + 1):
+        terms.update(' '.join(words[i:i + n]) for i in range(len(words) - n + 1))
+    return terms
+
+
+@lru_cache(maxsize=65536)
+def _word_char_grams(word: str) -> Tuple[str, ...]:
+    padded = f' {word} '
+    return tuple(padded[i:i + n] for n in range(CHAR_NGRAMS[0], CHAR_NGRAMS[1] + 1)
+                 for i in range(len(padded) - n + 1))
+
+
+def char_terms(words: Sequence[str]) -> Counter:
+    """Char n-grams của từng từ"""
+    terms = Counter()
+    for word in words:
+        terms.update(_word_char_grams(word))
+    return terms
+
+
+def feature_texts(record: FeatureRecord) -> List[str]:
+    """Các text của một feature được vector hoá: từng pain point addressed và description"""
+    description = record.data.get('description')
+    return list(record.pain_points) + ([description.lower()] if isinstance(description, str) and description else [])
+
+
+class _TermIndex:
+    """Inverted index của một khối TF-IDF: term -> (các document, trọng số đã chuẩn hoá)"""
+
+    def __init__(self, documents: List[Counter], weight: float):
+        self.weight = weight
+        self.document_count = len(documents)
+        document_frequency = Counter()
+        for terms in documents:
+            document_frequency.update(terms.keys())
+        # Smooth idf: term chưa gặp có df = 0
+        self.idf = {term: self._idf(df) for term, df in document_frequency.items()}
+        self.unseen_idf = self._idf(0)
+
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        for document, terms in enumerate(documents):
+            for term, value in self.vectorize(terms, weight).items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array('I'), array('d'))
+                postings[0].append(document)
+                postings[1].append(value)
+
+    def _idf(self, df: int) -> float:
+        return math.log((1 + self.document_count) / (1 + df)) + 1.0
+
+    def vectorize(self, terms: Counter, weight: float = 1.0) -> TermWeights:
+        """Sublinear tf * idf, chuẩn hoá L2 rồi nhân weight"""
+        idf = self.idf
+        vector = {term: (1.0 + math.log(count)) * idf.get(term, self.unseen_idf) for term, count in terms.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        if not norm:
+            return {}
+        scale = weight / norm
+        return {term: value * scale for term, value in vector.items()}
+
+
+class TfidfIndex:
+    """TF-IDF vectors (word + char n-grams) của pain points addressed và description
+    của mọi feature trong một snapshot. Một query được score với toàn bộ documents bằng
+    một sparse dot product qua posting lists; điểm của feature là cosine lớn nhất.
+    Text giống nhau ở nhiều features (vd: cùng pain point addressed) chỉ là một document"""
+
+    def __init__(self, records: Iterable[FeatureRecord]):
+        word_documents: List[Counter] = []
+        char_documents: List[Counter] = []
+        document_ids: Dict[str, int] = {}
+        # Các cặp (document, vị trí feature) theo thứ tự feature;
+        # feature_id trùng chỉ lấy feature đầu tiên (giống records_by_id)
+        self.pair_documents = array('I')
+        self.pair_features = array('I')
+        self.feature_ids: List[str] = []
+        seen = set()
+        for record in records:
+            if not record.feature_id or record.feature_id in seen:
+                continue
+            seen.add(record.feature_id)
+            for text in dict.fromkeys(feature_texts(record)):
+                document = document_ids.get(text)
+                if document is None:
+                    document = document_ids[text] = len(word_documents)
+                    words = tokenize(text)
+                    word_documents.append(word_terms(words))
+                    char_documents.append(char_terms(words))
+                self.pair_documents.append(document)
+                self.pair_features.append(len(self.feature_ids))
+            self.feature_ids.append(record.feature_id)
+        self.document_count = len(word_documents)
+        self.word_index = _TermIndex(word_documents, WORD_WEIGHT)
+        self.char_index = _TermIndex(char_documents, CHAR_WEIGHT)
+
+    def _query_vectors(self, text: str) -> List[Tuple[_TermIndex, TermWeights]]:
+        words = tokenize(text)
+        return [(self.word_index, self.word_index.vectorize(word_terms(words))),
+                (self.char_index, self.char_index.vectorize(char_terms(words)))]
+
+    def _document_scores(self, text: str):
+        """Dot product của query với mọi document (list, hoặc numpy array nếu có numpy)"""
+        document_count = self.document_count
+        if np is not None:
+            rows, values = [], []
+            for index, vector in self._query_vectors(text):
+                for term, query_value in vector.items():
+                    postings = index.postings.get(term)
+                    if postings is not None:
+                        rows.append(np.frombuffer(postings[0], dtype=np.uint32))
+                        values.append(np.frombuffer(postings[1], dtype=np.float64) * query_value)
+            if not rows:
+                return np.zeros(document_count)
+            # bincount cộng tuần tự theo thứ tự input nên kết quả giống hệt vòng lặp Python
+            return np.bincount(np.concatenate(rows), weights=np.concatenate(values), minlength=document_count)
+
+        scores = [0.0] * document_count
+        for index, vector in self._query_vectors(text):
+            for term, query_value in vector.items():
+                postings = index.postings.get(term)
+                if postings is not None:
+                    for document, value in zip(*postings):
+                        scores[document] += value * query_value
+        return scores
+
+    def feature_scores(self, text: str) -> Dict[str, float]:
+        """feature_id -> similarity (0..1) với text, chỉ gồm các features có điểm > 0"""
+        document_scores = self._document_scores(text)
+        feature_ids = self.feature_ids
+        if np is not None:
+            pair_scores = document_scores[np.frombuffer(self.pair_documents, dtype=np.uint32)]
+            matched = pair_scores > 0
+            best = np.zeros(len(feature_ids))
+            np.maximum.at(best, np.frombuffer(self.pair_features, dtype=np.uint32)[matched], pair_scores[matched])
+            features = np.flatnonzero(best)
+            return {feature_ids[feature]: min(score, 1.0)
+                    for feature, score in zip(features.tolist(), best[features].tolist())}
+
+        scores: Dict[str, float] = {}
+        for document, feature in zip(self.pair_documents, self.pair_features):
+            score = document_scores[document]
+            if score > 0 and score > scores.get(feature_ids[feature], 0.0):
+                scores[feature_ids[feature]] = min(score, 1.0)
+        return scores
+
+    def similarity(self, text: str, record: FeatureRecord) -> float:
+        """Similarity của text với một feature bất kỳ (kể cả feature ngoài catalog), dùng idf của index"""
+        query_vectors = self._query_vectors(text)
+        best = 0.0
+        for feature_text in feature_texts(record):
+            words = tokenize(feature_text)
+            score = 0.0
+            for (index, query_vector), terms in zip(query_vectors, (word_terms(words), char_terms(words))):
+                document_vector = index.vectorize(terms, index.weight)
+                score += sum(value * document_vector.get(term, 0.0) for term, value in query_vector.items())
+            best = max(best, min(score, 1.0))
+        return best
@@ -1,6 +1,9 @@
+import gzip
+import io
 import json
 import os
-from typing import Dict, Any, List
+import sys
+from typing import Dict, Any, List, IO
 
 def validate_input_format(input_data: Dict[str, Any]) -> Dict[str, Any]:
     """Validate input format"""
@@ -75,6 +78,36 @@ def save_result_to_file(result: Dict[str, Any], filename: str = "result.json"):
     except Exception as e:
         print(f"Error saving result: {e}")
 
+def open_text_stream(path: str, mode: str = 'r') -> IO[str]:
+    """Mở file text để đọc/ghi dạng stream; '-' là stdin/stdout.
+    Tự nhận gzip theo đuôi .gz (ghi) hoặc magic bytes (đọc)"""
+    if mode not in ('r', 'w'):
+        raise ValueError(f"Unsupported mode: {mode}")
+    
+    if path == '-':
+        binary = sys.stdin.buffer if mode == 'r' else sys.stdout.buffer
+        if mode == 'r':
+            binary = io.BufferedReader(binary) if not hasattr(binary, 'peek') else binary
+            if binary.peek(2)[:2] == b'\x1f\x8b':
+                binary = gzip.GzipFile(fileobj=binary, mode='rb')
+        return io.TextIOWrapper(binary, encoding='utf-8', newline='\n' if mode == 'w' else None)
+    
+    if mode == 'w':
+        if path.endswith('.gz'):
+            return gzip.open(path, 'wt', encoding='utf-8')
+        return open(path, 'w', encoding='utf-8')
+    
+    with open(path, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    if is_gzip:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def write_json_line(stream: IO[str], record: Any) -> None:
+    """Ghi một record dạng JSON Lines"""
+    stream.write(json.dumps(record, ensure_ascii=False))
+    stream.write('\n')
+
 def load_test_cases() -> List[Dict[str, Any]]:
     """Load test cases từ file"""
     test_cases = [
@@ -105,13 +138,13 @@ def load_test_cases() -> List[Dict[str, Any]]:
     ]
     return test_cases
 
-def run_batch_test(agent, test_cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Chạy batch test với multiple test cases"""
+def run_batch_test(agent, test_cases: List[Dict[str, Any]], max_workers: int = 1) -> List[Dict[str, Any]]:
+    """Chạy batch test với multiple test cases (max_workers > 1 dùng agent.process_batch)"""
     results = []
     
-    for i, test_case in enumerate(test_cases, 1):
-        print(f"\nTest Case {i}: {test_case['pain_point']}")
-        result = agent.process_input(test_case)
+    for index, result in agent.process_batch(test_cases, max_workers=max_workers):
+        test_case = test_cases[index]
+        print(f"\nTest Case {index + 1}: {test_case['pain_point']}")
         results.append({
             'test_case': test_case,
             'result': result
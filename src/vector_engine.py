@@ -0,0 +1,211 @@
+from typing import List, Dict, Any, Tuple, Iterable
+
+try:
+    import numpy as np
+except ImportError:  # numpy là optional dependency, chỉ cần cho engine này
+    np = None
+
+from matcher import PainPointMatcher, MatchQuery
+
+_COMPLEXITY_CODES = {'low': 0, 'medium': 1, 'high': 2}
+
+# Bảng bonus theo (giá trị context, mã complexity), cột cuối cho complexity khác
+_SIZE_BONUS = {
+    'small': (0.2, 0.0, 0.0, 0.0),
+    'medium': (0.2, 0.2, 0.0, 0.0),
+    'large': (0.0, 0.2, 0.2, 0.0),
+}
+_BUDGET_BONUS = {
+    'low': (0.3, 0.0, 0.0, 0.0),
+    'moderate': (0.3, 0.3, 0.0, 0.0),
+    'high': (0.0, 0.3, 0.3, 0.0),
+    'flexible': (0.2, 0.2, 0.2, 0.2),
+}
+
+
+class VectorizedScorer:
+    """Engine scoring dạng vector: biểu diễn catalog thành arrays và tính cả 4
+    thành phần điểm cho toàn bộ features (và cho batch queries) bằng NumPy.
+    Trọng số và output top-k giống hệt PainPointMatcher.find_solutions"""
+
+    def __init__(self, matcher: PainPointMatcher):
+        if np is None:
+            raise ImportError("VectorizedScorer requires numpy (pip install numpy)")
+        self.matcher = matcher
+        self._records = None
+        self._ensure_catalog()
+
+    def _ensure_catalog(self, catalog=None) -> None:
+        """Build lại arrays nếu catalog của knowledge base đã thay đổi"""
+        records = (catalog or self.matcher.kb.snapshot).records
+        if records is self._records:
+            return
+        self._records = records
+
+        self.keyword_vocab, self.keyword_ids = self._pack([r.keywords for r in records])
+        self.pain_point_vocab, self.pain_point_ids = self._pack([r.pain_points for r in records])
+        self.has_keywords = np.array([bool(r.keywords) for r in records], dtype=bool)
+        self.complexity_codes = np.array(
+            [_COMPLEXITY_CODES.get(r.complexity, 3) for r in records], dtype=np.intp)
+        self.fast_time_to_value = np.array(['1-2 weeks' in r.time_to_value for r in records], dtype=bool)
+        self.medium_time_to_value = np.array(['2-4 weeks' in r.time_to_value for r in records], dtype=bool)
+        self.positions = {r.feature_id: i for i, r in reversed(list(enumerate(records)))}
+        self._industry_masks: Dict[str, Any] = {}
+
+    @staticmethod
+    def _pack(values: List[Tuple[str, ...]]):
+        """Chuyển list các tuple string thành vocab + ma trận index (F x max_len).
+        Ô trống trỏ tới cột padding cuối cùng (similarity luôn bằng 0)"""
+        vocab: Dict[str, int] = {}
+        for items in values:
+            for item in items:
+                vocab.setdefault(item, len(vocab))
+        width = max((len(items) for items in values), default=0) or 1
+        ids = np.full((len(values), width), len(vocab), dtype=np.intp)
+        for row, items in enumerate(values):
+            ids[row, :len(items)] = [vocab[item] for item in items]
+        return list(vocab), ids
+
+    @staticmethod
+    def _similarity_row(text: str, vocab: List[str], ratio):
+        """Similarity của text với toàn bộ vocab (+ cột padding = 0)"""
+        row = np.zeros(len(vocab) + 1)
+        row[:-1] = [ratio(text, item) for item in vocab]
+        return row / 100.0
+
+    def _industry_mask(self, industry: str):
+        """Mask features có use case chứa industry (cache theo industry)"""
+        mask = self._industry_masks.get(industry)
+        if mask is None:
+            mask = np.array([any(industry in case for case in r.use_cases) for r in self._records], dtype=bool)
+            self._industry_masks[industry] = mask
+        return mask
+
+    def keyword_scores(self, query: MatchQuery, token_rows: Dict[str, Any]):
+        """Keyword score cho mọi feature: max similarity theo feature, trung bình theo token"""
+        if query.keyword_scores is not None:
+            scores = np.zeros(len(self._records))
+            for feature_id, score in query.keyword_scores.items():
+                scores[self.positions[feature_id]] = score
+            return scores
+        if not query.keywords:
+            return np.zeros(len(self._records))
+
+        for token in query.keywords:
+            if token not in token_rows:
+                token_rows[token] = self._similarity_row(token, self.keyword_vocab, self.matcher._token_ratio)
+        similarities = np.stack([token_rows[token] for token in query.keywords])
+        best_per_token = similarities[:, self.keyword_ids].max(axis=2)
+        # Cộng tuần tự theo token (np.sum dùng pairwise summation, lệch ở bit cuối)
+        scores = np.zeros(len(self._records))
+        for token_scores in best_per_token:
+            scores += token_scores
+        scores /= len(query.keywords)
+        return np.where(self.has_keywords, scores, 0.0)
+
+    def semantic_scores(self, query: MatchQuery):
+        """Semantic score cho mọi feature: max similarity với pain points addressed"""
+        if query.semantic_scores is not None:
+            scores = np.zeros(len(self._records))
+            for feature_id, score in query.semantic_scores.items():
+                scores[self.positions[feature_id]] = score
+            return scores
+        row = self._similarity_row(query.pain_point_lower, self.pain_point_vocab,
+                                  self.matcher._phrase_ratio)
+        return row[self.pain_point_ids].max(axis=1)
+
+    def context_scores(self, query: MatchQuery):
+        """Context score cho mọi feature"""
+        scores = np.full(len(self._records), 0.5)
+        if query.industry:
+            scores += np.where(self._industry_mask(query.industry), 0.3, 0.0)
+        size_bonus = _SIZE_BONUS.get(query.company_size)
+        if size_bonus is not None:
+            scores += np.asarray(size_bonus)[self.complexity_codes]
+        return np.minimum(scores, 1.0)
+
+    def feasibility_scores(self, query: MatchQuery):
+        """Feasibility score cho mọi feature"""
+        scores = np.full(len(self._records), 0.5)
+        budget_bonus = _BUDGET_BONUS.get(query.budget)
+        if budget_bonus is not None:
+            scores += np.asarray(budget_bonus)[self.complexity_codes]
+        if query.urgency == 'high':
+            scores += np.where(self.fast_time_to_value, 0.2, 0.0)
+        elif query.urgency == 'medium':
+            scores += np.where(self.medium_time_to_value, 0.2, 0.0)
+        return np.minimum(scores, 1.0)
+
+    def _candidate_ids(self, query: MatchQuery):
+        """feature_id của các candidates giống PainPointMatcher.find_solutions
+        (mode lsh: candidates của LSH index, mode bm25: features trong posting lists), None = toàn bộ"""
+        if self.matcher.candidate_mode == 'lsh':
+            return [record.feature_id for record in self.matcher._lsh_candidates(query.pain_point, query.catalog)]
+        return query.keyword_scores
+
+    def iter_query_scores(self, queries: Iterable[MatchQuery], mask_non_candidates: bool = True):
+        """Yield vector relevance (một phần tử mỗi feature, float64) cho từng query đã compile.
+        Chỉ giữ một hàng trong bộ nhớ mỗi lúc; context/feasibility và similarity theo token được
+        dùng lại giữa các queries. Features không phải candidate (mode bm25, candidate mode lsh) có điểm -inf,
+        trừ khi mask_non_candidates=False (khi đó là điểm đầy đủ với keyword score = 0,
+        giống calculate_relevance_score)"""
+        token_rows: Dict[str, Any] = {}
+        context_rows: Dict[Tuple[str, ...], Any] = {}
+        for query in queries:
+            if self._records is not query.catalog.records:
+                self._ensure_catalog(query.catalog)
+                token_rows.clear()
+                context_rows.clear()
+            # Context/feasibility chỉ phụ thuộc context nên tính một lần cho mỗi tổ hợp
+            context_key = (query.industry, query.company_size, query.budget, query.urgency)
+            context_part = context_rows.get(context_key)
+            if context_part is None:
+                context_part = (self.context_scores(query) * 0.15, self.feasibility_scores(query) * 0.1)
+                context_rows[context_key] = context_part
+
+            # Cộng theo đúng thứ tự của calculate_relevance_score để kết quả float giống hệt
+            scores = (self.keyword_scores(query, token_rows) * 0.4) + \
+                     (self.semantic_scores(query) * 0.35) + \
+                     context_part[0] + \
+                     context_part[1]
+            scores = np.minimum(scores, 1.0)
+
+            if mask_non_candidates:
+                candidate_ids = self._candidate_ids(query)
+                if candidate_ids is not None:
+                    candidates = np.zeros(len(self._records), dtype=bool)
+                    candidates[[self.positions[fid] for fid in candidate_ids]] = True
+                    scores = np.where(candidates, scores, -np.inf)
+            yield scores
+
+    def score_matrix(self, inputs: Iterable[Tuple[str, Dict[str, Any]]], mask_non_candidates: bool = True,
+                     dtype=None):
+        """Ma trận relevance (số query x số feature) cho một batch (pain_point, business_context).
+        Features không phải candidate (mode bm25, candidate mode lsh) có điểm -inf, trừ khi mask_non_candidates=False.
+        dtype (mặc định float64) là kiểu của ma trận kết quả, vd float32 để giảm một nửa bộ nhớ"""
+        catalog = self.matcher.kb.snapshot
+        self._ensure_catalog(catalog)
+        queries = [self.matcher.compile_query(pain_point, context, catalog) for pain_point, context in inputs]
+        matrix = np.empty((len(queries), len(self._records)), dtype=dtype or np.float64)
+        for row, scores in enumerate(self.iter_query_scores(queries, mask_non_candidates)):
+            matrix[row] = scores
+        return matrix
+
+    def find_solutions_batch(self, inputs: Iterable[Tuple[str, Dict[str, Any]]],
+                             max_results: int = 3) -> List[List[Dict[str, Any]]]:
+        """Top-k solutions cho từng (pain_point, business_context) trong batch"""
+        inputs = [(pain_point, context or {}) for pain_point, context in inputs]
+        matrix = self.score_matrix(inputs)
+
+        results = []
+        for (pain_point, _), scores in zip(inputs, matrix):
+            # Stable sort để giữ thứ tự catalog khi bằng điểm, giống find_solutions
+            order = np.argsort(-scores, kind='stable')[:max_results]
+            results.append([self.matcher._build_solution(pain_point, self._records[i], float(scores[i]))
+                            for i in order if scores[i] > 0.1])
+        return results
+
+    def find_solutions(self, pain_point: str, business_context: Dict[str, Any] = None,
+                       max_results: int = 3) -> List[Dict[str, Any]]:
+        """Tìm solutions cho một pain point (cùng output với PainPointMatcher.find_solutions)"""
+        return self.find_solutions_batch([(pain_point, business_context)], max_results)[0]
@@ -6,6 +6,9 @@ Test script cho Pain Point to Solution Agent
 import sys
 import os
 import json
+import random
+import tempfile
+import time
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
@@ -129,6 +132,1141 @@ def test_feature_statistics():
     for complexity, count in stats['complexities'].items():
         print(f"  {complexity}: {count}")
 
+def test_feature_records():
+    """Test FeatureRecord được compile sẵn từ knowledge base"""
+    print("\n" + "="*60)
+    print("FEATURE RECORDS")
+    print("="*60)
+    
+    agent = PainPointToSolutionAgent()
+    records = agent.knowledge_base.get_all_records()
+    
+    assert len(records) == len(agent.knowledge_base.get_all_features())
+    for record in records:
+        assert all(keyword == keyword.lower() for keyword in record.keywords)
+        assert len(set(record.keywords)) == len(record.keywords)
+        print(f"  {record.feature_id}: {record.time_to_value} -> {record.time_to_value_weeks}")
+    
+    assert records[0].time_to_value_weeks == (2.0, 4.0)
+
+def test_bm25_scoring_mode():
+    """Test BM25 scoring mode và keyword lookups dùng inverted index"""
+    print("\n" + "="*60)
+    print("BM25 SCORING MODE")
+    print("="*60)
+    
+    agent = PainPointToSolutionAgent(scoring_mode='bm25')
+    kb = agent.knowledge_base
+    
+    result = agent.process_input({"pain_point": "Our support agents are overwhelmed by repetitive questions"})
+    top_solution = result['suggested_solutions'][0]
+    print(f"Top Solution: {top_solution['feature_name']} (Score: {top_solution['relevance_score']})")
+    assert top_solution['feature_name'] == "AI Agent for FAQ & First Response"
+    
+    # Không có token nào trong index thì không có candidate
+    assert agent.process_input({"pain_point": "xyz"})['suggested_solutions'] == []
+    
+    any_ids = [f['feature_id'] for f in kb.get_features_by_keywords(['support', 'SLA'])]
+    all_ids = [f['feature_id'] for f in kb.get_features_by_keywords(['manual', 'feedback'], match='all')]
+    print(f"any(support, SLA): {any_ids}")
+    print(f"all(manual, feedback): {all_ids}")
+    assert any_ids == ['ai_inbox_001', 'customer_360_001', 'tickets_001']
+    assert all_ids == ['voc_001', 'surveys_001']
+
+def test_vectorized_scorer():
+    """Test VectorizedScorer cho kết quả giống find_solutions"""
+    print("\n" + "="*60)
+    print("VECTORIZED SCORER")
+    print("="*60)
+    
+    try:
+        from vector_engine import VectorizedScorer
+        scorer = VectorizedScorer(PainPointToSolutionAgent().matcher)
+    except ImportError as e:
+        print(f"Skipped: {e}")
+        return
+    
+    batch = [(case['pain_point'], case['business_context']) for case in load_test_cases()]
+    batch.append(("Customers complain about long response times", {"budget_constraints": "low", "urgency_level": "high"}))
+    
+    vectorized = scorer.find_solutions_batch(batch)
+    expected = [scorer.matcher.find_solutions(pain_point, context) for pain_point, context in batch]
+    print(f"Batch size: {len(batch)}, score matrix: {scorer.score_matrix(batch).shape}")
+    assert vectorized == expected
+
+def test_similarity_backends():
+    """Test similarity backend built-in (bit-parallel LCS) và chọn backend qua cấu hình"""
+    print("\n" + "="*60)
+    print("SIMILARITY BACKENDS")
+    print("="*60)
+    
+    from similarity import get_similarity_function, lcs_length, levenshtein_ratio
+    
+    assert lcs_length('kitten', 'sitting') == 4
+    assert lcs_length('customer support' * 10, 'support customer' * 10) == 143
+    assert levenshtein_ratio('kitten', 'sitting') == 62
+    assert levenshtein_ratio('', '') == 100 and levenshtein_ratio('abc', '') == 0
+    # Các trường hợp biên phải giống backend mặc định (fuzz.ratio)
+    default_ratio = get_similarity_function()
+    for a, b in [('', ''), ('abc', ''), ('', 'abc'), ('abc', 'abc'), ('support', 'Support')]:
+        assert levenshtein_ratio(a, b) == default_ratio(a, b), (a, b)
+    assert get_similarity_function('levenshtein') is levenshtein_ratio
+    try:
+        get_similarity_function('unknown')
+        assert False, "Expected ValueError"
+    except ValueError:
+        pass
+    
+    agent = PainPointToSolutionAgent(similarity_backend='levenshtein')
+    result = agent.process_input({'pain_point': 'Customers wait too long for support responses'})
+    print(f"Levenshtein backend: {[s['feature_name'] for s in result['suggested_solutions']]}")
+    assert result['suggested_solutions']
+    assert agent.matcher.similarity_backend == 'levenshtein'
+
+def test_context_score_tables():
+    """Test bảng context/feasibility tính sẵn cho kết quả giống công thức gốc ở mọi tổ hợp context"""
+    print("\n" + "="*60)
+    print("CONTEXT SCORE TABLES")
+    print("="*60)
+    
+    def reference_context(context, feature):
+        score = 0.5
+        industry = context.get('industry', '').lower()
+        if industry and any(industry in case.lower() for case in feature.get('use_cases', [])):
+            score += 0.3
+        size, complexity = context.get('company_size', '').lower(), feature['implementation_complexity'].lower()
+        if (size, complexity) in {('small', 'low'), ('medium', 'low'), ('medium', 'medium'),
+                                  ('large', 'medium'), ('large', 'high')}:
+            score += 0.2
+        return min(score, 1.0)
+    
+    def reference_feasibility(context, feature):
+        score = 0.5
+        budget, complexity = context.get('budget_constraints', '').lower(), feature['implementation_complexity'].lower()
+        if (budget, complexity) in {('low', 'low'), ('moderate', 'low'), ('moderate', 'medium'),
+                                    ('high', 'medium'), ('high', 'high')}:
+            score += 0.3
+        elif budget == 'flexible':
+            score += 0.2
+        urgency = context.get('urgency_level', '').lower()
+        if (urgency == 'high' and '1-2 weeks' in feature['time_to_value']) or \
+                (urgency == 'medium' and '2-4 weeks' in feature['time_to_value']):
+            score += 0.2
+        return min(score, 1.0)
+    
+    agent = PainPointToSolutionAgent()
+    matcher = agent.matcher
+    features = agent.knowledge_base.get_all_features()
+    foreign = dict(features[0], feature_id='not_in_catalog', use_cases=['Banking onboarding'])
+    checked = 0
+    for industry in ('', 'e-commerce', 'support', 'banking', 'unknown'):
+        for size in ('', 'small', 'Medium', 'large', 'enterprise'):
+            for budget in ('', 'low', 'moderate', 'high', 'flexible'):
+                for urgency in ('', 'low', 'medium', 'HIGH'):
+                    context = {'industry': industry, 'company_size': size,
+                               'budget_constraints': budget, 'urgency_level': urgency}
+                    for feature in features + [foreign]:
+                        assert matcher.calculate_context_score(context, feature) == reference_context(context, feature)
+                        assert matcher.calculate_feasibility_score(context, feature) == \
+                            reference_feasibility(context, feature)
+                        checked += 1
+    print(f"Checked {checked} (context, feature) combinations")
+    assert len({id(record.context_scores) for record in agent.knowledge_base.records}) <= 3
+
+def test_similarity_cache():
+    """Test LRU cache cho token/phrase similarity"""
+    print("\n" + "="*60)
+    print("SIMILARITY CACHE")
+    print("="*60)
+    
+    agent = PainPointToSolutionAgent(token_cache_size=20)
+    input_data = {"pain_point": "Our support agents are overwhelmed by repetitive questions"}
+    
+    first = agent.process_input(input_data)
+    second = agent.process_input(input_data)
+    stats = agent.matcher.get_cache_stats()
+    print(f"Token cache: {stats['token_similarity']}")
+    print(f"Phrase cache: {stats['phrase_similarity']}")
+    
+    assert first == second
+    assert stats['token_similarity']['size'] <= 20
+    assert stats['token_similarity']['evictions'] > 0
+    assert stats['phrase_similarity']['hits'] == stats['phrase_similarity']['misses']
+    
+    # LRU: entry vừa được hit không bị loại, entry ít dùng gần đây nhất bị loại
+    from cache import LRUPairCache
+    calls = []
+    cache = LRUPairCache(lambda a, b: calls.append((a, b)) or a + b, maxsize=2)
+    lookup = cache.lookup
+    assert lookup('a', '1') == 'a1' and lookup('b', '2') == 'b2' and lookup('a', '1') == 'a1'
+    lookup('c', '3')
+    assert lookup('a', '1') == 'a1' and calls == [('a', '1'), ('b', '2'), ('c', '3')]
+    lookup('b', '2')
+    assert calls[-1] == ('b', '2') and len(cache) == 2
+    assert cache.stats()['hits'] == 2 and cache.stats()['evictions'] == 2
+
+def _write_variant_catalog(copies: int = 8, seed: int = 7) -> str:
+    """Tạo catalog tạm gồm nhiều bản biến thể (có cả bản trùng) của filum_features.json"""
+    rng = random.Random(seed)
+    with open('data/filum_features.json', 'r', encoding='utf-8') as f:
+        base_features = json.load(f)
+    
+    features = []
+    for copy in range(copies):
+        for feature in base_features:
+            variant = dict(feature, feature_id=f"{feature['feature_id']}_{copy}")
+            if copy % 2:
+                variant['keywords'] = rng.sample(feature['keywords'], k=len(feature['keywords']) // 2 + 1)
+                variant['implementation_complexity'] = rng.choice(['low', 'medium', 'high'])
+            features.append(variant)
+    
+    handle, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(handle, 'w', encoding='utf-8') as f:
+        json.dump(features, f)
+    return path
+
+def test_top_k_pruning():
+    """Test top-k có pruning cho kết quả giống exhaustive path"""
+    print("\n" + "="*60)
+    print("TOP-K PRUNING")
+    print("="*60)
+    
+    catalog_path = _write_variant_catalog()
+    try:
+        for scoring_mode in ('fuzzy', 'bm25'):
+            agent = PainPointToSolutionAgent(catalog_path, scoring_mode=scoring_mode)
+            for case in load_test_cases():
+                for max_results in (1, 3, 10):
+                    pruned = agent.matcher.find_solutions(case['pain_point'], case['business_context'], max_results)
+                    exhaustive = agent.matcher.find_solutions(case['pain_point'], case['business_context'], max_results,
+                                                              exhaustive=True)
+                    assert pruned == exhaustive
+            print(f"  {scoring_mode}: pruned results match exhaustive path")
+    finally:
+        os.remove(catalog_path)
+
+def test_process_batch():
+    """Test process_batch song song với error isolation"""
+    print("\n" + "="*60)
+    print("PARALLEL BATCH")
+    print("="*60)
+    
+    agent = PainPointToSolutionAgent()
+    inputs = load_test_cases() + ["not a dict", {"pain_point": ""}]
+    
+    ordered = list(agent.process_batch(inputs, max_workers=2, chunksize=2))
+    as_completed = list(agent.process_batch(inputs, max_workers=2, chunksize=1, ordered=False))
+    
+    assert [index for index, _ in ordered] == list(range(len(inputs)))
+    assert sorted(as_completed, key=lambda item: item[0]) == ordered
+    for index, result in ordered[:3]:
+        assert result == agent.process_input(inputs[index])
+    print(f"  Item 3 error: {ordered[3][1]['error']}")
+    assert 'error' in ordered[3][1] and 'error' in ordered[4][1]
+
+def test_json_service():
+    """Test asyncio JSON service: match, batch, coalescing và lỗi input"""
+    print("\n" + "="*60)
+    print("JSON SERVICE")
+    print("="*60)
+    
+    import asyncio
+    from service import AgentService
+    
+    async def request(port, method, path, payload=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, response_body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(response_body)
+    
+    async def run():
+        service = AgentService(max_workers=2, use_processes=False)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            case = load_test_cases()[0]
+            responses = await asyncio.gather(*(request(port, 'POST', '/match', case) for _ in range(5)))
+            status, batch = await request(port, 'POST', '/match/batch', {'inputs': load_test_cases()})
+            bad_status, _ = await request(port, 'POST', '/match', {'business_context': {}})
+            stats_status, stats = await request(port, 'GET', '/stats')
+            # Content-Length không hợp lệ là lỗi của client
+            length_statuses = []
+            for content_length in ('abc', '-5'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(f"POST /match HTTP/1.1\r\nConnection: close\r\n"
+                             f"Content-Length: {content_length}\r\n\r\n".encode('latin-1'))
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                length_statuses.append(int(response.split()[1]))
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+        
+        expected = service.agent.process_input(case)
+        assert all(response == (200, expected) for response in responses)
+        assert status == 200 and batch['results'][0] == expected
+        assert bad_status == 400 and stats_status == 200
+        assert length_statuses == [400, 400]
+        print(f"Service stats: {stats['service']}")
+        assert stats['service']['computed'] + stats['service']['coalesced'] == stats['service']['items']
+    
+    asyncio.run(run())
+    
+    async def cancelled_waiter():
+        # Client chờ bị huỷ không làm mất lần tính đang chạy: request giống hệt sau đó được gộp vào
+        service = AgentService(max_workers=1, use_processes=False)
+        process_isolated = service.agent._process_isolated
+        service.agent._process_isolated = lambda input_data: (time.sleep(0.2), process_isolated(input_data))[1]
+        try:
+            case = load_test_cases()[0]
+            first = asyncio.ensure_future(service.match(case))
+            await asyncio.sleep(0.05)
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+            result = await service.match(case)
+            assert service.stats['computed'] == 1 and service.stats['coalesced'] == 1
+            assert not service._in_flight
+            return result
+        finally:
+            service.close()
+    
+    assert 'suggested_solutions' in asyncio.run(cancelled_waiter())
+    
+    async def broken_pool():
+        # Worker process chết: pool được tạo lại, request vẫn thành công
+        service = AgentService(max_workers=1)
+        try:
+            case = load_test_cases()[0]
+            expected = await service.match(case)
+            for process in list(service._executor._processes.values()):
+                process.kill()
+                process.join()
+            assert await service.match(load_test_cases()[1]) == service.agent.process_input(load_test_cases()[1])
+            assert await service.match(case) == expected
+        finally:
+            service.close()
+    
+    asyncio.run(broken_pool())
+
+def test_streaming_json_lines():
+    """Test pipeline JSON Lines: giữ thứ tự dòng và báo lỗi từng dòng"""
+    print("\n" + "="*60)
+    print("STREAMING JSON LINES")
+    print("="*60)
+    
+    import io
+    from itertools import islice
+    from stream import iter_input_lines, match_stream
+    
+    agent = PainPointToSolutionAgent()
+    cases = load_test_cases()
+    source = io.StringIO("\n".join([json.dumps(cases[0]), "{not json", "", json.dumps(cases[1]), "[]"]))
+    
+    records = list(match_stream(agent, iter_input_lines(source)))
+    for record in records:
+        print(f"  line {record['line']}: {record['result'].get('error', 'ok')}")
+    
+    assert [record['line'] for record in records] == [1, 2, 4, 5]
+    assert records[0]['result'] == agent.process_input(cases[0])
+    assert records[1]['result']['error'].startswith("Invalid JSON on line 2")
+    assert records[3]['result']['error'] == "Input must be a JSON object"
+    
+    # Chuỗi dài dòng lỗi được trả về ngay, không bị giữ lại chờ dòng hợp lệ kế tiếp
+    read = []
+    def source_lines():
+        for line in [json.dumps(cases[0])] + ["{not json"] * 1000 + [json.dumps(cases[1])]:
+            read.append(line)
+            yield line
+    for max_workers in (1, 2):
+        read.clear()
+        records = list(islice(match_stream(agent, iter_input_lines(source_lines()), max_workers=max_workers,
+                                           chunksize=4), 3))
+        assert [record['line'] for record in records] == [1, 2, 3] and len(read) < 100
+
+def test_result_cache():
+    """Test result cache: key chuẩn hoá, TTL và invalidate khi catalog thay đổi"""
+    print("\n" + "="*60)
+    print("RESULT CACHE")
+    print("="*60)
+    
+    from cache import LRUCache
+    
+    agent = PainPointToSolutionAgent(result_cache_size=8)
+    case = load_test_cases()[0]
+    variant = dict(case, pain_point="OUR support agents are overwhelmed by the repetitive questions!!")
+    
+    first = agent.process_input(case)
+    first['suggested_solutions'].clear()
+    assert agent.process_input(variant) == agent.process_input(case) != first
+    assert agent.get_cache_stats()['result']['hits'] == 2
+    
+    agent.knowledge_base.reload()
+    agent.process_input(case)
+    stats = agent.get_cache_stats()['result']
+    print(f"Result cache: {stats}")
+    assert stats['misses'] == 2 and stats['size'] == 1
+    
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    now[0] = 10.0
+    assert cache.get('a') is None and cache.stats()['expirations'] == 1
+
+def _index_view(snapshot):
+    """Nội dung các index của snapshot dạng so sánh được (không phụ thuộc thứ tự posting)"""
+    return (
+        [record.feature_id for record in snapshot.records],
+        {key: sorted(postings) for key, postings in snapshot.keyword_index.items()},
+        {key: sorted(postings) for key, postings in snapshot.token_index.items()},
+        snapshot.doc_lengths,
+        snapshot.positions
+    )
+
+def test_hot_reload():
+    """Test hot reload: diff theo feature_id, cập nhật incremental và giữ snapshot cũ nguyên vẹn"""
+    print("\n" + "="*60)
+    print("HOT RELOAD")
+    print("="*60)
+    
+    from knowledge_base import KnowledgeBase
+    
+    catalog_path = _write_variant_catalog(copies=2)
+    try:
+        kb = KnowledgeBase(catalog_path)
+        old_snapshot = kb.snapshot
+        old_view = _index_view(old_snapshot)
+        assert not kb.reload_if_changed()
+        
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            features = json.load(f)
+        features[0] = dict(features[0], keywords=['brand new keyword', 'support'])
+        del features[3]
+        features.insert(1, dict(features[5], feature_id='added_001', pain_points_addressed=['Slow onboarding']))
+        with open(catalog_path, 'w', encoding='utf-8') as f:
+            json.dump(features, f)
+        os.utime(catalog_path, ns=(0, old_snapshot.version + 10**9))
+        
+        assert kb.reload_if_changed()
+        print(f"Reload stats: {kb.last_reload_stats}")
+        assert kb.last_reload_stats == {'added': 1, 'updated': 1, 'removed': 1,
+                                        'unchanged': len(features) - 2, 'full_rebuild': 0}
+        assert kb.version == old_snapshot.version + 1
+        assert _index_view(kb.snapshot) == _index_view(KnowledgeBase(catalog_path).snapshot)
+        assert _index_view(old_snapshot) == old_view
+        assert kb.get_features_by_keywords(['brand new keyword'])[0]['feature_id'] == features[0]['feature_id']
+    finally:
+        os.remove(catalog_path)
+
+def test_catalog_loader():
+    """Test streaming loader: entries sai schema/trùng id bị bỏ qua và ghi vào report, hỗ trợ JSON Lines"""
+    print("\n" + "="*60)
+    print("CATALOG LOADER")
+    print("="*60)
+    
+    import catalog_loader
+    from knowledge_base import KnowledgeBase
+    
+    with open('data/filum_features.json', 'r', encoding='utf-8') as f:
+        features = json.load(f)
+    entries = [features[0], {'feature_name': 'No id'}, features[1], dict(features[0]),
+               dict(features[2], keywords='not a list'), 42] + features[2:]
+    
+    fd, array_path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    fd, lines_path = tempfile.mkstemp(suffix='.jsonl')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for feature in features:
+            f.write(json.dumps(feature, ensure_ascii=False) + "\n")
+        f.write('{"feature_id": "broken"\n')
+    
+    chunk_size = catalog_loader.CHUNK_SIZE
+    catalog_loader.CHUNK_SIZE = 7  # chunk nhỏ để phần tử/string bị cắt qua nhiều chunk
+    try:
+        kb = KnowledgeBase(array_path)
+        report = kb.load_report
+        print(f"Load report: loaded={report.loaded}, malformed={report.malformed_count}")
+        assert kb.get_all_features() == features
+        assert report.loaded == len(features) and report.malformed_count == 4 and report.fatal_error is None
+        assert [item['entry'] for item in report.malformed] == [2, 4, 5, 6]
+        assert 'Duplicate' in report.malformed[1]['errors'][0]
+        
+        kb = KnowledgeBase(lines_path)
+        assert kb.get_all_features() == features
+        assert kb.load_report.malformed_count == 1
+        
+        # Lỗi cấu trúc giữa file: không publish catalog bị cắt cụt
+        with open(array_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(features[:3])[:-1] + ' "x" "y"]')
+        kb = KnowledgeBase(array_path)
+        assert kb.load_report.fatal_error and kb.load_report.loaded == 0
+        assert kb.get_all_features() == []
+    finally:
+        catalog_loader.CHUNK_SIZE = chunk_size
+        os.remove(array_path)
+        os.remove(lines_path)
+
+def test_compiled_catalog():
+    """Test catalog đã compile (mmap): cùng features, index và kết quả matching với JSON"""
+    print("\n" + "="*60)
+    print("COMPILED CATALOG")
+    print("="*60)
+    
+    import pickle
+    from knowledge_base import KnowledgeBase
+    from compiled_catalog import CompiledCatalog, CompiledFeature, write_compiled_catalog
+    
+    catalog_path = _write_variant_catalog(copies=3)
+    snapshot_path = catalog_path + '.snap'
+    try:
+        kb = KnowledgeBase(catalog_path)
+        write_compiled_catalog(kb.snapshot, snapshot_path)
+        compiled_kb = KnowledgeBase(snapshot_path)
+        
+        assert isinstance(compiled_kb.features[0], CompiledFeature)
+        assert compiled_kb.get_all_features() == kb.get_all_features()
+        assert [list(feature) for feature in compiled_kb.features] == [list(feature) for feature in kb.features]
+        assert pickle.loads(pickle.dumps(compiled_kb.features[0])) == kb.features[0]
+        assert _index_view(compiled_kb.snapshot) == _index_view(kb.snapshot)
+        assert compiled_kb.get_features_by_keywords(['support', 'automation'], match='all') == \
+            kb.get_features_by_keywords(['support', 'automation'], match='all')
+        
+        input_data = {'pain_point': 'Customers wait too long for support responses',
+                      'business_context': {'industry': 'retail', 'company_size': 'medium'}}
+        for scoring_mode in ('fuzzy', 'bm25'):
+            expected = PainPointToSolutionAgent(catalog_path, scoring_mode=scoring_mode).process_input(input_data)
+            result = PainPointToSolutionAgent(snapshot_path, scoring_mode=scoring_mode).process_input(input_data)
+            assert json.dumps(result) == json.dumps(expected)
+        print(f"Compiled snapshot: {os.path.getsize(snapshot_path)} bytes, {len(compiled_kb.records)} features")
+        
+        # Reload: mmap cũ được đóng khi không còn ai giữ snapshot cũ
+        catalog = compiled_kb.snapshot.compiled
+        old_snapshot = compiled_kb.snapshot
+        compiled_kb.reload()
+        assert not catalog.closed and old_snapshot.features[0]['feature_id'] == kb.features[0]['feature_id']
+        del old_snapshot
+        assert catalog.closed and not compiled_kb.snapshot.compiled.closed
+        catalog = compiled_kb.snapshot.compiled
+        compiled_kb.apply_changes(delete=[kb.features[0]['feature_id']])
+        assert not catalog.closed
+        compiled_kb.reload()
+        assert catalog.closed
+        assert compiled_kb.get_all_features() == kb.get_all_features()
+        with CompiledCatalog(snapshot_path) as catalog:
+            assert catalog.feature_count == len(kb.features)
+        assert catalog.closed
+    finally:
+        os.remove(catalog_path)
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+def test_benchmark_suite():
+    """Test generator catalog/queries (deterministic, đúng schema) và kết quả benchmark"""
+    print("\n" + "="*60)
+    print("BENCHMARK SUITE")
+    print("="*60)
+    
+    from benchmark import generate_catalog, generate_queries, run_benchmark
+    from catalog_loader import validate_feature
+    
+    catalog = generate_catalog(200, seed=5)
+    assert catalog == generate_catalog(200, seed=5) and catalog != generate_catalog(200, seed=6)
+    assert all(not validate_feature(feature) for feature in catalog)
+    assert len({feature['feature_id'] for feature in catalog}) == len(catalog)
+    inputs, targets = generate_queries(catalog, 20, seed=1)
+    assert (inputs, targets) == generate_queries(catalog, 20, seed=1)
+    
+    report = run_benchmark([10], num_queries=5, measure_memory=False)
+    result = report['results'][0]
+    print(f"Benchmark: startup {result['startup_seconds']:.4f}s, p50 {result['process_input_ms']['p50']:.2f}ms")
+    assert result['num_features'] == 10 and result['throughput_qps'] > 0
+    assert set(result['process_input_ms']) == {'mean', 'p50', 'p90', 'p95', 'p99', 'max'}
+    json.dumps(report)
+
+def test_stage_profiling():
+    """Test profiling theo stage: số liệu theo request/cộng dồn, tắt thì không còn wrapper"""
+    print("\n" + "="*60)
+    print("STAGE PROFILING")
+    print("="*60)
+    
+    agent = PainPointToSolutionAgent()
+    input_data = {'pain_point': 'Customers wait too long for support responses',
+                  'business_context': {'industry': 'retail', 'urgency_level': 'high'}}
+    expected = agent.process_input(input_data)
+    assert agent.get_profile() == {'requests': 0, 'stages': {}, 'last_request': {}, 'enabled': False}
+    
+    agent.enable_profiling()
+    assert agent.process_input(input_data) == expected
+    agent.process_input(input_data)
+    profile = agent.get_profile()
+    feature_count = len(agent.knowledge_base.get_all_features())
+    for name, stats in profile['stages'].items():
+        print(f"  {name}: {stats['calls']} calls, {stats['total_ms']:.2f}ms")
+    assert profile['enabled'] and profile['requests'] == 2
+    assert profile['stages']['process_input']['calls'] == 2
+    assert profile['last_request']['context']['calls'] == feature_count
+    assert {'keyword', 'semantic', 'feasibility', 'alternative_approaches', 'next_steps'} <= set(profile['stages'])
+    
+    # Gọi ngoài request thì không giữ lại số liệu nào
+    agent.matcher.find_solutions(input_data['pain_point'], input_data['business_context'])
+    assert getattr(agent.profiler._local, 'current', None) is None
+    assert agent.get_profile()['stages'] == profile['stages']
+    
+    agent.disable_profiling()
+    agent.process_input(input_data)
+    assert agent.get_profile()['requests'] == 2
+    assert 'process_input' not in vars(agent) and '_keyword_score' not in vars(agent.matcher)
+    agent.reset_profile()
+    assert agent.get_profile()['stages'] == {}
+
+def test_search_features_index():
+    """Test search_features dùng trigram index: cùng kết quả/thứ tự với full scan, hỗ trợ limit/offset"""
+    print("\n" + "="*60)
+    print("SEARCH FEATURES INDEX")
+    print("="*60)
+    
+    from knowledge_base import KnowledgeBase
+    
+    def full_scan(features, query):
+        query = query.lower()
+        return [feature for feature in features
+                if query in feature.get('feature_name', '').lower()
+                or query in feature.get('description', '').lower()
+                or any(query in keyword.lower() for keyword in feature.get('keywords', []))
+                or any(query in point.lower() for point in feature.get('pain_points_addressed', []))]
+    
+    catalog_path = _write_variant_catalog(copies=4)
+    try:
+        kb = KnowledgeBase(catalog_path)
+        features = kb.get_all_features()
+        rng = random.Random(11)
+        texts = [text for feature in features for text in [feature['feature_name'], feature['description']] + feature['keywords']]
+        queries = ['', 'a', 'AI', 'support', 'Customer', 'no such text'] + \
+            [text[start:start + rng.randint(1, 12)] for text in rng.sample(texts, 60) for start in [rng.randint(0, len(text))]]
+        for query in queries:
+            expected = full_scan(features, query)
+            assert kb.search_features(query) == expected, query
+            assert kb.search_features(query, limit=2, offset=1) == expected[1:3], query
+        print(f"Checked {len(queries)} queries, 'support' -> {len(kb.search_features('support'))} features")
+        
+        try:
+            kb.search_features('support', offset=-1)
+            assert False, "Expected ValueError"
+        except ValueError:
+            pass
+        
+        # Index được build/cập nhật ở phía writer: sau apply_changes và reload vẫn giống build lại từ đầu
+        from knowledge_base import CatalogSnapshot
+        def index_view(snapshot):
+            positions = snapshot._trigram_positions
+            return {trigram: sorted(positions[key] for key in postings)
+                    for trigram, postings in snapshot._trigram_index.items()}
+        kb.apply_changes(add=[dict(features[0], feature_id='new_search_feature', feature_name='Zyxwv support')],
+                         update={features[1]['feature_id']: {'description': 'Qwerty refund flow'}},
+                         delete=[features[2]['feature_id']])
+        assert kb.snapshot._trigram_index is not None
+        rebuilt = CatalogSnapshot(kb.snapshot.records)
+        rebuilt.build_search_index()
+        assert index_view(kb.snapshot) == index_view(rebuilt)
+        for query in ['zyxwv', 'qwerty refund', 'support', features[2]['feature_name']]:
+            assert kb.search_features(query) == full_scan(kb.get_all_features(), query), query
+        kb.reload()
+        assert kb.snapshot._trigram_index is not None and kb.search_features('zyxwv') == []
+        assert kb.search_features('support') == full_scan(features, 'support')
+    finally:
+        os.remove(catalog_path)
+
+def test_incremental_statistics():
+    """Test facet counts duy trì incremental khi reload giống đếm lại toàn bộ catalog"""
+    print("\n" + "="*60)
+    print("INCREMENTAL STATISTICS")
+    print("="*60)
+    
+    from knowledge_base import KnowledgeBase, FACET_FIELDS
+    
+    def recount(features, field):
+        counts = {}
+        for feature in features:
+            value = feature.get(field, 'Unknown')
+            for item in dict.fromkeys(value if isinstance(value, list) else [value]):
+                counts[item] = counts.get(item, 0) + 1
+        return counts
+    
+    catalog_path = _write_variant_catalog(copies=2)
+    try:
+        kb = KnowledgeBase(catalog_path)
+        stats = kb.get_feature_statistics()
+        assert stats['total_features'] == len(kb.features)
+        assert stats['categories'] == recount(kb.features, 'category')
+        assert all(stats['facets'][field] == recount(kb.features, field) for field in FACET_FIELDS)
+        
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            features = json.load(f)
+        features[0] = dict(features[0], subcategory='Brand New', use_cases=['Onboarding', 'Onboarding'])
+        del features[2]
+        features.append(dict(features[1], feature_id='added_001', category='New Category'))
+        del features[3]['time_to_value']
+        with open(catalog_path, 'w', encoding='utf-8') as f:
+            json.dump(features, f)
+        kb.reload()
+        
+        stats = kb.get_feature_statistics()
+        print(f"After reload: {stats['total_features']} features, subcategories {stats['facets']['subcategory']}")
+        assert kb.last_reload_stats['full_rebuild'] == 0
+        assert stats['total_features'] == len(features) and stats['version'] == 1
+        for field in FACET_FIELDS:
+            assert stats['facets'][field] == recount(features, field), field
+        assert stats['facets']['use_cases']['Onboarding'] == 1
+        assert stats['facets']['time_to_value']['Unknown'] == 1
+        assert kb.get_facet_counts('feature_name') == recount(features, 'feature_name')
+    finally:
+        os.remove(catalog_path)
+
+def test_catalog_mutations():
+    """Test add/update/delete feature: copy-on-write, index giống build lại toàn bộ, readers không cần lock"""
+    print("\n" + "="*60)
+    print("CATALOG MUTATIONS")
+    print("="*60)
+    
+    import asyncio
+    import threading
+    from knowledge_base import KnowledgeBase, CatalogSnapshot, FeatureRecord
+    from service import AgentService
+    
+    catalog_path = _write_variant_catalog(copies=2)
+    try:
+        kb = KnowledgeBase(catalog_path)
+        old_snapshot = kb.snapshot
+        old_view = _index_view(old_snapshot)
+        old_statistics = kb.get_feature_statistics()
+        first_id = kb.records[0].feature_id
+        
+        new_feature = dict(kb.features[1], feature_id='added_001', keywords=['brand new keyword'])
+        assert kb.add_feature(new_feature)['added'] == 1
+        new_feature['keywords'].append('mutated by caller')
+        assert kb.update_feature(first_id, {'subcategory': 'Edited', 'keywords': ['edited keyword']})['updated'] == 1
+        stats = kb.apply_changes(add=[dict(kb.features[2], feature_id='added_002')], delete=[kb.records[3].feature_id])
+        print(f"Mutation stats: {stats}, version {kb.version}")
+        assert stats == {'added': 1, 'updated': 0, 'removed': 1, 'unchanged': len(kb.records) - 1, 'full_rebuild': 0}
+        assert kb.version == old_snapshot.version + 3
+        
+        rebuilt = CatalogSnapshot([FeatureRecord(feature) for feature in kb.features])
+        assert _index_view(kb.snapshot) == _index_view(rebuilt)
+        assert kb.snapshot.facets == rebuilt.facets
+        assert _index_view(old_snapshot) == old_view and kb.snapshot.features is not old_snapshot.features
+        assert old_snapshot.get_facet_counts('subcategory') == old_statistics['facets']['subcategory']
+        assert kb.get_features_by_keywords(['brand new keyword'])[0]['feature_id'] == 'added_001'
+        assert not kb.get_features_by_keywords(['mutated by caller'])
+        assert kb.get_feature_by_id(first_id)['subcategory'] == 'Edited'
+        
+        # Thay đổi lỗi thì không publish gì
+        version = kb.version
+        for bad_change, error in ((lambda: kb.delete_feature('missing'), KeyError),
+                                  (lambda: kb.add_feature({'feature_id': 'added_001', 'feature_name': 'Dup'}), ValueError),
+                                  (lambda: kb.update_feature(first_id, {'keywords': 'not a list'}), ValueError),
+                                  (lambda: kb.apply_changes(add=[{'feature_name': 'No id'}], delete=[first_id]), ValueError)):
+            try:
+                bad_change()
+                assert False, "Expected an error"
+            except error:
+                pass
+        assert kb.version == version
+        
+        # Readers trên nhiều thread luôn thấy một snapshot nhất quán trong khi catalog thay đổi
+        agent = PainPointToSolutionAgent(catalog_path)
+        case = load_test_cases()[0]
+        stop = threading.Event()
+        problems = []
+        
+        def read() -> None:
+            while not stop.is_set():
+                snapshot = agent.knowledge_base.snapshot
+                if len(snapshot.records_by_id) != len(snapshot.records) or \
+                        any(snapshot.positions[record.feature_id] != position
+                            for position, record in enumerate(snapshot.records)):
+                    problems.append(snapshot.version)
+                if 'suggested_solutions' not in agent.process_input(case):
+                    problems.append('no solutions')
+        
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for index in range(20):
+            agent.knowledge_base.add_feature(dict(agent.knowledge_base.features[0], feature_id=f'temp_{index}'))
+            if index % 2:
+                agent.knowledge_base.delete_feature(f'temp_{index - 1}')
+        stop.set()
+        for reader in readers:
+            reader.join()
+        assert not problems, problems[:5]
+        assert len(agent.knowledge_base.records) == len(old_snapshot.records) + 10
+        
+        # Worker processes của process_batch chạy lại các thay đổi nên thấy cùng catalog với process chính
+        agent.knowledge_base.update_feature(agent.knowledge_base.records[0].feature_id, {
+            'feature_name': 'Edited in memory',
+            'pain_points_addressed': [case['pain_point']], 'keywords': ['overwhelmed', 'repetitive', 'questions']})
+        batch = [case, load_test_cases()[1]]
+        assert agent.process_input(case)['suggested_solutions'][0]['feature_name'] == 'Edited in memory'
+        assert [result for _, result in agent.process_batch(batch, max_workers=2, chunksize=1)] == \
+            [agent.process_input(input_data) for input_data in batch]
+        agent.knowledge_base.reload()
+        assert agent.knowledge_base.applied_changes == ()
+        
+        async def edit_through_service():
+            service = AgentService(catalog_path, max_workers=2, use_processes=False)
+            try:
+                status, payload = await service.handle_request(
+                    'PATCH', f'/features/{first_id}', json.dumps({'feature_name': 'Renamed'}).encode('utf-8'))
+                _, feature = await service.handle_request('GET', f'/features/{first_id}', b'')
+                try:
+                    await service.handle_request('DELETE', '/features/missing', b'')
+                    missing_status = 200
+                except Exception as e:
+                    missing_status = e.status
+                return status, payload, feature, missing_status
+            finally:
+                service.close()
+        
+        status, payload, feature, missing_status = asyncio.run(edit_through_service())
+        assert status == 200 and payload['version'] == 1 and payload['changes']['updated'] == 1
+        assert feature['feature_name'] == 'Renamed' and missing_status == 404
+    finally:
+        os.remove(catalog_path)
+
+def test_tfidf_semantic_mode():
+    """Test semantic mode tfidf: điểm trong [0, 1], bắt được paraphrase, numpy và Python cho cùng kết quả"""
+    print("\n" + "="*60)
+    print("TF-IDF SEMANTIC MODE")
+    print("="*60)
+    
+    import tfidf
+    
+    agent = PainPointToSolutionAgent(semantic_mode='tfidf')
+    matcher = agent.matcher
+    index = agent.knowledge_base.snapshot.get_tfidf_index()
+    
+    pain_point = "Our agents are burned out answering the same repetitive questions all day"
+    scores = index.feature_scores(pain_point)
+    print(f"TF-IDF scores: { {fid: round(score, 3) for fid, score in scores.items()} }")
+    assert max(scores, key=scores.get) == 'ai_inbox_001'
+    assert all(0.0 < score <= 1.0 for score in scores.values())
+    
+    # Feature ngoài catalog được vector hoá bằng idf của index
+    record = agent.knowledge_base.records_by_id['ai_inbox_001']
+    assert abs(index.similarity(pain_point, record) - scores['ai_inbox_001']) < 1e-9
+    assert abs(matcher.calculate_semantic_score(pain_point, dict(record.data)) - scores['ai_inbox_001']) < 1e-9
+    
+    if tfidf.np is not None:
+        numpy_module, tfidf.np = tfidf.np, None
+        try:
+            assert index.feature_scores(pain_point) == scores
+        finally:
+            tfidf.np = numpy_module
+    
+    for case in load_test_cases():
+        context = case.get('business_context', {})
+        assert matcher.find_solutions(case['pain_point'], context) == \
+            matcher.find_solutions(case['pain_point'], context, exhaustive=True)
+    
+    # Snapshot mới (sau khi sửa catalog) có index riêng, đã được build trước khi publish
+    agent.knowledge_base.update_feature('voc_001', {'pain_points_addressed': ['Agents burned out by repetitive questions']})
+    assert agent.knowledge_base.snapshot._tfidf_index not in (None, index)
+    assert max(matcher.compile_query(pain_point).semantic_scores.items(), key=lambda item: item[1])[0] == 'voc_001'
+    agent.knowledge_base.reload()
+    assert agent.knowledge_base.snapshot._tfidf_index is not None
+
+def test_lsh_candidates():
+    """Test candidate mode lsh: ít candidates, recall cao và candidates được score chính xác"""
+    print("\n" + "="*60)
+    print("LSH CANDIDATES")
+    print("="*60)
+    
+    from benchmark import generate_catalog, generate_queries
+    from knowledge_base import KnowledgeBase
+    from matcher import PainPointMatcher
+    
+    handle, catalog_path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(handle, 'w', encoding='utf-8') as f:
+        json.dump(generate_catalog(2000, seed=3), f)
+    try:
+        kb = KnowledgeBase(catalog_path)
+        exact = PainPointMatcher(kb, similarity_backend='levenshtein')
+        approximate = PainPointMatcher(kb, similarity_backend='levenshtein', candidate_mode='lsh')
+        index = kb.snapshot.get_lsh_index(approximate.lsh_bands, approximate.lsh_rows)
+        inputs, targets = generate_queries(kb.features, 40, seed=2)
+        
+        narrow = kb.snapshot.get_lsh_index(8, 4)
+        hits, candidate_counts, narrow_counts = 0, [], []
+        for input_data, target in zip(inputs, targets):
+            pain_point, context = input_data['pain_point'], input_data['business_context']
+            candidates = index.candidates(pain_point)
+            candidate_counts.append(len(candidates))
+            narrow_counts.append(len(narrow.candidates(pain_point)))
+            hits += target in candidates
+            assert len(index.candidates(pain_point, min_band_matches=4)) <= len(candidates)
+            # Candidates được rescore bằng đúng điểm của matcher đầy đủ
+            query = exact.compile_query(pain_point, context)
+            expected = [exact._build_solution(pain_point, record, score) for score, record in
+                        exact._rank_exhaustive(query, kb.get_records_by_ids(candidates))[:3]]
+            assert approximate.find_solutions(pain_point, context) == expected
+        mean_candidates = sum(candidate_counts) / len(candidate_counts)
+        print(f"LSH recall {hits / len(targets):.2f}, mean candidates {mean_candidates:.0f} / {len(kb.records)}")
+        assert hits / len(targets) >= 0.9
+        assert mean_candidates < len(kb.records) / 4
+        # Ít bands / nhiều rows thì ít candidates hơn
+        assert sum(narrow_counts) < sum(candidate_counts)
+        assert index.candidates('the and of') == []
+        
+        # VectorizedScorer chỉ xếp hạng các candidates của LSH, giống matcher
+        try:
+            from vector_engine import VectorizedScorer
+        except ImportError:
+            VectorizedScorer = None
+        if VectorizedScorer is not None:
+            batch = [(input_data['pain_point'], input_data['business_context']) for input_data in inputs[:8]]
+            for matcher in (approximate, PainPointMatcher(kb, similarity_backend='levenshtein', scoring_mode='bm25',
+                                                          candidate_mode='lsh')):
+                assert VectorizedScorer(matcher).find_solutions_batch(batch) == \
+                    [matcher.find_solutions(pain_point, context) for pain_point, context in batch]
+        
+        # Feature mới được đưa vào index của snapshot mới
+        kb.add_feature(dict(kb.features[0], feature_id='added_001', pain_points_addressed=['Zebra quokka wombat']))
+        assert 'added_001' in kb.snapshot.get_lsh_index(approximate.lsh_bands, approximate.lsh_rows).candidates(
+            'our wombat and quokka problem')
+        assert approximate.find_solutions('our zebra quokka wombat problem')[0]['feature_name'] == kb.features[0]['feature_name']
+        
+        # Index được derive incremental (không build lại trên request), cho cùng candidates với build mới
+        from lsh import MinHashLSH
+        key = (approximate.lsh_bands, approximate.lsh_rows)
+        added_index = kb.snapshot.get_lsh_index(*key)
+        kb.apply_changes(update={kb.features[1]['feature_id']: {'pain_points_addressed': ['Wombat quokka billing']},
+                                 kb.features[2]['feature_id']: {'description': 'unchanged pain points'}},
+                         delete=[kb.features[3]['feature_id'], 'added_001'])
+        kb.reload()
+        kb.add_feature(dict(kb.features[5], feature_id='added_002'))
+        assert key in kb.snapshot._lsh_indexes and (8, 4) in kb.snapshot._lsh_indexes
+        fresh = MinHashLSH(kb.records, *key)
+        for pain_point in [input_data['pain_point'] for input_data in inputs] + ['our wombat and quokka problem']:
+            assert sorted(kb.snapshot.get_lsh_index(*key).candidates(pain_point)) == sorted(fresh.candidates(pain_point))
+        # Snapshot cũ vẫn giữ index của nó
+        assert 'added_001' in added_index.candidates('our wombat and quokka problem')
+    finally:
+        os.remove(catalog_path)
+
+def test_catalog_manager():
+    """Test multi-tenant: load lazy, dùng chung records giữa tenants, LRU eviction theo số tenants/memory budget"""
+    print("\n" + "="*60)
+    print("CATALOG MANAGER")
+    print("="*60)
+    
+    from catalog_manager import CatalogManager, estimate_size
+    
+    with open('data/filum_features.json', 'r', encoding='utf-8') as f:
+        base_features = json.load(f)
+    paths = {}
+    for tenant in ('alpha', 'beta', 'gamma'):
+        features = [dict(feature) for feature in base_features]
+        features[0]['description'] += f" ({tenant} edition)"
+        handle, paths[tenant] = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            json.dump(features, f)
+    try:
+        manager = CatalogManager(paths, max_loaded=2)
+        assert manager.loaded_tenants == []
+        case = load_test_cases()[0]
+        assert manager.process_input('alpha', case) == PainPointToSolutionAgent(paths['alpha']).process_input(case)
+        
+        alpha, beta = manager.get_agent('alpha'), manager.get_agent('beta')
+        shared_id, own_id = base_features[1]['feature_id'], base_features[0]['feature_id']
+        assert alpha.knowledge_base.records_by_id[shared_id] is beta.knowledge_base.records_by_id[shared_id]
+        assert alpha.knowledge_base.records_by_id[own_id] is not beta.knowledge_base.records_by_id[own_id]
+        stats = manager.stats()
+        print(f"Manager stats: {stats}")
+        assert stats['pool']['records'] == len(base_features) + 1
+        
+        # alpha vừa được dùng nên beta bị unload khi load gamma
+        manager.get_agent('alpha')
+        manager.get_agent('gamma')
+        assert manager.loaded_tenants == ['alpha', 'gamma'] and manager.evictions == 1
+        assert manager.get_agent('beta') is not beta and manager.loads == 4
+        
+        # Budget nhỏ hơn một tenant: chỉ giữ tenant vừa dùng
+        small = CatalogManager(paths, memory_budget_mb=manager.memory_usage() / (1024 * 1024) / 3)
+        for tenant in paths:
+            small.get_agent(tenant)
+            assert small.loaded_tenants == [tenant]
+        
+        # Reload/apply_changes trả lại pool các records bị thay thế và cập nhật bộ nhớ index
+        agent = manager.get_agent('alpha')
+        loaded_bytes, loaded_records = manager.pool.total_bytes, len(manager.pool)
+        index_bytes = manager.stats()['index_memory_mb']['alpha']
+        for round_number in range(5):
+            with open(paths['alpha'], 'r', encoding='utf-8') as f:
+                features = json.load(f)
+            features[2]['description'] += f" (round {round_number})"
+            with open(paths['alpha'], 'w', encoding='utf-8') as f:
+                json.dump(features, f)
+            # Reload cũng đưa feature sửa bằng update_feature ở vòng trước về nội dung file
+            assert agent.knowledge_base.reload()['updated'] == (1 if round_number == 0 else 2)
+            agent.knowledge_base.update_feature(own_id, {'subcategory': f'Round {round_number}'})
+            # Chỉ thêm bản mới của features[2] (bản cũ vẫn được tenant khác giữ)
+            assert len(manager.pool) == loaded_records + 1
+        drift = manager.pool.total_bytes - loaded_bytes
+        print(f"Pool drift after 5 reloads: {drift} bytes")
+        assert 0 < drift < 2 * estimate_size(alpha.knowledge_base.records_by_id[shared_id])
+        agent.knowledge_base.apply_changes(add=[dict(base_features[1], feature_id=f'extra_{i}') for i in range(20)])
+        assert manager.stats()['index_memory_mb']['alpha'] > index_bytes
+        
+        # Tenant vừa load không bị một get_agent khác evict trước khi agent được trả về
+        racing = CatalogManager(paths, max_loaded=1)
+        real_load = racing._load
+        def load_then_race(tenant):
+            agent = real_load(tenant)
+            if tenant.name == 'alpha':
+                racing.get_agent('beta')
+            return agent
+        racing._load = load_then_race
+        agent = racing.get_agent('alpha')
+        assert agent is not None and racing.loaded_tenants == ['alpha']
+        assert agent.process_input(load_test_cases()[0])['suggested_solutions']
+        
+        for tenant in list(paths):
+            manager.unregister_tenant(tenant)
+        assert len(manager.pool) == 0 and manager.memory_usage() == 0
+        try:
+            manager.get_agent('alpha')
+            assert False, "Expected KeyError"
+        except KeyError:
+            pass
+    finally:
+        for path in paths.values():
+            os.remove(path)
+
+def test_score_matrix():
+    """Test ma trận điểm đầy đủ: khớp calculate_relevance_score, npy/csv, chạy tiếp sau khi bị ngắt"""
+    print("\n" + "="*60)
+    print("SCORE MATRIX")
+    print("="*60)
+    
+    import shutil
+    import score_matrix
+    
+    agent = PainPointToSolutionAgent(scoring_mode='bm25')
+    records = agent.knowledge_base.snapshot.records
+    # Input lỗi (kể cả sai kiểu, lỗi chỉ lộ ra khi compile query) nằm xen giữa các input hợp lệ
+    cases = load_test_cases()
+    inputs = [cases[0], {'pain_point': 123}, cases[1], cases[2],
+              {'pain_point': 'slow support', 'business_context': {'industry': 5}}, {'pain_point': ''}, 'not an object']
+    invalid = [1, 4, 5, 6]
+    valid = [row for row in range(len(inputs)) if row not in invalid]
+    output_dir = tempfile.mkdtemp()
+    try:
+        npy_dir, csv_dir = os.path.join(output_dir, 'npy'), os.path.join(output_dir, 'csv')
+        result = score_matrix.compute_score_matrix(agent, inputs, npy_dir, chunk_size=2, dtype='float64')
+        print(f"Score matrix stats: {result['stats']}")
+        assert result['stats']['chunks'] == (len(inputs) + 1) // 2 and result['stats']['errors'] == len(invalid)
+        matrix = score_matrix.load_score_matrix(npy_dir)
+        assert matrix.shape == (len(inputs), len(records))
+        for row in valid:
+            case = inputs[row]
+            for column, record in enumerate(records):
+                assert matrix[row, column] == agent.matcher.calculate_relevance_score(
+                    case['pain_point'], case.get('business_context', {}), dict(record.data))
+        assert all(value != value for value in matrix[invalid].ravel())
+        
+        # Chunk bị mất (bị ngắt trước khi ghi xong) được tính lại, các chunk khác được bỏ qua
+        os.remove(os.path.join(npy_dir, 'chunk-000001.json'))
+        result = score_matrix.compute_score_matrix(agent, inputs, npy_dir, chunk_size=2, dtype='float64')
+        assert result['stats']['computed_chunks'] == 1
+        assert (score_matrix.load_score_matrix(npy_dir)[valid] == matrix[valid]).all()
+        for options in ({'chunk_size': 3}, {'chunk_size': 2, 'fmt': 'csv'}):
+            try:
+                score_matrix.compute_score_matrix(agent, inputs, npy_dir, dtype='float64', **options)
+                assert False, "Expected ValueError"
+            except ValueError:
+                pass
+        
+        # CSV không cần numpy và cho cùng giá trị
+        numpy_module, score_matrix.np = score_matrix.np, None
+        try:
+            score_matrix.compute_score_matrix(agent, inputs, csv_dir, chunk_size=3, fmt='csv', dtype='float64')
+            rows = [row for _, chunk in score_matrix.iter_score_chunks(csv_dir) for row in chunk]
+        finally:
+            score_matrix.np = numpy_module
+        assert [rows[row] for row in invalid] == [None] * len(invalid)
+        assert [list(matrix[row]) for row in valid] == [rows[row] for row in valid]
+    finally:
+        shutil.rmtree(output_dir)
+
+def test_regression_harness():
+    """Test harness chất lượng/latency: metrics, map tên feature, so sánh với baseline đã lưu"""
+    print("\n" + "="*60)
+    print("REGRESSION HARNESS")
+    print("="*60)
+    
+    import copy
+    import regression
+    
+    assert regression.ndcg_at_k(['a', 'b'], ['a', 'b', 'c'], 3) == 1.0
+    assert regression.ndcg_at_k(['a', 'b'], ['b', 'a'], 3) < 1.0
+    assert regression.ndcg_at_k(['a'], ['c', 'd'], 3) == 0.0
+    assert regression.recall_at_k(['a', 'b'], ['c', 'b', 'd', 'a'], 3) == 0.5
+    assert regression.resolve_feature_names(['AI-Powered Topic & Sentiment Analysis for VoC', 'Unknown'],
+                                            ['AI-Powered Topic & Sentiment Analysis', 'Automated Post-Purchase Surveys']) == \
+        (['AI-Powered Topic & Sentiment Analysis'], ['Unknown'])
+    
+    cases = regression.load_labelled_set('examples/input_examples.json', 'examples/output_examples.json')
+    report = regression.evaluate(PainPointToSolutionAgent(), cases, repeat=1)
+    print(f"Quality: {report['quality']}, latency: {report['latency_ms']}")
+    assert report['dataset']['labelled_queries'] == len(cases) and not report['unresolved_feature_names']
+    assert all(0.0 <= value <= 1.0 for value in report['quality'].values())
+    assert all(query['latency_ms'] > 0 for query in report['queries'])
+    
+    # Chất lượng của matcher mặc định không được thấp hơn baseline đã lưu (latency phụ thuộc máy nên bỏ qua)
+    with open('examples/regression_baseline.json', 'r', encoding='utf-8') as f:
+        stored = json.load(f)
+    comparison = regression.compare_to_baseline(stored, report)
+    assert not [row for row in comparison['regressions'] if row['metric'].startswith('quality.')], comparison
+    
+    assert regression.compare_to_baseline(report, report)['regressions'] == []
+    better = copy.deepcopy(report)
+    better['quality']['ndcg_at_k'] += 0.1
+    better['latency_ms']['p95'] = report['latency_ms']['p95'] / 4 - 1
+    better['queries'][0]['returned'] = list(reversed(better['queries'][0]['returned']))
+    comparison = regression.compare_to_baseline(better, report)
+    assert sorted(row['metric'] for row in comparison['regressions']) == ['latency_ms.p95', 'quality.ndcg_at_k']
+    assert [change['index'] for change in comparison['changed_rankings']] == [0]
+    
+    handle, baseline_path = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    try:
+        arguments = ['--baseline', baseline_path, '--repeat', '1', '--scoring-mode', 'bm25']
+        assert regression.main(arguments + ['--update-baseline']) == 0
+        assert regression.main(arguments + ['--max-latency-increase', '100']) == 0
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        baseline['quality']['recall_at_k'] = 1.5
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f)
+        assert regression.main(arguments + ['--max-latency-increase', '100']) == 1
+        
+        baseline['dataset']['digest'] = 'other'
+        try:
+            regression.compare_to_baseline(baseline, report)
+            assert False, "Expected ValueError"
+        except ValueError:
+            pass
+    finally:
+        os.remove(baseline_path)
+
 def main():
     """Main test function"""
     print("Pain Point to Solution Agent - Test Suite")
@@ -147,6 +1285,50 @@ def main():
         # Test feature statistics
         test_feature_statistics()
         
+        # Test feature records
+        test_feature_records()
+        
+        # Test BM25 scoring mode
+        test_bm25_scoring_mode()
+        
+        # Test vectorized scorer
+        test_vectorized_scorer()
+        
+        # Test similarity cache
+        test_similarity_backends()
+        test_context_score_tables()
+        test_similarity_cache()
+        
+        # Test top-k pruning
+        test_top_k_pruning()
+        
+        # Test parallel batch
+        test_process_batch()
+        
+        # Test JSON service
+        test_json_service()
+        
+        # Test streaming JSON Lines
+        test_streaming_json_lines()
+        
+        # Test result cache
+        test_result_cache()
+        
+        # Test hot reload
+        test_hot_reload()
+        test_catalog_loader()
+        test_compiled_catalog()
+        test_benchmark_suite()
+        test_stage_profiling()
+        test_search_features_index()
+        test_incremental_statistics()
+        test_catalog_mutations()
+        test_tfidf_semantic_mode()
+        test_lsh_candidates()
+        test_catalog_manager()
+        test_score_matrix()
+        test_regression_harness()
+        
         print("\n" + "="*60)
         print("ALL TESTS COMPLETED SUCCESSFULLY!")
         print("="*60)